@@ -5,15 +5,81 @@ scanner.py - Project Snapshot Tool for LLM Context
 Captures a complete snapshot of a directory structure and file contents,
 optimized for feeding into Large Language Models.
 
-Usage: python scanner.py [directory]
+Usage: python scanner.py [directory] [--jobs N] [--processes] [--no-cache] [--git]
+                         [--ignore PATTERN] [--ignore-file FILE] [--max-tokens N]
+                         [--no-dedup] [--entry FILE] [--excerpt] [--excerpt-grep REGEX]
+                         [--minify] [--shard-tokens N] [--format markdown|pack]
+                         [--compress none|gzip|zstd]
+                         [--since MANIFEST [--diff]] [--manifest FILE]
+                         [--watch] [--serve | --daemon] [--socket PATH]
+                         [--profile] [--stats-json FILE|-] [-o FILE|-]
        If no directory specified, uses current working directory.
 """
 
 import os
+import re
+import ast
 import sys
+import mmap
+import stat
+import time
+import codecs
+import ctypes
+import ctypes.util
+import select
+import string
+import struct
+import sqlite3
+import socket
+import socketserver
+import heapq
+import difflib
+import hashlib
+import posixpath
+import warnings
+import gzip
+import json
+import argparse
+import itertools
 import subprocess
+import tempfile
+from collections import Counter, OrderedDict, defaultdict, deque
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import (
+    Executor,
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
 from pathlib import Path
-from typing import Set, List, Tuple, Optional
+from threading import Lock, local
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Set,
+    List,
+    Tuple,
+    Optional,
+)
+
+try:
+    import tiktoken  # optional: exact BPE token counts for --max-tokens
+except ImportError:
+    tiktoken = None
+
+try:
+    import xxhash  # optional: faster content hashing for deduplication
+except ImportError:
+    xxhash = None
+
+try:
+    import zstandard  # optional: zstd-compressed blocks for --format pack
+except ImportError:
+    zstandard = None
 
 # ╔══════════════════════════════════════════════════════════════════════════════╗
 # ║                              CONFIGURATION                                    ║
@@ -95,6 +161,7 @@ IGNORE_FILES: Set[str] = {
     "Desktop.ini",
     ".directory",
     ".gitignore",
+    ".scannerignore",
     ".gitattributes",
     ".gitmodules",
     ".gitkeep",
@@ -215,6 +282,20 @@ ALWAYS_INCLUDE: Set[str] = {
     ".env.test",
 }
 
+# ─────────────────────────────────────────────────────────────────────────────────
+# EXTRA IGNORE PATTERNS (gitignore syntax, matched against paths relative to root)
+# ─────────────────────────────────────────────────────────────────────────────────
+# Applied after the sets above, so they can also re-include with "!pattern".
+# A .scannerignore file in the scanned root and --ignore/--ignore-file add more.
+IGNORE_PATTERNS: List[str] = [
+    # "generated/",
+    # "/public/assets/**/*.json",
+    # "!dist/",
+]
+
+# Per-project ignore file read from the scanned root (gitignore syntax)
+IGNORE_FILE_NAME: str = ".scannerignore"
+
 # ─────────────────────────────────────────────────────────────────────────────────
 # BINARY EXTENSIONS (appear in tree with [binary] marker, content NOT captured)
 # ─────────────────────────────────────────────────────────────────────────────────
@@ -354,6 +435,123 @@ BINARY_EXTENSIONS: Set[str] = {
     ".glb",
 }
 
+# ─────────────────────────────────────────────────────────────────────────────────
+# LANGUAGE HINTS (code block language of each included file)
+# ─────────────────────────────────────────────────────────────────────────────────
+
+# By extension (lowercased)
+EXT_TO_LANG: Dict[str, str] = {
+    # Python
+    ".py": "python", ".pyw": "python", ".pyx": "python", ".pxd": "python",
+    ".pyi": "python",
+    # JavaScript / TypeScript
+    ".js": "javascript", ".mjs": "javascript", ".cjs": "javascript",
+    ".ts": "typescript", ".mts": "typescript", ".cts": "typescript",
+    ".jsx": "jsx", ".tsx": "tsx",
+    # Web
+    ".html": "html", ".htm": "html", ".xhtml": "html",
+    ".css": "css", ".scss": "scss", ".sass": "sass", ".less": "less",
+    ".vue": "vue", ".svelte": "svelte", ".astro": "astro",
+    # Data
+    ".json": "json", ".jsonc": "jsonc", ".json5": "json5",
+    ".xml": "xml", ".xsl": "xml", ".xslt": "xml",
+    ".yaml": "yaml", ".yml": "yaml",
+    ".toml": "toml",
+    ".csv": "csv",
+    ".ini": "ini", ".cfg": "ini", ".conf": "ini",
+    # Shell
+    ".sh": "bash", ".bash": "bash", ".zsh": "zsh", ".fish": "fish",
+    ".ps1": "powershell", ".psm1": "powershell", ".psd1": "powershell",
+    ".bat": "batch", ".cmd": "batch",
+    # Documentation
+    ".md": "markdown", ".markdown": "markdown", ".mdx": "mdx",
+    ".rst": "rst", ".txt": "text",
+    # Systems
+    ".c": "c", ".h": "c",
+    ".cpp": "cpp", ".cc": "cpp", ".cxx": "cpp",
+    ".hpp": "cpp", ".hxx": "cpp", ".hh": "cpp",
+    ".cs": "csharp",
+    ".go": "go",
+    ".rs": "rust",
+    ".java": "java",
+    ".kt": "kotlin", ".kts": "kotlin",
+    ".scala": "scala", ".sc": "scala",
+    ".swift": "swift",
+    ".m": "objectivec", ".mm": "objectivec",
+    # Scripting
+    ".rb": "ruby", ".rake": "ruby", ".gemspec": "ruby",
+    ".php": "php",
+    ".pl": "perl", ".pm": "perl",
+    ".lua": "lua",
+    ".r": "r", ".R": "r",
+    # Functional
+    ".ex": "elixir", ".exs": "elixir",
+    ".erl": "erlang", ".hrl": "erlang",
+    ".clj": "clojure", ".cljs": "clojure", ".cljc": "clojure", ".edn": "clojure",
+    ".hs": "haskell", ".lhs": "haskell",
+    ".ml": "ocaml", ".mli": "ocaml",
+    ".fs": "fsharp", ".fsx": "fsharp", ".fsi": "fsharp",
+    ".elm": "elm",
+    ".nim": "nim",
+    ".zig": "zig",
+    # Query
+    ".sql": "sql", ".mysql": "sql", ".pgsql": "sql",
+    ".graphql": "graphql", ".gql": "graphql",
+    # Config / DevOps
+    ".dockerfile": "dockerfile",
+    ".tf": "terraform", ".tfvars": "terraform",
+    ".hcl": "hcl",
+    ".nix": "nix",
+    ".dhall": "dhall",
+    # Other
+    ".proto": "protobuf",
+    ".prisma": "prisma",
+    ".vim": "vim", ".vimrc": "vim",
+    ".tex": "latex", ".latex": "latex",
+    ".env": "bash",
+    ".gitignore": "gitignore",
+    ".editorconfig": "editorconfig",
+    ".htaccess": "apacheconf",
+}
+
+# By exact file name (takes precedence over the extension)
+NAME_TO_LANG: Dict[str, str] = {
+    "Dockerfile": "dockerfile",
+    "Containerfile": "dockerfile",
+    "Makefile": "makefile",
+    "GNUmakefile": "makefile",
+    "makefile": "makefile",
+    "Justfile": "just",
+    "justfile": "just",
+    "Jenkinsfile": "groovy",
+    "Vagrantfile": "ruby",
+    "Gemfile": "ruby",
+    "Rakefile": "ruby",
+    "Guardfile": "ruby",
+    "Podfile": "ruby",
+    "Brewfile": "ruby",
+    "CMakeLists.txt": "cmake",
+    "meson.build": "meson",
+    "BUILD": "python",
+    "BUILD.bazel": "python",
+    "WORKSPACE": "python",
+    "requirements.txt": "text",
+    "constraints.txt": "text",
+    "pyproject.toml": "toml",
+    "setup.py": "python",
+    "setup.cfg": "ini",
+    "Cargo.toml": "toml",
+    "go.mod": "go",
+    "go.sum": "text",
+    "package.json": "json",
+    "tsconfig.json": "jsonc",
+    "jsconfig.json": "jsonc",
+    "deno.json": "jsonc",
+    "composer.json": "json",
+    ".babelrc": "json",
+    ".swcrc": "json",
+}
+
 # ─────────────────────────────────────────────────────────────────────────────────
 # SIZE LIMITS
 # ─────────────────────────────────────────────────────────────────────────────────
@@ -365,63 +563,970 @@ MAX_FILE_SIZE: int = 102400
 # Files smaller than this are considered empty
 MIN_FILE_SIZE: int = 1
 
+# ─────────────────────────────────────────────────────────────────────────────────
+# EXCERPTS OF LARGE FILES (--excerpt)
+# ─────────────────────────────────────────────────────────────────────────────────
+
+# Instead of dropping text files over MAX_FILE_SIZE, show their first and last lines
+EXCERPT_HEAD_LINES: int = 80
+EXCERPT_TAIL_LINES: int = 40
+
+# ...and up to this many lines in between matching --excerpt-grep patterns
+EXCERPT_MAX_MATCHES: int = 40
+
+# Longer lines (minified bundles, generated data) are cut off
+EXCERPT_LINE_BYTES: int = 400
+
+# ─────────────────────────────────────────────────────────────────────────────────
+# BINARY SNIFFING (for files whose extension is not in BINARY_EXTENSIONS)
+# ─────────────────────────────────────────────────────────────────────────────────
+
+# Bytes inspected at the start of each candidate file (0 = trust extensions only)
+SNIFF_BYTES: int = 8192
+
+# Share of undecodable bytes / control characters above which a file is binary
+SNIFF_BINARY_RATIO: float = 0.3
+
+# Signatures of common binary formats (checked before the statistical test)
+BINARY_MAGIC: Tuple[bytes, ...] = (
+    b"\x89PNG\r\n\x1a\n",   # PNG
+    b"\xff\xd8\xff",          # JPEG
+    b"GIF87a", b"GIF89a",      # GIF
+    b"%PDF-",                  # PDF
+    b"PK\x03\x04",             # ZIP, JAR, DOCX, ...
+    b"\x1f\x8b",               # gzip
+    b"BZh91AY&SY",             # bzip2
+    b"\xfd7zXZ\x00",           # xz
+    b"\x28\xb5\x2f\xfd",       # zstd
+    b"7z\xbc\xaf\x27\x1c",     # 7-Zip
+    b"Rar!\x1a\x07",           # RAR
+    b"\x7fELF",                # ELF executables
+    b"\xcf\xfa\xed\xfe",       # Mach-O (64-bit)
+    b"\xca\xfe\xba\xbe",       # Mach-O universal / Java class
+    b"\x00asm",                # WebAssembly
+    b"SQLite format 3\x00",    # SQLite
+    b"OggS",                   # Ogg
+    b"RIFF",                   # WAV, AVI, WebP
+    b"\x1aE\xdf\xa3",           # Matroska / WebM
+    b"fLaC",                   # FLAC
+    b"wOFF", b"wOF2",          # Web fonts
+)
+
+# ─────────────────────────────────────────────────────────────────────────────────
+# DECODING
+# ─────────────────────────────────────────────────────────────────────────────────
+
+# Files are read once as bytes; files at least this big are memory-mapped instead
+MMAP_THRESHOLD: int = 65536
+
+# Tried in order on the same buffer when it is not valid UTF-8 (latin-1 never fails)
+FALLBACK_ENCODINGS: List[str] = ["cp1252", "latin-1"]
+
+# ─────────────────────────────────────────────────────────────────────────────────
+# TOKEN BUDGET (--max-tokens)
+# ─────────────────────────────────────────────────────────────────────────────────
+
+# BPE encoding used when tiktoken is installed (otherwise tokens ~ chars / 4)
+TOKENIZER_ENCODING: str = "cl100k_base"
+
+# Where tiktoken fetches an encoding's vocabulary from; it caches the file under the URL's hash
+TOKENIZER_VOCAB_URL: str = "https://openaipublic.blob.core.windows.net/encodings/{name}.tiktoken"
+
+# Let tiktoken download a vocabulary it has not cached yet (blocks, or fails slowly, offline);
+# when False, counts stay estimates until the vocabulary is in tiktoken's cache
+TOKENIZER_DOWNLOAD: bool = False
+
+# Size of the head kept when a file is truncated to fit the budget
+TRUNCATE_TOKENS: int = 512
+
+# Worth of a truncated file relative to including it in full
+TRUNCATED_VALUE: float = 0.4
+
+# Weights of the priority components (each scored 0..1), overridable with --priority
+PRIORITY_WEIGHTS: Dict[str, float] = {
+    "depth": 1.0,    # shallower files first
+    "recency": 1.0,  # recently modified files first
+    "type": 1.0,     # per-language weight from TYPE_PRIORITY
+}
+
+# Per-language weight for the "type" component (by get_lang_hint; others get 0.5)
+TYPE_PRIORITY: Dict[str, float] = {
+    "python": 1.0,
+    "typescript": 1.0,
+    "tsx": 1.0,
+    "javascript": 0.9,
+    "jsx": 0.9,
+    "go": 1.0,
+    "rust": 1.0,
+    "java": 1.0,
+    "c": 1.0,
+    "cpp": 1.0,
+    "csharp": 1.0,
+    "html": 0.6,
+    "css": 0.5,
+    "scss": 0.5,
+    "toml": 0.6,
+    "yaml": 0.5,
+    "json": 0.3,
+    "jsonc": 0.4,
+    "csv": 0.1,
+    "text": 0.2,
+}
+
+# ─────────────────────────────────────────────────────────────────────────────────
+# MINIFICATION (--minify)
+# ─────────────────────────────────────────────────────────────────────────────────
+
+# Comment syntax per language hint (see get_lang_hint); languages not listed here
+# only get their whitespace collapsed
+MINIFY_STYLES: Dict[str, str] = {
+    **dict.fromkeys(["javascript", "typescript", "jsx", "tsx", "json5", "jsonc"], "script"),
+    **dict.fromkeys(
+        ["c", "cpp", "csharp", "go", "rust", "java", "kotlin", "scala", "swift",
+         "objectivec", "php", "scss", "less", "zig"],
+        "c",
+    ),
+    "css": "css",
+    "python": "python",
+    **dict.fromkeys(
+        ["bash", "zsh", "fish", "ruby", "perl", "r", "yaml", "toml",
+         "ini", "dockerfile", "makefile", "elixir", "nim", "powershell"],
+        "hash",
+    ),
+    **dict.fromkeys(["html", "xml", "vue", "svelte", "astro"], "markup"),
+    "sql": "sql",
+}
+
+# Unbroken base64 runs at least this long (inline images, fonts, keys) are elided
+MINIFY_LONG_LITERAL: int = 256
+
+# Bump whenever minify() changes what it outputs: bodies minified by another version are not reused
+MINIFY_VERSION: int = 2
+
+# Minified bodies are cached under the file's path plus this suffix
+MINIFIED_SUFFIX: str = f"\0minified-v{MINIFY_VERSION}"
+
+# Files listed with their before/after tokens in the report (0 = all)
+MINIFY_REPORT_FILES: int = 10
+
+# ─────────────────────────────────────────────────────────────────────────────────
+# DEDUPLICATION
+# ─────────────────────────────────────────────────────────────────────────────────
+
+# Emit byte-identical files once; later copies become a reference (--no-dedup)
+DEDUPLICATE: bool = True
+
+# ─────────────────────────────────────────────────────────────────────────────────
+# MANIFEST & DELTA SNAPSHOTS (--since)
+# ─────────────────────────────────────────────────────────────────────────────────
+
+# Written next to the snapshot (-o FILE) as FILE + suffix, unless --manifest says otherwise
+MANIFEST_SUFFIX: str = ".manifest.json"
+MANIFEST_VERSION: int = 1
+
+# Lines of context around each change when modified files are rendered as diffs (--diff)
+DIFF_CONTEXT_LINES: int = 3
+
+# ─────────────────────────────────────────────────────────────────────────────────
+# DEPENDENCY CLOSURE (--entry)
+# ─────────────────────────────────────────────────────────────────────────────────
+
+# Languages whose imports are followed from the entry points
+IMPORT_LANGS: Set[str] = {"python", "javascript", "typescript", "jsx", "tsx", "vue", "svelte", "astro"}
+
+# Tried in order after a TS/JS import path as written, then as <path>/index + each
+JS_RESOLVE_EXTENSIONS: Tuple[str, ...] = (
+    ".ts", ".tsx", ".d.ts", ".js", ".jsx", ".mjs", ".cjs", ".mts", ".cts",
+    ".json", ".vue", ".svelte", ".astro",
+)
+
+# Directories (relative to the root) that non-relative imports are resolved against;
+# Python imports are also resolved against the directory of each entry point
+IMPORT_ROOTS: Tuple[str, ...] = ("", "src")
+
+# ─────────────────────────────────────────────────────────────────────────────────
+# SHARDED OUTPUT (--shard-tokens)
+# ─────────────────────────────────────────────────────────────────────────────────
+
+# Shards of -o FILE are named after it: snapshot.md -> snapshot.part01.md, snapshot.part02.md, ...
+SHARD_NAME_FORMAT: str = "{stem}.part{number:02d}{suffix}"
+
+# ...and listed, with the paths each one holds, in snapshot.index.json
+SHARD_INDEX_SUFFIX: str = ".index.json"
+
+# ─────────────────────────────────────────────────────────────────────────────────
+# PACKED SNAPSHOTS (--format pack)
+# ─────────────────────────────────────────────────────────────────────────────────
+
+# A pack file starts and ends with these bytes
+PACK_MAGIC: bytes = b"SNAPPACK"
+
+# Bumped whenever the layout of a pack changes
+PACK_VERSION: int = 1
+
+# Compression of each block unless --compress says otherwise: "none", "gzip" or
+# "zstd" (the latter needs the zstandard package)
+PACK_COMPRESSION: str = "gzip"
+
+# ─────────────────────────────────────────────────────────────────────────────────
+# DAEMON (--serve, --daemon)
+# ─────────────────────────────────────────────────────────────────────────────────
+
+# Socket the daemon listens on ("" = scanner.sock in $XDG_RUNTIME_DIR, else in the cache directory)
+DAEMON_SOCKET: str = ""
+
+# Warm scanners kept at once (one per root and set of scan options), least recently used evicted first
+DAEMON_MAX_SCANNERS: int = 8
+
+# Longest request line a client may send
+DAEMON_MAX_REQUEST_BYTES: int = 1 << 16
+
+# Rendered snapshots each warm scanner keeps (one per budget asked for), least recently used evicted
+DAEMON_MAX_RENDERED: int = 4
+
+# ─────────────────────────────────────────────────────────────────────────────────
+# PROFILING (--profile, --stats-json)
+# ─────────────────────────────────────────────────────────────────────────────────
+
+# Heaviest files and directories (by tokens) listed in the profile
+PROFILE_TOP_N: int = 10
+
+# ─────────────────────────────────────────────────────────────────────────────────
+# PARALLELISM
+# ─────────────────────────────────────────────────────────────────────────────────
+
+# Default number of worker threads (1 = serial scan, overridable with --jobs)
+DEFAULT_JOBS: int = 1
+
+# ─────────────────────────────────────────────────────────────────────────────────
+# WATCH MODE (--watch)
+# ─────────────────────────────────────────────────────────────────────────────────
+
+# Quiet period that ends a burst of filesystem events before regenerating
+WATCH_DEBOUNCE_SECONDS: float = 0.2
+
+# Interval between stat sweeps when inotify is unavailable
+WATCH_POLL_SECONDS: float = 1.0
+
+# ─────────────────────────────────────────────────────────────────────────────────
+# SNAPSHOT CACHE
+# ─────────────────────────────────────────────────────────────────────────────────
+
+# Where decoded file contents are kept between runs (one database per scanned root).
+# Empty string = $XDG_CACHE_HOME/scanner (or ~/.cache/scanner); disable with --no-cache
+CACHE_DIR: str = ""
+
+# Upper bound on cached content; least recently used entries are evicted past it
+CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+
+# Per-file facts (binary verdicts, token counts, imports) unused for this long are dropped
+CACHE_FACT_MAX_AGE_DAYS: int = 30
+
+# Content each cache also keeps in memory for --watch and the daemon (least recently used go first)
+CACHE_MEMORY_MAX_BYTES: int = 64 * 1024 * 1024
+
 # ╔══════════════════════════════════════════════════════════════════════════════╗
 # ║                           END OF CONFIGURATION                                ║
 # ╚══════════════════════════════════════════════════════════════════════════════╝
 
 
+class FileEntry(NamedTuple):
+    """A file kept by the walker, with the stat result fetched while listing it."""
+    path: Path
+    stat: Optional[os.stat_result]
+    should_include: bool
+    status: str
+
+
+class LoadedFile(NamedTuple):
+    """Decoded content of an included file, ready to render."""
+    content: str
+    lang: str
+    encoding: str  # "" when the file could not be read
+
+
+class SnapshotEntry(NamedTuple):
+    """One file of a snapshot as every output format sees it."""
+    rel_path: str
+    kind: str  # "file", "truncated", "excerpt", "diff" or "duplicate"
+    lang: str
+    encoding: str
+    content: str  # the body as emitted; for a duplicate, the rel_path it repeats
+
+
+# Result of listing one directory: (subdirectories, files)
+DirListing = Tuple[List[Path], List[FileEntry]]
+
+
+class SyscallCounter:
+    """Thread-safe tally of the filesystem calls issued by the walker."""
+    
+    def __init__(self):
+        self._lock = Lock()
+        self.counts: Dict[str, int] = {"scandir": 0, "stat": 0, "probe": 0}
+    
+    def add(self, kind: str, n: int = 1) -> None:
+        with self._lock:
+            self.counts[kind] = self.counts.get(kind, 0) + n
+    
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+
+class SnapshotCache:
+    """
+    On-disk cache of decoded file contents, keyed by (inode, size, mtime_ns).
+    
+    Lookups are answered from an in-memory index loaded at open time, so a warm
+    run on an unchanged tree never reads a source file. Entries carry the time
+    of the run that last used them and the oldest are evicted once the stored
+    content exceeds max_bytes.
+    
+    Small per-file facts (e.g. the binary sniff verdict) live in a second table
+    under the same key; they are held in memory, safe to query and record from
+    worker threads, written back on close and dropped once unused for
+    CACHE_FACT_MAX_AGE_DAYS. Contents may also be loaded and stored from
+    several threads (e.g. shards rendered in parallel, or warm scanners of the
+    daemon sharing one cache); database access, the pending facts and flushing
+    are serialized.
+    """
+    
+    SCHEMA_VERSION = 3
+    
+    def __init__(self, db_path: Path, max_bytes: int = CACHE_MAX_BYTES):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self._now = time.time_ns()
+        self._used: List[str] = []
+        self._facts_used: Set[Tuple[str, str]] = set()
+        self._facts_new: Dict[Tuple[str, str], Tuple[Tuple[int, int, int], str]] = {}
+        # rel_path -> (signature, content) of the entries loaded or stored most recently, once
+        # kept in memory (up to CACHE_MEMORY_MAX_BYTES of content)
+        self._memory: Optional["OrderedDict[str, Tuple[Tuple[int, int, int], LoadedFile]]"] = None
+        self._memory_bytes = 0
+        self._lock = Lock()
+        
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(db_path), timeout=30, check_same_thread=False)
+        if self._db.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+            self._db.execute("DROP TABLE IF EXISTS files")
+            self._db.execute("DROP TABLE IF EXISTS facts")
+            self._db.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                rel_path  TEXT PRIMARY KEY,
+                inode     INTEGER NOT NULL,
+                size      INTEGER NOT NULL,
+                mtime_ns  INTEGER NOT NULL,
+                lang      TEXT NOT NULL,
+                encoding  TEXT NOT NULL,
+                content   TEXT NOT NULL,
+                nbytes    INTEGER NOT NULL,
+                last_used INTEGER NOT NULL
+            )
+            """
+        )
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS facts (
+                kind      TEXT NOT NULL,
+                rel_path  TEXT NOT NULL,
+                inode     INTEGER NOT NULL,
+                size      INTEGER NOT NULL,
+                mtime_ns  INTEGER NOT NULL,
+                value     TEXT NOT NULL,
+                last_used INTEGER NOT NULL,
+                PRIMARY KEY (kind, rel_path)
+            )
+            """
+        )
+        self._index: Dict[str, Tuple[int, int, int]] = {
+            rel_path: (inode, size, mtime_ns)
+            for rel_path, inode, size, mtime_ns in self._db.execute(
+                "SELECT rel_path, inode, size, mtime_ns FROM files"
+            )
+        }
+        self._facts: Dict[Tuple[str, str], Tuple[Tuple[int, int, int], str]] = {
+            (kind, rel_path): ((inode, size, mtime_ns), value)
+            for kind, rel_path, inode, size, mtime_ns, value in self._db.execute(
+                "SELECT kind, rel_path, inode, size, mtime_ns, value FROM facts"
+            )
+        }
+    
+    @classmethod
+    def for_root(cls, root: Path, cache_dir: Optional[Path] = None) -> "SnapshotCache":
+        """Open the cache database belonging to a scanned root."""
+        if cache_dir is None:
+            cache_dir = default_cache_dir()
+        digest = hashlib.sha1(str(root).encode("utf-8")).hexdigest()[:16]
+        return cls(cache_dir / f"{root.name}-{digest}.sqlite3")
+    
+    @staticmethod
+    def signature(st: os.stat_result) -> Tuple[int, int, int]:
+        return st.st_ino, st.st_size, st.st_mtime_ns
+    
+    def is_fresh(self, rel_path: str, st: Optional[os.stat_result]) -> bool:
+        """Check, without touching the database, whether a file is cached unchanged."""
+        return st is not None and self._index.get(rel_path) == self.signature(st)
+    
+    def load_version(self, rel_path: str, size: int, mtime_ns: int) -> Optional[LoadedFile]:
+        """Fetch the cached content of a file if it is still the given version."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT content, lang, encoding FROM files"
+                " WHERE rel_path = ? AND size = ? AND mtime_ns = ?",
+                (rel_path, size, mtime_ns),
+            ).fetchone()
+        return LoadedFile(*row) if row is not None else None
+    
+    def keep_in_memory(self) -> None:
+        """
+        Also keep the entries loaded or stored in memory, so that rendering
+        again (--watch, the daemon) serves unchanged files without a query.
+        The least recently used go once they exceed CACHE_MEMORY_MAX_BYTES.
+        """
+        with self._lock:
+            if self._memory is None:
+                self._memory = OrderedDict()
+    
+    def _remember(self, rel_path: str, signature: Tuple[int, int, int], loaded: LoadedFile) -> None:
+        """Keep an entry in memory, evicting the least recently used past the bound (locked)."""
+        memory = self._memory
+        self._forget(rel_path)
+        memory[rel_path] = (signature, loaded)
+        self._memory_bytes += len(loaded.content)
+        while self._memory_bytes > CACHE_MEMORY_MAX_BYTES and memory:
+            self._memory_bytes -= len(memory.popitem(last=False)[1][1].content)
+    
+    def _forget(self, rel_path: str) -> None:
+        """Drop an entry from memory (locked)."""
+        kept = self._memory.pop(rel_path, None)
+        if kept is not None:
+            self._memory_bytes -= len(kept[1].content)
+    
+    def load(self, rel_path: str) -> Optional[LoadedFile]:
+        """Fetch the cached content of a file found fresh by is_fresh."""
+        with self._lock:
+            memory = self._memory
+            if memory is not None:
+                kept = memory.get(rel_path)
+                if kept is not None and kept[0] == self._index.get(rel_path):
+                    memory.move_to_end(rel_path)
+                    self.hits += 1
+                    self._used.append(rel_path)
+                    return kept[1]
+            row = self._db.execute(
+                "SELECT content, lang, encoding FROM files WHERE rel_path = ?", (rel_path,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.hits += 1
+            self._used.append(rel_path)
+            loaded = LoadedFile(*row)
+            if memory is not None:
+                self._remember(rel_path, self._index.get(rel_path), loaded)
+        return loaded
+    
+    def put(self, rel_path: str, st: Optional[os.stat_result], loaded: LoadedFile) -> None:
+        """Store a freshly read file."""
+        if st is None:
+            return
+        signature = self.signature(st)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    rel_path,
+                    *signature,
+                    loaded.lang,
+                    loaded.encoding,
+                    loaded.content,
+                    len(loaded.content),
+                    self._now,
+                ),
+            )
+            self._index[rel_path] = signature
+            if self._memory is not None:
+                self._remember(rel_path, signature, loaded)
+    
+    def get_fact(self, kind: str, rel_path: str, st: Optional[os.stat_result]) -> Optional[str]:
+        """Return a recorded fact about a file, if the file is unchanged since."""
+        if st is None:
+            return None
+        with self._lock:
+            fact = self._facts.get((kind, rel_path))
+            if fact is None or fact[0] != self.signature(st):
+                return None
+            self._facts_used.add((kind, rel_path))
+        return fact[1]
+    
+    def put_fact(self, kind: str, rel_path: str, st: Optional[os.stat_result], value: str) -> None:
+        """Record a fact about a file, valid until its stat signature changes."""
+        if st is None:
+            return
+        fact = (self.signature(st), value)
+        with self._lock:
+            self._facts[(kind, rel_path)] = fact
+            self._facts_new[(kind, rel_path)] = fact
+    
+    @classmethod
+    def in_memory(cls) -> "SnapshotCache":
+        """A cache that lives only as long as the process (e.g. --watch with --no-cache)."""
+        return cls(Path(":memory:"))
+    
+    def close(self) -> None:
+        """Record this run's hits, evict past the size bound and commit."""
+        self.flush()
+        self._db.close()
+    
+    def flush(self) -> None:
+        """Record the hits so far, evict past the size bound and commit; stays open."""
+        with self._lock:
+            self._db.executemany(
+                "UPDATE files SET last_used = ? WHERE rel_path = ?",
+                ((self._now, rel_path) for rel_path in self._used),
+            )
+            self._db.executemany(
+                "UPDATE facts SET last_used = ? WHERE kind = ? AND rel_path = ?",
+                ((self._now, kind, rel_path) for kind, rel_path in self._facts_used),
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO facts VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (kind, rel_path, *signature, value, self._now)
+                    for (kind, rel_path), (signature, value) in self._facts_new.items()
+                ),
+            )
+            total = self._db.execute("SELECT COALESCE(SUM(nbytes), 0) FROM files").fetchone()[0]
+            if total > self.max_bytes:
+                doomed: List[Tuple[str]] = []
+                for rel_path, nbytes in self._db.execute(
+                    "SELECT rel_path, nbytes FROM files ORDER BY last_used, rel_path"
+                ).fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    doomed.append((rel_path,))
+                    total -= nbytes
+                    self._index.pop(rel_path, None)
+                    if self._memory is not None:
+                        self._forget(rel_path)
+                self._db.executemany("DELETE FROM files WHERE rel_path = ?", doomed)
+            # Facts outlive contents (binary files have none), so they age out on their own
+            self._db.execute(
+                "DELETE FROM facts WHERE last_used < ?",
+                (self._now - CACHE_FACT_MAX_AGE_DAYS * 86400 * 10**9,),
+            )
+            self._db.commit()
+            self._used = []
+            self._facts_used = set()
+            self._facts_new = {}
+            self._now = time.time_ns()
+
+
+def default_cache_dir() -> Path:
+    """Resolve the cache directory from CACHE_DIR or the XDG convention."""
+    if CACHE_DIR:
+        return Path(CACHE_DIR).expanduser()
+    xdg = os.environ.get("XDG_CACHE_HOME")
+    base = Path(xdg) if xdg else Path.home() / ".cache"
+    return base / "scanner"
+
+
+def default_socket_path() -> Path:
+    """Resolve the daemon's socket from DAEMON_SOCKET, $XDG_RUNTIME_DIR or the cache directory."""
+    if DAEMON_SOCKET:
+        return Path(DAEMON_SOCKET).expanduser()
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    return (Path(runtime) if runtime else default_cache_dir()) / "scanner.sock"
+
+
+def translate_ignore_pattern(pattern: str) -> Optional[Tuple[str, bool, bool]]:
+    """
+    Translate one gitignore-style pattern into a regex over relative paths.
+    Returns (regex, negate, dir_only), or None for blank lines and comments.
+    
+    Supports `*`, `?`, `[...]`, `**` segments, leading `/` (or any inner `/`)
+    to anchor at the root, trailing `/` for directories only and `!` negation.
+    """
+    pattern = pattern.rstrip("\n").rstrip(" ")
+    if not pattern or pattern.startswith("#"):
+        return None
+    
+    negate = pattern.startswith("!")
+    if negate:
+        pattern = pattern[1:]
+    elif pattern.startswith("\\!") or pattern.startswith("\\#"):
+        pattern = pattern[1:]
+    
+    dir_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    if not pattern:
+        return None
+    
+    # Without an inner slash the pattern matches a name at any depth
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    
+    out: List[str] = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith("**/", i) and (i == 0 or pattern[i - 1] == "/"):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i) and i + 2 == n and (i == 0 or pattern[i - 1] == "/"):
+            out.append(".*")
+            i += 2
+        elif c == "*":
+            out.append("[^/]*")
+            i += 1
+        elif c == "?":
+            out.append("[^/]")
+            i += 1
+        elif c == "[":
+            end = pattern.find("]", i + 2)
+            if end == -1:
+                out.append(re.escape(c))
+                i += 1
+                continue
+            body = pattern[i + 1:end]
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            out.append(f"[{body}]")
+            i = end + 1
+        elif c == "\\" and i + 1 < n:
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(c))
+            i += 1
+    
+    regex = "".join(out)
+    if not anchored:
+        regex = "(?:.*/)?" + regex
+    return regex, negate, dir_only
+
+
+class IgnoreMatcher:
+    """
+    Ignore rules compiled once per scan.
+    
+    Plain names are answered by a set lookup; every glob and path pattern is
+    folded into one alternation per entry kind (files, directories), tried in
+    reverse order so the last matching pattern wins, as in .gitignore.
+    """
+    
+    def __init__(self, names: Iterable[str], patterns: Iterable[str]):
+        self.names = frozenset(names)
+        alternatives: Dict[bool, List[str]] = {False: [], True: []}
+        self._negated: Dict[bool, List[bool]] = {False: [], True: []}
+        
+        for pattern in patterns:
+            translated = translate_ignore_pattern(pattern)
+            if translated is None:
+                continue
+            regex, negate, dir_only = translated
+            for is_dir in (True,) if dir_only else (False, True):
+                alternatives[is_dir].append(f"({regex})")
+                self._negated[is_dir].append(negate)
+        
+        self._regex: Dict[bool, Optional["re.Pattern[str]"]] = {}
+        for is_dir, alts in alternatives.items():
+            alts.reverse()
+            self._negated[is_dir].reverse()
+            self._regex[is_dir] = re.compile("|".join(alts), re.DOTALL) if alts else None
+    
+    def match(self, rel_path: str, name: str, is_dir: bool) -> Optional[bool]:
+        """True if ignored, False if re-included by a negated pattern, None if no rule applies."""
+        regex = self._regex[is_dir]
+        if regex is not None:
+            m = regex.fullmatch(rel_path)
+            if m is not None:
+                return not self._negated[is_dir][m.lastindex - 1]
+        if name in self.names:
+            return True
+        return None
+
+
+def read_ignore_file(path: Path) -> List[str]:
+    """Read the lines of a gitignore-style file (missing file = no patterns)."""
+    try:
+        return path.read_text(encoding="utf-8").splitlines()
+    except OSError:
+        return []
+
+
+def build_ignore_matchers(
+    root: Path, extra_patterns: Iterable[str] = ()
+) -> Tuple[IgnoreMatcher, IgnoreMatcher]:
+    """
+    Compile the directory and file ignore rules for a scan.
+    
+    The configured sets come first (lowest precedence), then IGNORE_PATTERNS,
+    the root's IGNORE_FILE_NAME and finally the caller's extra patterns.
+    """
+    dir_names = [name for name in IGNORE_DIRS if "*" not in name and "/" not in name]
+    # Wildcard and path-style IGNORE_DIRS entries (e.g. *.egg-info, public/build)
+    dir_patterns = [f"{name}/" for name in IGNORE_DIRS if "*" in name or "/" in name]
+    user_patterns = [
+        *IGNORE_PATTERNS,
+        *read_ignore_file(root / IGNORE_FILE_NAME),
+        *extra_patterns,
+    ]
+    return (
+        IgnoreMatcher(dir_names, sorted(dir_patterns) + user_patterns),
+        IgnoreMatcher(IGNORE_FILES, user_patterns),
+    )
+
+
+def tiktoken_vocab_cached(encoding_name: str) -> bool:
+    """Whether tiktoken can load an encoding without a download (looks where tiktoken does)."""
+    cache_dir = os.environ.get("TIKTOKEN_CACHE_DIR", os.environ.get("DATA_GYM_CACHE_DIR"))
+    if cache_dir is None:
+        cache_dir = os.path.join(tempfile.gettempdir(), "data-gym-cache")
+    if not cache_dir:
+        return False  # caching turned off: every load downloads
+    url = TOKENIZER_VOCAB_URL.format(name=encoding_name)
+    return os.path.exists(os.path.join(cache_dir, hashlib.sha1(url.encode()).hexdigest()))
+
+
+class TokenCounter:
+    """
+    Token counts from tiktoken's TOKENIZER_ENCODING when it is installed and
+    its vocabulary is cached (or TOKENIZER_DOWNLOAD allows fetching it), the
+    chars / 4 estimate otherwise.
+    """
+    
+    def __init__(self, encoding_name: str = TOKENIZER_ENCODING):
+        self.name = "chars/4"
+        self._encoding = None
+        if tiktoken is not None and (TOKENIZER_DOWNLOAD or tiktoken_vocab_cached(encoding_name)):
+            try:
+                self._encoding = tiktoken.get_encoding(encoding_name)
+                self.name = encoding_name
+            except Exception:
+                pass
+    
+    @property
+    def exact(self) -> bool:
+        return self._encoding is not None
+    
+    def count(self, text: str) -> int:
+        if self._encoding is None:
+            return estimate_tokens(text)
+        return len(self._encoding.encode_ordinary(text))
+    
+    def truncate(self, text: str, limit: int) -> str:
+        """Keep roughly the first `limit` tokens of text, cut back to a line end."""
+        if self._encoding is None:
+            head = text[:limit * 4]
+        else:
+            tokens = self._encoding.encode_ordinary(text)
+            head = self._encoding.decode(tokens[:limit])
+        if len(head) >= len(text):
+            return text
+        cut = head.rfind("\n")
+        return head[:cut] if cut > 0 else head
+
+
+class BudgetItem(NamedTuple):
+    """One file's options for plan_budget (costs in tokens)."""
+    score: float
+    listed_cost: int
+    truncated_cost: Optional[int]  # None when the file is too short to truncate
+    full_cost: int
+
+
+def plan_budget(items: List[BudgetItem], budget: int) -> List[str]:
+    """
+    Choose "full", "truncated" or "omitted" for every item so the total cost
+    stays within budget while maximizing the summed value.
+    
+    A greedy multiple-choice knapsack: each file starts omitted (listed only),
+    and upgrades are applied in order of value gained per token spent. An
+    option that is a worse deal than skipping straight past it is dropped.
+    """
+    levels = ["omitted"] * len(items)
+    spent = sum(item.listed_cost for item in items)
+    
+    # (-efficiency, index, from_level, to_level, extra_cost)
+    steps: List[Tuple[float, int, str, str, int]] = []
+    for i, item in enumerate(items):
+        full_value = item.score
+        full_extra = max(1, item.full_cost - item.listed_cost)
+        if item.truncated_cost is not None:
+            trunc_value = item.score * TRUNCATED_VALUE
+            trunc_extra = max(1, item.truncated_cost - item.listed_cost)
+            rest_extra = max(1, item.full_cost - item.truncated_cost)
+            if trunc_value / trunc_extra >= (full_value - trunc_value) / rest_extra:
+                steps.append((-trunc_value / trunc_extra, i, "omitted", "truncated", trunc_extra))
+                steps.append((-(full_value - trunc_value) / rest_extra, i, "truncated", "full", rest_extra))
+                continue
+        steps.append((-full_value / full_extra, i, "omitted", "full", full_extra))
+    heapq.heapify(steps)
+    
+    while steps:
+        _, i, from_level, to_level, extra = heapq.heappop(steps)
+        if levels[i] != from_level:
+            continue
+        if spent + extra <= budget:
+            levels[i] = to_level
+            spent += extra
+        elif from_level == "omitted" and to_level == "full" and items[i].truncated_cost is not None:
+            # Too big in full: offer the truncated version instead
+            extra = max(1, items[i].truncated_cost - items[i].listed_cost)
+            value = items[i].score * TRUNCATED_VALUE
+            heapq.heappush(steps, (-value / extra, i, "omitted", "truncated", extra))
+    
+    return levels
+
+
 class Scanner:
     """Directory scanner that creates snapshots for LLM context."""
     
-    def __init__(self, root: Path):
+    def __init__(
+        self,
+        root: Path,
+        jobs: int = DEFAULT_JOBS,
+        use_processes: bool = False,
+        cache: Optional[SnapshotCache] = None,
+        use_git: bool = False,
+        ignore_patterns: Iterable[str] = (),
+    ):
         self.root = root.resolve()
         self.self_name = Path(__file__).name
+        self.jobs = max(1, jobs)
+        self.use_processes = use_processes
+        self.cache = cache
+        self.use_git = use_git
+        self.dir_matcher, self.file_matcher = build_ignore_matchers(self.root, ignore_patterns)
+        self.enumeration = "walk"  # "git" once files were listed from the git index
         self.tree_lines: List[str] = []
-        self.files_to_include: List[Tuple[Path, str]] = []  # (filepath, relative_path)
+        self.files_to_include: List[Tuple[FileEntry, str]] = []  # (file_entry, relative_path)
         self.stats = {"dirs": 0, "files": 0, "included": 0, "binary": 0, "large": 0, "empty": 0}
+        self.syscalls = SyscallCounter()
+        self.encodings: Counter = Counter()  # files rendered per decoding used
+        self._tally_lock = Lock()  # guards stats["read"] and encodings while shards render
+        # Token budget (see apply_budget): rel_path -> "full" / "truncated" / "omitted"
+        self.budget_plan: Dict[str, str] = {}
+        self.file_tokens: Dict[str, int] = {}
+        self.token_counter: Optional[TokenCounter] = None
+        self._tree_rows: Dict[str, int] = {}  # rel_path -> index in tree_lines
+        # Deduplication (see find_duplicates): rel_path -> rel_path of the first copy
+        self.duplicate_of: Dict[str, str] = {}
+        self.dedup_saved_bytes = 0
+        self.dedup_saved_tokens = 0
+        # Delta snapshots (see apply_since): heading over the tree, and the
+        # previous content of modified files to diff against (with diff_changes)
+        self.structure_heading = "Structure"
+        self.diff_changes = False
+        self.diff_bases: Dict[str, str] = {}
+        # Excerpts of files over MAX_FILE_SIZE (see make_excerpts): rel_path -> excerpt
+        self.excerpt_large = False
+        self.excerpt_pattern: Optional["re.Pattern[bytes]"] = None
+        self.excerpts: Dict[str, LoadedFile] = {}
+        # Minification stage (see _load_rendered): rel_path -> (tokens before, after)
+        self.minify = False
+        self.minify_report: Dict[str, Tuple[int, int]] = {}
+        # Per-file accounting for --profile (phases are timed by the caller)
+        self.profile: Optional[Profile] = None
+        # Sharded output (see plan_shards): the rel_paths of each shard, in order
+        self.shards: List[List[str]] = []
+        # Directory listings enumerated ahead of rendering (parallel mode only)
+        self._listings: Dict[Path, Optional[DirListing]] = {}
+        # Keep the listings after scan() so refresh() can re-list only what changed
+        self.retain_listings = False
+        # Files the run writes itself, as one regex over rel_paths (see exclude_outputs)
+        self._own_outputs: Optional["re.Pattern[str]"] = None
     
-    def should_ignore_dir(self, name: str) -> bool:
+    def should_ignore_dir(self, name: str, rel_path: Optional[str] = None) -> bool:
         """Check if directory should be completely ignored."""
-        # Check exact match
-        if name in IGNORE_DIRS:
-            return True
-        # Check pattern match (e.g., *.egg-info)
-        for pattern in IGNORE_DIRS:
-            if "*" in pattern:
-                if pattern.startswith("*") and name.endswith(pattern[1:]):
-                    return True
-                elif pattern.endswith("*") and name.startswith(pattern[:-1]):
-                    return True
+        # Check names, wildcards (e.g., *.egg-info), paths (e.g., public/build) and user patterns
+        verdict = self.dir_matcher.match(rel_path or name, name, is_dir=True)
+        if verdict is not None:
+            return verdict
         # Ignore hidden dirs except those in ALWAYS_INCLUDE
         if name.startswith(".") and name not in ALWAYS_INCLUDE:
             return True
         return False
     
-    def should_ignore_file(self, name: str, ext: str) -> bool:
+    def should_ignore_file(self, name: str, ext: str, rel_path: Optional[str] = None) -> bool:
         """Check if file should be completely ignored (not even in tree)."""
+        # Never snapshot what this run writes (see exclude_outputs)
+        if self._own_outputs is not None and self._own_outputs.fullmatch(rel_path or name):
+            return True
         # Always include priority files
         if name in ALWAYS_INCLUDE:
             return False
         # Ignore self
         if name == self.self_name:
             return True
-        # Check exact name match
-        if name in IGNORE_FILES:
-            return True
+        # Check exact name match and user patterns
+        verdict = self.file_matcher.match(rel_path or name, name, is_dir=False)
+        if verdict is not None:
+            return verdict
         # Check extension
         if ext in IGNORE_EXTENSIONS:
             return True
         return False
     
-    def get_file_status(self, filepath: Path) -> Tuple[bool, str]:
+    def exclude_outputs(self, paths: Iterable[Path] = (), shards_of: Optional[Path] = None) -> None:
+        """
+        Leave the files this run writes out of the scan, so an output under the
+        root never shows up in the next snapshot: each of paths (with the .tmp
+        file it may be written through) and every shard of shards_of, whatever
+        its number. Paths outside the root are skipped.
+        """
+        alternatives: List[str] = []
+        for path in paths:
+            rel_path = self._output_rel_path(path)
+            if rel_path is not None:
+                alternatives.append(re.escape(rel_path) + r"(?:\.tmp)?")
+        if shards_of is not None:
+            rel_path = self._output_rel_path(shards_of)
+            if rel_path is not None:
+                parent = rel_path[:len(rel_path) - len(shards_of.name)]
+                alternatives.append(re.escape(parent) + shard_name_regex(shards_of))
+        if not alternatives:
+            return
+        if self._own_outputs is not None:
+            alternatives.insert(0, self._own_outputs.pattern)
+        self._own_outputs = re.compile("|".join(f"(?:{alt})" for alt in alternatives), re.DOTALL)
+    
+    def _output_rel_path(self, path: Path) -> Optional[str]:
+        """rel_path of an output file (which need not exist yet), or None if outside root."""
+        try:
+            return self._rel_path(Path(path).resolve())
+        except ValueError:
+            return None
+    
+    def writes(self, path: Path) -> bool:
+        """Whether path (absolute, below root) is one of the files this run writes."""
+        if self._own_outputs is None:
+            return False
+        try:
+            rel_path = self._rel_path(path)
+        except ValueError:
+            return False
+        return self._own_outputs.fullmatch(rel_path) is not None
+    
+    def get_file_status(
+        self, filepath: Path, st: Optional[os.stat_result] = None
+    ) -> Tuple[bool, str]:
         """
         Determine if file content should be included.
         Returns: (should_include, status_marker)
         
+        Pass the stat result already fetched by the walker as `st` to avoid
+        another stat() call.
+        
         Status markers:
         - "" : include content
         - "binary" : binary file
-        - "large" : file too large
+        - "large" : file too large (still included, as an excerpt, with excerpt_large)
         - "empty" : empty file
         """
         ext = filepath.suffix.lower()
@@ -431,274 +1536,2401 @@ class Scanner:
             return False, "binary"
         
         # Check size
-        try:
-            size = filepath.stat().st_size
-        except OSError:
-            return False, "error"
+        if st is None:
+            try:
+                self.syscalls.add("stat")
+                st = filepath.stat()
+            except OSError:
+                return False, "error"
+        size = st.st_size
         
         if size < MIN_FILE_SIZE:
             return False, "empty"
         
         if size > MAX_FILE_SIZE:
+            if self.excerpt_large and not self.is_binary_content(filepath, st):
+                return True, "large"
             return False, "large"
         
+        # Check content (unknown or missing extensions can still hide binaries)
+        if self.is_binary_content(filepath, st):
+            return False, "binary"
+        
         return True, ""
     
+    def is_binary_content(self, filepath: Path, st: os.stat_result) -> bool:
+        """
+        Classify a file as binary from its first SNIFF_BYTES.
+        
+        The verdict is kept in the cache under the file's stat signature, so
+        unchanged files are only probed once.
+        """
+        if SNIFF_BYTES <= 0:
+            return False
+        rel_path = self._rel_path(filepath)
+        if self.cache is not None:
+            verdict = self.cache.get_fact("binary", rel_path, st)
+            if verdict is not None:
+                return verdict == "1"
+        
+        with self.profile.phase("sniff") if self.profile is not None else nullcontext():
+            try:
+                self.syscalls.add("probe")
+                with open(filepath, "rb") as f:
+                    head = f.read(SNIFF_BYTES)
+            except OSError:
+                return False
+            with self._tally_lock:
+                self.stats["bytes_read"] = self.stats.get("bytes_read", 0) + len(head)
+            is_binary = sniff_binary(head)
+        
+        if self.cache is not None:
+            self.cache.put_fact("binary", rel_path, st, "1" if is_binary else "0")
+        return is_binary
+    
     def scan(self) -> None:
         """Scan the directory tree."""
-        self.tree_lines = [f"{self.root.name}/"]
+        self._reset()
+        # With retained listings from a previous scan (see refresh), only re-render
+        if not (self.retain_listings and self._listings):
+            git_listings = self._git_listings() if self.use_git else None
+            if git_listings is not None:
+                self.enumeration = "git"
+                self._listings = git_listings
+            elif self.jobs > 1:
+                with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                    self._listings = self._walk_parallel(executor)
         self._scan_recursive(self.root, "")
+        if not self.retain_listings:
+            self._listings = {}
     
-    def _scan_recursive(self, current: Path, prefix: str) -> None:
-        """Recursively scan directory."""
-        try:
-            entries = sorted(
-                current.iterdir(),
-                key=lambda p: (p.is_file(), p.name.lower())
-            )
-        except PermissionError:
+    def _reset(self) -> None:
+        """Clear everything a previous scan() and the passes after it produced."""
+        self.tree_lines = [f"{self.root.name}/"]
+        self.files_to_include = []
+        self.stats = {"dirs": 0, "files": 0, "included": 0, "binary": 0, "large": 0, "empty": 0}
+        self.encodings = Counter()
+        self.budget_plan = {}
+        self.file_tokens = {}
+        self._tree_rows = {}
+        self.duplicate_of = {}
+        self.dedup_saved_bytes = 0
+        self.dedup_saved_tokens = 0
+        self.structure_heading = "Structure"
+        self.diff_bases = {}
+        self.minify_report = {}
+        self.excerpts = {}
+        self.shards = []
+    
+    def refresh(self, changed_dirs: Iterable[Path]) -> None:
+        """
+        Re-list only the directories that changed, then re-render the tree from
+        the retained listings of all the others (requires retain_listings).
+        """
+        if self.enumeration == "git":
+            # The index decides what is listed; asking git again is cheap
+            self._listings = {}
+            self.scan()
             return
         
-        # Separate and filter
-        dirs = []
-        files = []
+        for directory in changed_dirs:
+            old = self._listings.pop(directory, None)
+            new = self._list_dir(directory) if directory.is_dir() else None
+            gone = set(old[0] if old else ()) - set(new[0] if new else ())
+            if new is None:
+                gone.add(directory)
+            else:
+                self._listings[directory] = new
+            # Forget whatever was listed below removed subdirectories
+            for removed in gone:
+                for listed in [d for d in self._listings if removed in d.parents]:
+                    del self._listings[listed]
+        self.scan()
+    
+    def watched_dirs(self) -> List[Path]:
+        """Directories that are part of the retained tree."""
+        return [directory for directory, listing in self._listings.items() if listing is not None]
+    
+    def _git_listings(self) -> Optional[Dict[Path, Optional[DirListing]]]:
+        """
+        Build the directory listings from the git index instead of the filesystem.
+        
+        Lists tracked files plus untracked files that .gitignore does not exclude,
+        so ignored subtrees are never visited. The scanner's own ignore rules still
+        apply on top. Returns None if root is not inside a git work tree.
         
-        for entry in entries:
-            if entry.is_dir():
-                if not self.should_ignore_dir(entry.name):
-                    dirs.append(entry)
-                    self.stats["dirs"] += 1
-            elif entry.is_file():
-                ext = entry.suffix.lower()
-                if not self.should_ignore_file(entry.name, ext):
-                    files.append(entry)
-                    self.stats["files"] += 1
+        Paths that turn out to be directories (symlinked dirs, submodules) get no
+        listing of their own, so rendering falls back to walking them.
+        """
+        try:
+            result = subprocess.run(
+                ["git", "ls-files", "-z", "--cached", "--others", "--exclude-standard"],
+                cwd=self.root,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                check=True,
+            )
+        except (OSError, subprocess.CalledProcessError):
+            return None
         
-        # Process all entries
-        all_entries = dirs + files
-        total = len(all_entries)
+        subdirs: Dict[Path, Set[str]] = {self.root: set()}
+        candidates: List[Tuple[Path, str]] = []  # (parent, file name)
         
-        for i, entry in enumerate(all_entries):
-            is_last = (i == total - 1)
-            connector = "└── " if is_last else "├── "
-            child_prefix = prefix + ("    " if is_last else "│   ")
-            
-            if entry.is_dir():
-                self.tree_lines.append(f"{prefix}{connector}{entry.name}/")
-                self._scan_recursive(entry, child_prefix)
+        rel_paths = set(os.fsdecode(raw) for raw in result.stdout.split(b"\0") if raw)
+        for rel_path in rel_paths:
+            *dir_parts, name = rel_path.split("/")
+            parent = self.root
+            for depth, part in enumerate(dir_parts):
+                if self.should_ignore_dir(part, "/".join(dir_parts[:depth + 1])):
+                    break
+                subdirs[parent].add(part)
+                parent = parent / part
+                subdirs.setdefault(parent, set())
             else:
-                should_include, status = self.get_file_status(entry)
-                
-                # Add to tree
-                marker = f" [{status}]" if status else ""
-                self.tree_lines.append(f"{prefix}{connector}{entry.name}{marker}")
-                
-                # Track stats
-                if status == "binary":
-                    self.stats["binary"] += 1
-                elif status == "large":
-                    self.stats["large"] += 1
-                elif status == "empty":
-                    self.stats["empty"] += 1
-                
-                # Add to files list if content should be included
-                if should_include:
-                    rel_path = str(entry.relative_to(self.root))
-                    self.files_to_include.append((entry, rel_path))
-                    self.stats["included"] += 1
-    
-    def read_file(self, filepath: Path) -> str:
-        """Read file content with encoding fallback."""
-        encodings = ["utf-8", "utf-8-sig", "latin-1", "cp1252", "ascii"]
+                if not self.should_ignore_file(name, Path(name).suffix.lower(), rel_path):
+                    candidates.append((parent, name))
         
-        for encoding in encodings:
+        def stat_or_none(candidate: Tuple[Path, str]) -> Optional[os.stat_result]:
+            self.syscalls.add("stat")
             try:
-                return filepath.read_text(encoding=encoding)
-            except UnicodeDecodeError:
-                continue
-            except Exception as e:
-                return f"[Error reading file: {e}]"
+                return os.stat(candidate[0] / candidate[1])
+            except OSError:
+                return None
         
-        return "[Unable to decode file]"
+        if self.jobs > 1:
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                stats = list(executor.map(stat_or_none, candidates))
+        else:
+            stats = list(map(stat_or_none, candidates))
+        
+        files: Dict[Path, List[FileEntry]] = defaultdict(list)
+        for (parent, name), st in zip(candidates, stats):
+            if st is None:
+                # Deleted from the work tree but still in the index
+                continue
+            if stat.S_ISDIR(st.st_mode):
+                if not self.should_ignore_dir(name, self._rel_path(parent / name)):
+                    subdirs[parent].add(name)
+                continue
+            path = parent / name
+            should_include, status = self.get_file_status(path, st)
+            files[parent].append(FileEntry(path, st, should_include, status))
+        
+        def by_name(name: str) -> Tuple[str, str]:
+            return name.lower(), name
+        
+        listings: Dict[Path, Optional[DirListing]] = {}
+        for directory, names in subdirs.items():
+            dirs = [directory / name for name in sorted(names, key=by_name)]
+            dir_files = sorted(files.get(directory, []), key=lambda f: by_name(f.path.name))
+            listings[directory] = (dirs, dir_files)
+        
+        return listings
+    
+    def _list_dir(self, current: Path) -> Optional[DirListing]:
+        """
+        Enumerate one directory: sorted, filtered subdirectories and files.
+        Returns None if the directory cannot be read.
+        
+        Built on os.scandir so the entry type comes from d_type and each kept
+        file is stat'ed exactly once; that result is reused for its status and
+        carried along in its FileEntry.
+        
+        Touches nothing but its arguments, so it is safe to run from worker threads.
+        """
+        try:
+            self.syscalls.add("scandir")
+            with os.scandir(current) as it:
+                entries = list(it)
+        except OSError:
+            # Unreadable, or removed or replaced by a file since it was listed
+            return None
+        
+        # Classify each entry once; DirEntry only stats symlinks to resolve them
+        classified: List[Tuple[bool, str, os.DirEntry]] = []
+        for entry in entries:
+            try:
+                if entry.is_symlink():
+                    self.syscalls.add("stat")
+                is_file = entry.is_file()
+                is_dir = not is_file and entry.is_dir()
+            except OSError:
+                continue  # e.g. a symlink that points at itself
+            if is_dir and entry.is_symlink() and self._is_cycle(current, entry.path):
+                continue
+            if is_file or is_dir:
+                classified.append((is_file, entry.name.lower(), entry))
+        classified.sort(key=lambda c: (c[0], c[1]))
+        
+        dirs: List[Path] = []
+        files: List[FileEntry] = []
+        base = "" if current == self.root else self._rel_path(current) + "/"
+        
+        # Timed as its own phase (binary sniffing nested in it as another), so a profile of
+        # scan() tells the traversal apart from the per-file work
+        with self.profile.phase("stat") if self.profile is not None else nullcontext():
+            for is_file, _, entry in classified:
+                if not is_file:
+                    if not self.should_ignore_dir(entry.name, base + entry.name):
+                        dirs.append(current / entry.name)
+                    continue
+                path = current / entry.name
+                if self.should_ignore_file(entry.name, path.suffix.lower(), base + entry.name):
+                    continue
+                try:
+                    self.syscalls.add("stat")
+                    st: Optional[os.stat_result] = entry.stat()
+                except OSError:
+                    st = None
+                if st is None:
+                    should_include, status = False, "error"
+                else:
+                    should_include, status = self.get_file_status(path, st)
+                files.append(FileEntry(path, st, should_include, status))
+        
+        return dirs, files
+    
+    def _is_cycle(self, current: Path, link: str) -> bool:
+        """
+        Whether the directory symlink link, found in current, leads back to a
+        directory on the way from root to current: following it would never end.
+        """
+        target = os.path.realpath(link)
+        walked = [current]
+        while walked[-1] != self.root and walked[-1] != walked[-1].parent:
+            walked.append(walked[-1].parent)
+        return any(os.path.realpath(directory) == target for directory in walked)
+    
+    def _rel_path(self, path: Path) -> str:
+        """
+        Path relative to root, with forward slashes on every platform: ignore
+        patterns, entry points, manifests and the snapshot all use this form.
+        """
+        return path.relative_to(self.root).as_posix()
+    
+    def _walk_parallel(self, executor: Executor) -> Dict[Path, Optional[DirListing]]:
+        """Enumerate every directory of the tree, fanning subtrees out to the pool."""
+        listings: Dict[Path, Optional[DirListing]] = {}
+        pending = {executor.submit(self._list_dir, self.root): self.root}
+        
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                directory = pending.pop(future)
+                listing = future.result()
+                listings[directory] = listing
+                if listing is not None:
+                    for subdir in listing[0]:
+                        pending[executor.submit(self._list_dir, subdir)] = subdir
+        
+        return listings
+    
+    def _scan_recursive(self, current: Path, prefix: str) -> None:
+        """Recursively render a directory into the tree."""
+        if current in self._listings:
+            if self.retain_listings:
+                listing = self._listings[current]
+            else:
+                listing = self._listings.pop(current)
+        else:
+            listing = self._list_dir(current)
+            if self.retain_listings:
+                self._listings[current] = listing
+        if listing is None:
+            return
+        
+        dirs, files = listing
+        self.stats["dirs"] += len(dirs)
+        self.stats["files"] += len(files)
+        
+        # Process all entries
+        total = len(dirs) + len(files)
+        
+        for i, entry in enumerate(dirs):
+            is_last = (i == total - 1)
+            connector = "└── " if is_last else "├── "
+            child_prefix = prefix + ("    " if is_last else "│   ")
+            
+            self.tree_lines.append(f"{prefix}{connector}{entry.name}/")
+            self._scan_recursive(entry, child_prefix)
+        
+        for i, file_entry in enumerate(files, start=len(dirs)):
+            entry, _, should_include, status = file_entry
+            is_last = (i == total - 1)
+            connector = "└── " if is_last else "├── "
+            
+            # Add to tree
+            marker = f" [{status}]" if status else ""
+            self.tree_lines.append(f"{prefix}{connector}{entry.name}{marker}")
+            
+            # Track stats
+            if status == "binary":
+                self.stats["binary"] += 1
+            elif status == "large":
+                self.stats["large"] += 1
+            elif status == "empty":
+                self.stats["empty"] += 1
+            
+            # Add to files list if content should be included
+            if should_include:
+                rel_path = self._rel_path(entry)
+                self.files_to_include.append((file_entry, rel_path))
+                self._tree_rows[rel_path] = len(self.tree_lines) - 1
+                self.stats["included"] += 1
+    
+    @staticmethod
+    def read_file(filepath: Path) -> str:
+        """Read file content with encoding fallback."""
+        return Scanner.decode_file(filepath)[0]
+    
+    @staticmethod
+    def decode_file(filepath: Path) -> Tuple[str, str]:
+        """
+        Read a file once and decode it.
+        Returns: (content, encoding), with encoding "" if the file could not be read.
+        
+        Large files are memory-mapped rather than copied into a bytes object.
+        """
+        try:
+            with open(filepath, "rb") as f:
+                if os.fstat(f.fileno()).st_size >= MMAP_THRESHOLD:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                        return decode_bytes(buf)
+                return decode_bytes(f.read())
+        except Exception as e:
+            return f"[Error reading file: {e}]", ""
     
     def get_lang_hint(self, filepath: Path) -> str:
         """Get markdown code block language hint."""
-        ext_to_lang = {
-            # Python
-            ".py": "python", ".pyw": "python", ".pyx": "python", ".pxd": "python",
-            ".pyi": "python",
-            # JavaScript / TypeScript
-            ".js": "javascript", ".mjs": "javascript", ".cjs": "javascript",
-            ".ts": "typescript", ".mts": "typescript", ".cts": "typescript",
-            ".jsx": "jsx", ".tsx": "tsx",
-            # Web
-            ".html": "html", ".htm": "html", ".xhtml": "html",
-            ".css": "css", ".scss": "scss", ".sass": "sass", ".less": "less",
-            ".vue": "vue", ".svelte": "svelte", ".astro": "astro",
-            # Data
-            ".json": "json", ".jsonc": "jsonc", ".json5": "json5",
-            ".xml": "xml", ".xsl": "xml", ".xslt": "xml",
-            ".yaml": "yaml", ".yml": "yaml",
-            ".toml": "toml",
-            ".csv": "csv",
-            ".ini": "ini", ".cfg": "ini", ".conf": "ini",
-            # Shell
-            ".sh": "bash", ".bash": "bash", ".zsh": "zsh", ".fish": "fish",
-            ".ps1": "powershell", ".psm1": "powershell", ".psd1": "powershell",
-            ".bat": "batch", ".cmd": "batch",
-            # Documentation
-            ".md": "markdown", ".markdown": "markdown", ".mdx": "mdx",
-            ".rst": "rst", ".txt": "text",
-            # Systems
-            ".c": "c", ".h": "c",
-            ".cpp": "cpp", ".cc": "cpp", ".cxx": "cpp",
-            ".hpp": "cpp", ".hxx": "cpp", ".hh": "cpp",
-            ".cs": "csharp",
-            ".go": "go",
-            ".rs": "rust",
-            ".java": "java",
-            ".kt": "kotlin", ".kts": "kotlin",
-            ".scala": "scala", ".sc": "scala",
-            ".swift": "swift",
-            ".m": "objectivec", ".mm": "objectivec",
-            # Scripting
-            ".rb": "ruby", ".rake": "ruby", ".gemspec": "ruby",
-            ".php": "php",
-            ".pl": "perl", ".pm": "perl",
-            ".lua": "lua",
-            ".r": "r", ".R": "r",
-            # Functional
-            ".ex": "elixir", ".exs": "elixir",
-            ".erl": "erlang", ".hrl": "erlang",
-            ".clj": "clojure", ".cljs": "clojure", ".cljc": "clojure", ".edn": "clojure",
-            ".hs": "haskell", ".lhs": "haskell",
-            ".ml": "ocaml", ".mli": "ocaml",
-            ".fs": "fsharp", ".fsx": "fsharp", ".fsi": "fsharp",
-            ".elm": "elm",
-            ".nim": "nim",
-            ".zig": "zig",
-            # Query
-            ".sql": "sql", ".mysql": "sql", ".pgsql": "sql",
-            ".graphql": "graphql", ".gql": "graphql",
-            # Config / DevOps
-            ".dockerfile": "dockerfile",
-            ".tf": "terraform", ".tfvars": "terraform",
-            ".hcl": "hcl",
-            ".nix": "nix",
-            ".dhall": "dhall",
-            # Other
-            ".proto": "protobuf",
-            ".prisma": "prisma",
-            ".vim": "vim", ".vimrc": "vim",
-            ".tex": "latex", ".latex": "latex",
-            ".env": "bash",
-            ".gitignore": "gitignore",
-            ".editorconfig": "editorconfig",
-            ".htaccess": "apacheconf",
+        lang = NAME_TO_LANG.get(filepath.name)
+        if lang is not None:
+            return lang
+        return EXT_TO_LANG.get(filepath.suffix.lower(), "")
+    
+    def make_excerpts(self) -> None:
+        """
+        Excerpt the large files scan() included (with excerpt_large) and note
+        their original and excerpted size in the tree. Must run after scan().
+        """
+        self.excerpts = {}
+        large = [item for item in self.files_to_include if item[0].status == "large"]
+        paths = [entry.path for entry, _ in large]
+        
+        def excerpt(path: Path) -> Tuple[str, str]:
+            return excerpt_file(path, self.excerpt_pattern)
+        
+        if self.jobs > 1 and paths:
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                results = list(executor.map(excerpt, paths))
+        else:
+            results = list(map(excerpt, paths))
+        
+        for (entry, rel_path), (content, encoding) in zip(large, results):
+            self.excerpts[rel_path] = LoadedFile(content, self.get_lang_hint(entry.path), encoding)
+            row = self._tree_rows[rel_path]
+            self.tree_lines[row] = self.tree_lines[row].replace(
+                " [large]",
+                f" [large: {format_size(entry.stat.st_size)}, "
+                f"excerpt {format_size(len(content.encode('utf-8')))}]",
+            )
+        self.stats["excerpted"] = len(self.excerpts)
+    
+    def find_duplicates(self) -> None:
+        """
+        Hash every included file and map each later byte-identical copy to the
+        first one, so its content is emitted only once. Must run after scan().
+        
+        Excerpted files are left out (their content is only partly emitted).
+        """
+        files = [item for item in self.files_to_include if item[0].status != "large"]
+        hashes = self.compute_hashes(files)
+        
+        first_by_hash: Dict[str, str] = {}
+        self.duplicate_of = {}
+        for entry, rel_path in files:
+            digest = hashes[rel_path]
+            if digest is None:
+                continue
+            original = first_by_hash.setdefault(digest, rel_path)
+            if original != rel_path:
+                self.duplicate_of[rel_path] = original
+                size = entry.stat.st_size if entry.stat is not None else 0
+                self.dedup_saved_bytes += size
+                self.dedup_saved_tokens += size // 4
+        self.stats["duplicates"] = len(self.duplicate_of)
+    
+    def compute_hashes(self, files: List[Tuple[FileEntry, str]]) -> Dict[str, Optional[str]]:
+        """
+        Content hash of each file (None if unreadable).
+        
+        Hashes are cached per file; the rest are computed on the pool with --jobs.
+        """
+        kind = f"hash:{HASH_NAME}"
+        cache = self.cache
+        hashes: Dict[str, Optional[str]] = {}
+        missing: List[Tuple[FileEntry, str]] = []
+        for entry, rel_path in files:
+            digest = cache.get_fact(kind, rel_path, entry.stat) if cache is not None else None
+            hashes[rel_path] = digest
+            if digest is None:
+                missing.append((entry, rel_path))
+        
+        paths = [entry.path for entry, _ in missing]
+        if self.jobs > 1 and paths:
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                computed = list(executor.map(hash_file, paths))
+        else:
+            computed = list(map(hash_file, paths))
+        for (entry, rel_path), digest in zip(missing, computed):
+            hashes[rel_path] = digest
+            if cache is not None and digest is not None:
+                cache.put_fact(kind, rel_path, entry.stat, digest)
+        return hashes
+    
+    def build_manifest(self, previous: Optional[dict] = None) -> dict:
+        """
+        Describe every included file by size, mtime and content hash.
+        
+        Files whose size and mtime match the previous manifest keep its hash,
+        so only files that look changed are hashed.
+        """
+        previous_files = previous["files"] if previous else {}
+        files: Dict[str, dict] = {}
+        to_hash: List[Tuple[FileEntry, str]] = []
+        for entry, rel_path in self.files_to_include:
+            if entry.stat is None:
+                continue
+            old = previous_files.get(rel_path)
+            if old and (old["size"], old["mtime_ns"]) == (entry.stat.st_size, entry.stat.st_mtime_ns):
+                files[rel_path] = old
+            else:
+                to_hash.append((entry, rel_path))
+        
+        for (entry, rel_path), digest in zip(to_hash, self.compute_hashes(to_hash).values()):
+            files[rel_path] = {
+                "size": entry.stat.st_size,
+                "mtime_ns": entry.stat.st_mtime_ns,
+                "hash": digest,
+            }
+        return {
+            "version": MANIFEST_VERSION,
+            "root": str(self.root),
+            "hash": HASH_NAME,
+            "generated": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "files": dict(sorted(files.items())),
         }
+    
+    def apply_since(self, previous: dict, current: dict, label: str) -> None:
+        """
+        Narrow the snapshot to what changed between two manifests: the tree
+        becomes a condensed tree of added, modified and removed files, and only
+        added and modified files keep a content block. Must run after scan().
         
-        name_to_lang = {
-            "Dockerfile": "dockerfile",
-            "Containerfile": "dockerfile",
-            "Makefile": "makefile",
-            "GNUmakefile": "makefile",
-            "makefile": "makefile",
-            "Justfile": "just",
-            "justfile": "just",
-            "Jenkinsfile": "groovy",
-            "Vagrantfile": "ruby",
-            "Gemfile": "ruby",
-            "Rakefile": "ruby",
-            "Guardfile": "ruby",
-            "Podfile": "ruby",
-            "Brewfile": "ruby",
-            "CMakeLists.txt": "cmake",
-            "meson.build": "meson",
-            "BUILD": "python",
-            "BUILD.bazel": "python",
-            "WORKSPACE": "python",
-            "requirements.txt": "text",
-            "constraints.txt": "text",
-            "pyproject.toml": "toml",
-            "setup.py": "python",
-            "setup.cfg": "ini",
-            "Cargo.toml": "toml",
-            "go.mod": "go",
-            "go.sum": "text",
-            "package.json": "json",
-            "tsconfig.json": "jsonc",
-            "jsconfig.json": "jsonc",
-            "deno.json": "jsonc",
-            "composer.json": "json",
-            ".babelrc": "json",
-            ".swcrc": "json",
+        Modified files are rendered as unified diffs (with diff_changes) when the
+        cache still holds the version the previous manifest described.
+        """
+        old_files = previous["files"]
+        new_files = current["files"]
+        markers: Dict[str, str] = {}
+        for rel_path, info in new_files.items():
+            old = old_files.get(rel_path)
+            if old is None:
+                markers[rel_path] = "added"
+            elif old["hash"] != info["hash"]:
+                markers[rel_path] = "modified"
+        for rel_path in old_files.keys() - new_files.keys():
+            markers[rel_path] = "removed"
+        
+        if self.diff_changes and self.cache is not None:
+            # An old version may be cached under any path that had the same content
+            # (duplicates were never read)
+            paths_by_hash: Dict[str, List[str]] = defaultdict(list)
+            for rel_path, info in old_files.items():
+                paths_by_hash[info["hash"]].append(rel_path)
+            for rel_path, marker in markers.items():
+                if marker != "modified":
+                    continue
+                candidates = [rel_path, *paths_by_hash[old_files[rel_path]["hash"]]]
+                for candidate in candidates:
+                    old = old_files[candidate]
+                    base = self.cache.load_version(candidate, old["size"], old["mtime_ns"])
+                    if base is not None:
+                        self.diff_bases[rel_path] = base.content
+                        break
+        
+        self.files_to_include = [item for item in self.files_to_include if item[1] in markers]
+        self.tree_lines, self._tree_rows = render_path_tree(self.root.name, markers)
+        self.structure_heading = f"Changes since {label}"
+        for marker in ("added", "modified", "removed"):
+            self.stats[marker] = sum(1 for m in markers.values() if m == marker)
+    
+    def apply_entries(self, entries: List[str]) -> None:
+        """
+        Narrow the snapshot to the files reachable from entries (rel_paths of
+        included files) through TS/JS and Python imports, in topological order:
+        every file comes before the files it imports, entry points first.
+        Imports that resolve to no included file (packages, ignored files) are
+        not followed. Must run after scan().
+        
+        The imports parsed from each file are cached, so only files changed
+        since the last run are parsed again.
+        """
+        by_rel = {item[1]: item for item in self.files_to_include}
+        entries = list(dict.fromkeys(entries))
+        missing = [rel_path for rel_path in entries if rel_path not in by_rel]
+        if missing:
+            raise ValueError(f"not an included file: {', '.join(missing)}")
+        known = set(by_rel)
+        roots = list(dict.fromkeys([*IMPORT_ROOTS, *(posixpath.dirname(e) for e in entries)]))
+        
+        graph: Dict[str, List[str]] = {}
+        frontier = entries
+        while frontier:
+            items = [by_rel[rel_path] for rel_path in frontier]
+            for (entry, rel_path), imports in zip(items, self._imports_of(items)):
+                lang = self.get_lang_hint(entry.path)
+                targets: List[str] = []
+                for spec in imports:
+                    if lang == "python":
+                        targets += resolve_python_import(rel_path, spec[0], spec[1], roots, known)
+                    else:
+                        targets += resolve_js_import(rel_path, spec, known)
+                graph[rel_path] = [t for t in dict.fromkeys(targets) if t != rel_path]
+            frontier = list(dict.fromkeys(
+                target for rel_path in frontier for target in graph[rel_path] if target not in graph
+            ))
+        
+        # Reverse postorder of a depth-first walk, visiting imports in reverse so
+        # that the final reversal leaves them in source order
+        postorder: List[str] = []
+        visited: Set[str] = set()
+        for start in reversed(entries):
+            if start in visited:
+                continue
+            visited.add(start)
+            stack = [(start, iter(reversed(graph[start])))]
+            while stack:
+                rel_path, targets = stack[-1]
+                target = next((t for t in targets if t not in visited), None)
+                if target is None:
+                    stack.pop()
+                    postorder.append(rel_path)
+                else:
+                    visited.add(target)
+                    stack.append((target, iter(reversed(graph[target]))))
+        order = postorder[::-1]
+        
+        self.files_to_include = [by_rel[rel_path] for rel_path in order]
+        markers = {
+            rel_path: "large" if by_rel[rel_path][0].status == "large" else "" for rel_path in order
         }
+        self.tree_lines, self._tree_rows = render_path_tree(self.root.name, markers)
+        self.structure_heading = f"Dependencies of {', '.join(entries)}"
+        self.stats["reachable"] = len(order)
+    
+    def _imports_of(self, files: List[Tuple[FileEntry, str]]) -> List[list]:
+        """The parsed imports (see parse_imports) of each of files, from the cache when fresh."""
+        cache = self.cache
+        langs = [self.get_lang_hint(entry.path) for entry, _ in files]
+        imports: List[Optional[list]] = []
+        for (entry, rel_path), lang in zip(files, langs):
+            if lang not in IMPORT_LANGS or entry.status == "large":
+                imports.append([])
+                continue
+            fact = cache.get_fact("imports", rel_path, entry.stat) if cache is not None else None
+            imports.append(json.loads(fact) if fact is not None else None)
         
-        name = filepath.name
-        if name in name_to_lang:
-            return name_to_lang[name]
+        pending = [i for i, found in enumerate(imports) if found is None]
+        for i, loaded in zip(pending, self._load_all([files[i] for i in pending])):
+            entry, rel_path = files[i]
+            imports[i] = parse_imports(loaded.content, langs[i])
+            if cache is not None and loaded.encoding:
+                cache.put_fact("imports", rel_path, entry.stat, json.dumps(imports[i]))
+        return imports
+    
+    def apply_budget(
+        self,
+        max_tokens: int,
+        counter: TokenCounter,
+        weights: Optional[Dict[str, float]] = None,
+    ) -> None:
+        """
+        Fit the snapshot into max_tokens: decide per included file whether its
+        content goes in full, truncated to TRUNCATE_TOKENS or is left out, in
+        which case the tree still lists it. Must run after scan().
+        """
+        weights = PRIORITY_WEIGHTS if weights is None else weights
+        self.token_counter = counter
+        self.file_tokens = self._count_file_tokens(counter)
         
-        ext = filepath.suffix.lower()
-        return ext_to_lang.get(ext, "")
+        fixed = counter.count("\n".join([
+            f"# {self.root.name}", "", f"## {self.structure_heading}", "", "```",
+            *self.tree_lines,
+            "```", "", "## Files", "",
+        ]))
+        
+        mtimes = sorted(
+            entry.stat.st_mtime_ns for entry, rel_path in self.files_to_include
+            if entry.stat is not None and rel_path not in self.duplicate_of
+        )
+        recency_rank = {mtime: i / max(1, len(mtimes) - 1) for i, mtime in enumerate(mtimes)}
+        
+        def piece_cost(text: str) -> int:
+            # Pieces are counted one by one: a token of slack each covers the rounding where
+            # they meet in the snapshot, so the sum never falls short of the whole
+            return counter.count(text) + 1
+        
+        omitted_cost = piece_cost(" [omitted]")
+        truncated_marker = piece_cost(" [truncated]") + piece_cost(
+            f"\n… [truncated: first ~{TRUNCATE_TOKENS:,} of 000,000 tokens]"
+        )
+        
+        def budget_item(entry: FileEntry, rel_path: str) -> BudgetItem:
+            lang = self.get_lang_hint(entry.path)
+            score = 1e-6 + (
+                weights.get("depth", 0.0) / (1 + rel_path.count("/"))
+                + weights.get("recency", 0.0) * (
+                    recency_rank.get(entry.stat.st_mtime_ns, 0.0) if entry.stat else 0.0
+                )
+                + weights.get("type", 0.0) * TYPE_PRIORITY.get(lang, 0.5)
+            )
+            block = piece_cost(f"### {rel_path}\n```{lang}\n\n```\n")
+            tokens = self.file_tokens[rel_path]
+            truncated_cost = None
+            if tokens > TRUNCATE_TOKENS * 1.5:
+                truncated_cost = block + TRUNCATE_TOKENS + 1 + truncated_marker
+            return BudgetItem(score, omitted_cost, truncated_cost, block + tokens + 1)
+        
+        items: Dict[str, BudgetItem] = {}
+        while True:
+            # Duplicates only cost their reference line
+            files = [item for item in self.files_to_include if item[1] not in self.duplicate_of]
+            references = sum(
+                piece_cost(self._duplicate_block(rel_path)) for rel_path in self.duplicate_of
+            )
+            for entry, rel_path in files:
+                if rel_path not in items:
+                    items[rel_path] = budget_item(entry, rel_path)
+            levels = plan_budget(
+                [items[rel_path] for _, rel_path in files], max(0, max_tokens - fixed - references)
+            )
+            self.budget_plan = {rel_path: level for (_, rel_path), level in zip(files, levels)}
+            
+            # A reference to a file that is not emitted in full would lose the content: the
+            # first copy of such a file is budgeted as a file of its own, the others refer to it
+            promoted: Dict[str, str] = {}
+            for rel_path, original in self.duplicate_of.items():
+                if self.budget_plan[original] != "full":
+                    promoted.setdefault(original, rel_path)
+            if not promoted:
+                break
+            self._promote_duplicates(promoted)
+        
+        for rel_path, level in self.budget_plan.items():
+            if level != "full":
+                self.tree_lines[self._tree_rows[rel_path]] += f" [{level}]"
+                self.stats[level] = self.stats.get(level, 0) + 1
+    
+    def _promote_duplicates(self, promoted: Dict[str, str]) -> None:
+        """
+        Make promoted[original], a duplicate of original, carry the content
+        itself; the other duplicates of original refer to it instead.
+        """
+        sizes = {
+            rel_path: entry.stat.st_size for entry, rel_path in self.files_to_include if entry.stat
+        }
+        for original, rel_path in promoted.items():
+            del self.duplicate_of[rel_path]
+            self.dedup_saved_bytes -= sizes.get(rel_path, 0)
+            self.dedup_saved_tokens -= sizes.get(rel_path, 0) // 4
+        for rel_path, original in self.duplicate_of.items():
+            if original in promoted:
+                self.duplicate_of[rel_path] = promoted[original]
+        self.stats["duplicates"] = len(self.duplicate_of)
+    
+    def plan_shards(self, shard_tokens: int, counter: TokenCounter) -> None:
+        """
+        Split the included files into shards of at most shard_tokens tokens each,
+        keeping their order and never splitting a file block. Must run after scan().
+        A duplicate whose original went to an earlier shard carries the content.
+        
+        Each shard pays for its own header and tree (the whole tree for the first,
+        its subtree for the rest). A file that does not fit even an empty shard
+        gets a shard of its own.
+        """
+        self.token_counter = counter
+        self.file_tokens = self._count_file_tokens(counter)
+        
+        def piece_cost(text: str) -> int:
+            # As in apply_budget: a token of slack for the rounding where counted pieces meet
+            return counter.count(text) + 1
+        
+        header = piece_cost(f"# {self.root.name} (part 00 of 00)\n\n## \n\n```\n```\n\n## Files\n\n")
+        line_costs: Dict[str, int] = {}
+        
+        def line_cost(name: str, depth: int) -> int:
+            # A tree line is an indent, a connector and the name; the indent is about a token per level
+            if name not in line_costs:
+                line_costs[name] = piece_cost(f"├── {name}\n")
+            return line_costs[name] + depth
+        
+        def subtree_cost(parts: Tuple[str, ...], dirs: Set[str]) -> int:
+            # The lines a file adds to a subtree: its own and those of directories not yet shown
+            return line_cost(parts[-1], len(parts) - 1) + sum(
+                line_cost(parts[i - 1], i - 1)
+                for i in range(1, len(parts)) if "/".join(parts[:i]) not in dirs
+            )
+        
+        self.shards = []
+        shard: List[str] = []
+        shard_dirs: Set[str] = set()
+        used = header + piece_cost("\n".join([self.structure_heading, *self.tree_lines]))
+        shown: Set[str] = set()  # originals whose content the current shard emits in full
+        for _, rel_path in self.files_to_include:
+            lang = self.get_lang_hint(Path(rel_path))
+            block = piece_cost(f"### {rel_path}\n```{lang}\n\n```\n")
+            full_cost = block + self.file_tokens[rel_path] + 1
+            # A copy is only a reference when the same shard shows the content (see iter_entries)
+            original = self.duplicate_of.get(rel_path, rel_path)
+            reference = original in shown
+            cost = piece_cost(self._duplicate_block(rel_path)) if reference else full_cost
+            parts = Path(rel_path).parts
+            # The first shard already paid for the whole tree
+            tree_cost = subtree_cost(parts, shard_dirs) if self.shards else 0
+            if shard and used + cost + tree_cost > shard_tokens:
+                self.shards.append(shard)
+                shard = []
+                shard_dirs = set()
+                shown = set()
+                used = header + piece_cost(self._shard_heading()) + line_cost(self.root.name, 0)
+                tree_cost = subtree_cost(parts, shard_dirs)
+                reference, cost = False, full_cost
+            if not reference and rel_path not in self.diff_bases:
+                shown.add(original)
+            shard.append(rel_path)
+            shard_dirs.update("/".join(parts[:i]) for i in range(1, len(parts)))
+            used += cost + tree_cost
+        self.shards.append(shard)
+        self.stats["shards"] = len(self.shards)
+    
+    def _count_file_tokens(self, counter: TokenCounter) -> Dict[str, int]:
+        """Token count of every included file, cached per file and tokenizer."""
+        kind = f"tokens:{counter.name}" + (f":minified-v{MINIFY_VERSION}" if self.minify else "")
+        cache = self.cache
+        counts: Dict[str, int] = {}
+        missing: List[Tuple[FileEntry, str]] = []
+        for entry, rel_path in self.files_to_include:
+            cached = cache.get_fact(kind, rel_path, entry.stat) if cache is not None else None
+            if cached is not None:
+                counts[rel_path] = int(cached)
+            else:
+                missing.append((entry, rel_path))
+        
+        for (entry, rel_path), loaded in zip(missing, self._load_rendered(missing)):
+            counts[rel_path] = counter.count(loaded.content.rstrip())
+            if cache is not None and loaded.encoding and rel_path not in self.excerpts:
+                cache.put_fact(kind, rel_path, entry.stat, str(counts[rel_path]))
+        return counts
     
     def generate_snapshot(self) -> str:
         """Generate the complete snapshot string."""
-        parts: List[str] = []
+        return "".join(self.iter_snapshot())
+    
+    def iter_snapshot(self) -> Iterator[str]:
+        """
+        Yield the snapshot as a stream of text chunks.
+        
+        Only one file's content is held at a time, so the snapshot can be
+        written to its destination without ever existing as a single string.
+        """
+        return self._join_parts(self._iter_parts())
+    
+    def iter_shard(self, index: int) -> Iterator[str]:
+        """
+        Yield shard number index (see plan_shards) as a stream of text chunks.
         
+        The first shard carries the whole tree, the others the subtree of
+        their own files, so every shard stands on its own.
+        """
+        shard = set(self.shards[index])
+        files = [item for item in self.files_to_include if item[1] in shard]
+        title = f"{self.root.name} (part {index + 1} of {len(self.shards)})"
+        if index == 0:
+            return self._join_parts(self._iter_parts(files, title=title))
+        tree_lines, _ = render_path_tree(self.root.name, dict.fromkeys(self.shards[index], ""))
+        heading = self._shard_heading()
+        return self._join_parts(self._iter_parts(files, title, heading, tree_lines))
+    
+    def _shard_heading(self) -> str:
+        """Heading of the subtree drawn in every shard but the first."""
+        return f"{self.structure_heading} (files in this part)"
+    
+    @staticmethod
+    def _join_parts(parts: Iterator[str]) -> Iterator[str]:
+        yield next(parts)
+        for part in parts:
+            yield "\n"
+            yield part
+    
+    def _iter_parts(
+        self,
+        files: Optional[List[Tuple[FileEntry, str]]] = None,
+        title: Optional[str] = None,
+        heading: Optional[str] = None,
+        tree_lines: Optional[List[str]] = None,
+    ) -> Iterator[str]:
+        """Yield the snapshot's lines (file bodies as one part each)."""
         # Header
-        parts.append(f"# {self.root.name}")
-        parts.append("")
+        yield f"# {title or self.root.name}"
+        yield ""
         
         # Tree structure
-        parts.append("## Structure")
-        parts.append("")
-        parts.append("```")
-        parts.extend(self.tree_lines)
-        parts.append("```")
-        parts.append("")
+        yield f"## {heading or self.structure_heading}"
+        yield ""
+        yield "```"
+        yield from self.tree_lines if tree_lines is None else tree_lines
+        yield "```"
+        yield ""
         
         # File contents
-        if self.files_to_include:
-            parts.append("## Files")
-            parts.append("")
+        entries = self.iter_entries(files)
+        first = next(entries, None)
+        if first is not None:
+            yield "## Files"
+            yield ""
+            for entry in itertools.chain((first,), entries):
+                yield from self._markdown_block(entry)
+                yield ""
+    
+    def iter_entries(
+        self, files: Optional[List[Tuple[FileEntry, str]]] = None
+    ) -> Iterator[SnapshotEntry]:
+        """
+        Yield the files of the snapshot (all of them, or those of files) as
+        they are emitted: minified, truncated, diffed or deduplicated. Every
+        output format renders this same sequence.
+        """
+        plan = self.budget_plan
+        if files is None:
+            files = self.files_to_include
+        files = [item for item in files if plan.get(item[1]) != "omitted"]
+        # A duplicate is a reference to the first copy whose full content comes earlier in this
+        # same sequence; without one (left out, truncated, diffed) it carries the content
+        shown: Dict[str, str] = {}  # original -> first copy emitted in full
+        references: Dict[str, str] = {}
+        for _, rel_path in files:
+            original = self.duplicate_of.get(rel_path, rel_path)
+            if original in shown:
+                references[rel_path] = shown[original]
+            elif plan.get(rel_path) != "truncated" and rel_path not in self.diff_bases:
+                shown[original] = rel_path
+        loaded_files = self._load_rendered([item for item in files if item[1] not in references])
+        for _, rel_path in files:
+            if rel_path in references:
+                yield SnapshotEntry(rel_path, "duplicate", "", "", references[rel_path])
+                continue
             
-            for filepath, rel_path in self.files_to_include:
-                content = self.read_file(filepath).rstrip()
-                lang = self.get_lang_hint(filepath)
-                
-                parts.append(f"### {rel_path}")
-                parts.append(f"```{lang}")
-                parts.append(content)
-                parts.append("```")
-                parts.append("")
+            loaded = next(loaded_files)
+            with self._tally_lock:
+                self.encodings[loaded.encoding] += 1
+            content = loaded.content.rstrip()
+            base = self.diff_bases.get(rel_path)
+            if base is not None:
+                if self.minify:
+                    base = minify(base, loaded.lang)
+                diff = "\n".join(difflib.unified_diff(
+                    base.rstrip().splitlines(), content.splitlines(),
+                    f"a/{rel_path}", f"b/{rel_path}", n=DIFF_CONTEXT_LINES, lineterm="",
+                ))
+                yield SnapshotEntry(rel_path, "diff", "diff", loaded.encoding, diff)
+                continue
+            kind = "excerpt" if rel_path in self.excerpts else "file"
+            if plan.get(rel_path) == "truncated":
+                kind = "truncated"
+                content = self.token_counter.truncate(content, TRUNCATE_TOKENS)
+                content += (
+                    f"\n… [truncated: first ~{TRUNCATE_TOKENS:,} of "
+                    f"{self.file_tokens[rel_path]:,} tokens]"
+                )
+            if self.profile is not None:
+                tokens = TRUNCATE_TOKENS if kind == "truncated" else self.file_tokens.get(rel_path)
+                self.profile.file_chars[rel_path] = len(content)
+                self.profile.file_tokens[rel_path] = tokens if tokens is not None else estimate_tokens(content)
+            yield SnapshotEntry(rel_path, kind, loaded.lang, loaded.encoding, content)
+    
+    @staticmethod
+    def _markdown_block(entry: SnapshotEntry) -> Iterator[str]:
+        """The Markdown view of one entry."""
+        if entry.kind == "duplicate":
+            yield f"### {entry.rel_path}\n*Identical to `{entry.content}`.*"
+            return
+        if entry.kind == "diff":
+            yield f"### {entry.rel_path} (diff)"
+        else:
+            # Anything but plain UTF-8 is noted next to the path
+            note = "" if entry.encoding in ("utf-8", "") else f" ({entry.encoding})"
+            yield f"### {entry.rel_path}{note}"
+        yield f"```{entry.lang}"
+        yield entry.content
+        yield "```"
+    
+    def _expand_duplicate(self, rel_path: str) -> SnapshotEntry:
+        """A duplicate as a file of its own, with its content."""
+        item = next(item for item in self.files_to_include if item[1] == rel_path)
+        loaded = next(self._load_rendered([item]))
+        return SnapshotEntry(rel_path, "file", loaded.lang, loaded.encoding, loaded.content.rstrip())
+    
+    def _duplicate_block(self, rel_path: str) -> str:
+        """The stand-in emitted for a file identical to an earlier one."""
+        entry = SnapshotEntry(rel_path, "duplicate", "", "", self.duplicate_of[rel_path])
+        return next(self._markdown_block(entry))
+    
+    def _load_rendered(
+        self, files: Optional[List[Tuple[FileEntry, str]]] = None
+    ) -> Iterator[LoadedFile]:
+        """
+        Yield the files as they are rendered: _load_all, passed through the
+        minify stage when it is enabled (one file at a time, like the rest of
+        the pipeline). Records the tokens each file had before and after.
+        
+        Minified bodies are cached next to the raw ones, along with both token
+        counts, so an unchanged file is minified only once.
+        """
+        if not self.minify:
+            yield from self._load_all(files)
+            return
+        if files is None:
+            files = self.files_to_include
+        cache = self.cache
+        counter = self.token_counter
+        count = counter.count if counter is not None else estimate_tokens
+        kind = f"minify-v{MINIFY_VERSION}:{counter.name if counter is not None else 'estimate'}"
+        facts = [
+            cache.get_fact(kind, rel_path, entry.stat)
+            if cache is not None and cache.is_fresh(rel_path + MINIFIED_SUFFIX, entry.stat)
+            else None
+            for entry, rel_path in files
+        ]
+        raw_files = self._load_all([item for item, fact in zip(files, facts) if fact is None])
+        
+        for (entry, rel_path), fact in zip(files, facts):
+            minified = cache.load(rel_path + MINIFIED_SUFFIX) if fact is not None else None
+            if minified is not None:
+                before, after = map(int, fact.split())
+            else:
+                # (a cached body evicted by a concurrent run is read again)
+                loaded = next(raw_files if fact is None else self._load_all([(entry, rel_path)]))
+                with self.profile.phase("minify") if self.profile is not None else nullcontext():
+                    minified = loaded._replace(content=minify(loaded.content, loaded.lang))
+                before, after = count(loaded.content), count(minified.content)
+                if cache is not None and loaded.encoding and rel_path not in self.excerpts:
+                    cache.put(rel_path + MINIFIED_SUFFIX, entry.stat, minified)
+                    cache.put_fact(kind, rel_path, entry.stat, f"{before} {after}")
+            with self._tally_lock:
+                self.minify_report[rel_path] = (before, after)
+            yield minified
+    
+    def _load_all(
+        self, files: Optional[List[Tuple[FileEntry, str]]] = None
+    ) -> Iterator[LoadedFile]:
+        """
+        Yield the decoded files (default: files_to_include), in order.
         
-        return "\n".join(parts)
+        Files unchanged since the cached run are served from the cache; only
+        the rest are read (in parallel when enabled) and then stored back.
+        Large files yield the excerpt made by make_excerpts instead.
+        """
+        if files is None:
+            files = self.files_to_include
+        cache = self.cache
+        excerpts = self.excerpts
+        fresh = [
+            cache is not None and cache.is_fresh(rel_path, file_entry.stat)
+            for file_entry, rel_path in files
+        ]
+        misses = self._read_all(
+            file_entry.path
+            for (file_entry, rel_path), is_fresh in zip(files, fresh)
+            if not is_fresh and rel_path not in excerpts
+        )
+        
+        profile = self.profile
+        for (file_entry, rel_path), is_fresh in zip(files, fresh):
+            if rel_path in excerpts:
+                yield excerpts[rel_path]
+            elif profile is None:
+                yield self._load_one(file_entry, rel_path, is_fresh, misses)
+            else:
+                with profile.phase("read"):
+                    start = time.perf_counter()
+                    loaded = self._load_one(file_entry, rel_path, is_fresh, misses)
+                    profile.file_seconds[rel_path] += time.perf_counter() - start
+                yield loaded
+    
+    def _load_one(
+        self,
+        file_entry: FileEntry,
+        rel_path: str,
+        is_fresh: bool,
+        misses: Iterator[Tuple[str, str]],
+    ) -> LoadedFile:
+        """One step of _load_all: serve a file from the cache or take the next read."""
+        cache = self.cache
+        if is_fresh:
+            hit = cache.load(rel_path)
+            if hit is not None:
+                return hit
+            # Evicted by a concurrent run since the index was loaded
+            content, encoding = self.decode_file(file_entry.path)
+        else:
+            content, encoding = next(misses)
+        with self._tally_lock:
+            self.stats["read"] = self.stats.get("read", 0) + 1
+            if file_entry.stat is not None:
+                self.stats["bytes_read"] = self.stats.get("bytes_read", 0) + file_entry.stat.st_size
+        loaded = LoadedFile(content, self.get_lang_hint(file_entry.path), encoding)
+        if cache is not None and encoding:
+            cache.put(rel_path, file_entry.stat, loaded)
+        return loaded
+    
+    def _read_all(self, paths: Iterable[Path]) -> Iterator[Tuple[str, str]]:
+        """Yield (content, encoding) for each of paths, in order."""
+        paths = list(paths)
+        
+        if self.jobs <= 1 or not paths:
+            yield from map(self.decode_file, paths)
+            return
+        
+        # Threads overlap the I/O waits; processes also spread the decoding across cores
+        if self.use_processes:
+            with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+                yield from bounded_map(executor, Scanner.decode_file, paths, self.jobs * 4)
+        else:
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                yield from bounded_map(executor, Scanner.decode_file, paths, self.jobs * 4)
+
+
+HASH_NAME = "xxh3_128" if xxhash is not None else "blake2b"
+
+
+def hash_file(path: Path) -> Optional[str]:
+    """Fast content hash of a file's bytes (None if it cannot be read)."""
+    digest = xxhash.xxh3_128() if xxhash is not None else hashlib.blake2b(digest_size=16)
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def render_path_tree(root_name: str, markers: Dict[str, str]) -> Tuple[List[str], Dict[str, int]]:
+    """
+    Render a condensed tree holding only the given paths, each followed by its
+    marker (if not empty). Returns the tree lines and the row of each path within them.
+    
+    Directories come before files, both sorted case-insensitively, as in scan().
+    """
+    root: dict = {}
+    for rel_path in markers:
+        node = root
+        for part in Path(rel_path).parts:
+            node = node.setdefault(part, {})
+    
+    lines = [f"{root_name}/"]
+    rows: Dict[str, int] = {}
+    
+    def render(node: dict, prefix: str, parent: str) -> None:
+        dirs = sorted((name for name in node if node[name]), key=lambda name: (name.lower(), name))
+        files = sorted((name for name in node if not node[name]), key=lambda name: (name.lower(), name))
+        total = len(dirs) + len(files)
+        for i, name in enumerate(dirs + files):
+            is_last = (i == total - 1)
+            connector = "└── " if is_last else "├── "
+            rel_path = f"{parent}/{name}" if parent else name
+            if i < len(dirs):
+                lines.append(f"{prefix}{connector}{name}/")
+                render(node[name], prefix + ("    " if is_last else "│   "), rel_path)
+            else:
+                marker = f" [{markers[rel_path]}]" if markers[rel_path] else ""
+                lines.append(f"{prefix}{connector}{name}{marker}")
+                rows[rel_path] = len(lines) - 1
+    
+    render(root, "", "")
+    return lines, rows
+
+
+def load_manifest(path: Path) -> dict:
+    """Read a manifest written by a previous run."""
+    manifest = json.loads(path.read_text(encoding="utf-8"))
+    if manifest.get("version") != MANIFEST_VERSION or manifest.get("hash") != HASH_NAME:
+        raise ValueError(f"{path} was written by an incompatible scanner")
+    return manifest
+
+
+def write_manifest(path: Path, manifest: dict) -> None:
+    """Write a manifest atomically, so a failed run never leaves half of one."""
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=1) + "\n", encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def bounded_map(executor: Executor, fn: Callable, items: List, window: int) -> Iterator:
+    """
+    Order-preserving executor map with at most `window` results in flight,
+    so a slow consumer never lets finished results pile up in memory.
+    """
+    futures = deque()
+    items_iter = iter(items)
+    for item in itertools.islice(items_iter, window):
+        futures.append(executor.submit(fn, item))
+    while futures:
+        result = futures.popleft().result()
+        for item in itertools.islice(items_iter, 1):
+            futures.append(executor.submit(fn, item))
+        yield result
+
+
+class SnapshotStats:
+    """Line, character and token counts accumulated while a snapshot streams by."""
+    
+    def __init__(self, counter: Optional[TokenCounter] = None):
+        # Only a real tokenizer is worth running per chunk; estimates use the total
+        self.counter = counter if counter is not None and counter.exact else None
+        self.chars = 0
+        self.newlines = 0
+        self._tokens = 0
+    
+    def count(self, chunks: Iterable[str]) -> Iterator[str]:
+        """Pass chunks through unchanged, counting them. Restarts the tally."""
+        self.reset()
+        for chunk in chunks:
+            self.add(chunk)
+            yield chunk
+    
+    def add(self, chunk: str) -> None:
+        self.chars += len(chunk)
+        self.newlines += chunk.count("\n")
+        if self.counter is not None:
+            self._tokens += self.counter.count(chunk)
+    
+    def reset(self) -> None:
+        self.chars = 0
+        self.newlines = 0
+        self._tokens = 0
+    
+    @classmethod
+    def combined(cls, parts: List["SnapshotStats"], counter: Optional[TokenCounter] = None):
+        """The totals over several outputs (e.g. the shards of one snapshot)."""
+        total = cls(counter)
+        total.chars = sum(part.chars for part in parts)
+        total.newlines = sum(part.lines for part in parts) - 1
+        total._tokens = sum(part._tokens for part in parts)
+        return total
+    
+    @property
+    def lines(self) -> int:
+        return self.newlines + 1
+    
+    @property
+    def tokens(self) -> int:
+        if self.counter is not None:
+            return self._tokens
+        # Same chars / 4 approximation as estimate_tokens
+        return self.chars // 4
+
+
+def shard_path(output: Path, number: int) -> Path:
+    """File name of shard number (counting from 1) of output."""
+    return output.with_name(
+        SHARD_NAME_FORMAT.format(stem=output.stem, number=number, suffix=output.suffix)
+    )
+
+
+def shard_index_path(output: Path) -> Path:
+    """File name of the index of the shards of output."""
+    return output.with_name(output.stem + SHARD_INDEX_SUFFIX)
+
+
+def shard_name_regex(output: Path) -> str:
+    """Regex matching the file name of every shard of output, whatever its number."""
+    fields = {"stem": re.escape(output.stem), "suffix": re.escape(output.suffix), "number": r"\d+"}
+    return "".join(
+        re.escape(literal) + (fields[field] if field is not None else "")
+        for literal, field, _, _ in string.Formatter().parse(SHARD_NAME_FORMAT)
+    )
+
+
+def write_shards(
+    scanner: Scanner, output: Path, counter: Optional[TokenCounter] = None
+) -> Tuple[List[SnapshotStats], Path]:
+    """
+    Write the shards planned by scanner.plan_shards next to output, in parallel
+    (with --jobs), plus an index of the paths in each. Shards left over from an
+    earlier run with more of them are removed.
+    
+    Returns the stats of each shard and the path of the index.
+    """
+    paths = [shard_path(output, n) for n in range(1, len(scanner.shards) + 1)]
+    stats = [SnapshotStats(counter) for _ in paths]
+    
+    def write(index: int) -> None:
+        with open(paths[index], "w", encoding="utf-8") as f:
+            f.writelines(stats[index].count(scanner.iter_shard(index)))
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(scanner.jobs, len(paths)))) as executor:
+        list(executor.map(write, range(len(paths))))
+    
+    number = len(paths) + 1
+    while shard_path(output, number).exists():
+        shard_path(output, number).unlink()
+        number += 1
+    
+    index = {
+        "root": str(scanner.root),
+        "shards": [
+            {"file": path.name, "tokens": shard_stats.tokens, "paths": shard}
+            for path, shard_stats, shard in zip(paths, stats, scanner.shards)
+        ],
+        "paths": {
+            rel_path: path.name for path, shard in zip(paths, scanner.shards) for rel_path in shard
+        },
+    }
+    index_path = shard_index_path(output)
+    index_path.write_text(json.dumps(index, indent=1) + "\n", encoding="utf-8")
+    return stats, index_path
+
+
+def pack_codec(name: str) -> Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+    """(compress, decompress) of a pack's block compression."""
+    if name == "none":
+        return bytes, bytes
+    if name == "gzip":
+        return (lambda data: gzip.compress(data, mtime=0)), gzip.decompress
+    if name == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package")
+        return zstandard.ZstdCompressor().compress, zstandard.ZstdDecompressor().decompress
+    raise ValueError(f"unknown compression: {name!r}")
+
+
+def write_pack(
+    scanner: Scanner,
+    output: Path,
+    compression: str = PACK_COMPRESSION,
+    counter: Optional[TokenCounter] = None,
+) -> SnapshotStats:
+    """
+    Write the snapshot as a pack, a container that tools can pull single
+    files out of without parsing Markdown (see PackReader).
+    
+    Layout: PACK_MAGIC, then length-prefixed blocks (a little-endian uint32
+    length, then that many bytes, each block compressed on its own), then a
+    trailer holding the offset and length of the index block (uint64, uint32)
+    and PACK_MAGIC again. The index is an uncompressed JSON block that lists
+    the structure block and every file with the offset, length and
+    uncompressed size of its body; duplicates point at the block of the file
+    they repeat. The pack is written atomically.
+    
+    Returns the stats of the packed text (the tree and the bodies).
+    """
+    compress, _ = pack_codec(compression)
+    stats = SnapshotStats(counter)
+    blocks: Dict[str, dict] = {}
+    files: List[dict] = []
+    tmp = output.with_name(output.name + ".tmp")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(PACK_MAGIC)
+            
+            def put(data: bytes) -> dict:
+                f.write(struct.pack("<I", len(data)))
+                block = {"offset": f.tell(), "length": len(data)}
+                f.write(data)
+                return block
+            
+            def put_text(text: str) -> dict:
+                stats.add(text)
+                raw = text.encode("utf-8")
+                return dict(put(compress(raw)), size=len(raw))
+            
+            structure = put_text("\n".join(scanner.tree_lines))
+            for entry in scanner.iter_entries():
+                if entry.kind == "duplicate" and entry.content not in blocks:
+                    # Only point at blocks in this pack; otherwise the copy brings its own
+                    entry = scanner._expand_duplicate(entry.rel_path)
+                item = {"path": entry.rel_path, "kind": entry.kind}
+                if entry.kind == "duplicate":
+                    item["duplicate_of"] = entry.content
+                    item.update(blocks[entry.content])
+                else:
+                    item.update(lang=entry.lang, encoding=entry.encoding)
+                    item.update(put_text(entry.content))
+                    blocks[entry.rel_path] = {k: item[k] for k in ("offset", "length", "size")}
+                files.append(item)
+            
+            index = {
+                "version": PACK_VERSION,
+                "root": scanner.root.name,
+                "compression": compression,
+                "structure": dict(structure, heading=scanner.structure_heading),
+                "files": files,
+            }
+            block = put(json.dumps(index, separators=(",", ":")).encode("utf-8"))
+            f.write(struct.pack("<QI", block["offset"], block["length"]) + PACK_MAGIC)
+        os.replace(tmp, output)
+    except BaseException:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+        raise
+    return stats
+
+
+class PackReader:
+    """
+    Random access to a pack written by write_pack: the index is read from the
+    trailer, then every body is one seek and one read away.
+    """
+    
+    TRAILER = struct.Struct("<QI")
+    
+    def __init__(self, path: Path):
+        self._file = open(path, "rb")
+        try:
+            self._file.seek(0, os.SEEK_END)
+            if self._file.tell() < 2 * len(PACK_MAGIC) + self.TRAILER.size:
+                raise ValueError(f"not a snapshot pack: {path}")
+            self._file.seek(-(self.TRAILER.size + len(PACK_MAGIC)), os.SEEK_END)
+            trailer = self._file.read()
+            if trailer[self.TRAILER.size:] != PACK_MAGIC:
+                raise ValueError(f"not a snapshot pack: {path}")
+            offset, length = self.TRAILER.unpack(trailer[:self.TRAILER.size])
+            self.index = json.loads(self._read(offset, length))
+            if self.index.get("version") != PACK_VERSION:
+                raise ValueError(f"unsupported pack version {self.index.get('version')}: {path}")
+            _, self._decompress = pack_codec(self.index["compression"])
+        except BaseException:
+            self._file.close()
+            raise
+        self.files: Dict[str, dict] = {item["path"]: item for item in self.index["files"]}
+    
+    def _read(self, offset: int, length: int) -> bytes:
+        self._file.seek(offset)
+        return self._file.read(length)
+    
+    def _text(self, block: dict) -> str:
+        return self._decompress(self._read(block["offset"], block["length"])).decode("utf-8")
+    
+    def structure(self) -> str:
+        """The directory tree, as drawn in the Markdown snapshot."""
+        return self._text(self.index["structure"])
+    
+    def read(self, rel_path: str) -> str:
+        """The body of one file as the snapshot emitted it (KeyError if not packed)."""
+        item = self.files[rel_path]
+        if "offset" not in item:
+            raise ValueError(f"no content for {rel_path} in this pack (index entry without a block)")
+        return self._text(item)
+    
+    def close(self) -> None:
+        self._file.close()
+    
+    def __enter__(self) -> "PackReader":
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class Profile:
+    """
+    Wall time per phase of a run and, when enabled, what each file cost
+    (--profile, --stats-json).
+    
+    Phases nest, and each records its exclusive time: reads that happen while
+    rendering count as "read", not "render". Timing a phase costs two clock
+    reads; the per-file accounting (and timing the render stream chunk by
+    chunk) only happens when enabled.
+    """
+    
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = Lock()
+        self._stacks = local()
+        self.reset()
+    
+    def reset(self) -> None:
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.file_seconds: Dict[str, float] = defaultdict(float)
+        self.file_chars: Dict[str, int] = {}
+        self.file_tokens: Dict[str, int] = {}  # as rendered (estimated without a counter)
+    
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        stack = self._stacks.__dict__.setdefault("stack", [])
+        stack.append(0.0)  # time spent in nested phases
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.0) + elapsed - nested
+    
+    def timed(self, name: str, chunks: Iterable[str]) -> Iterator[str]:
+        """Pass chunks through, counting the time spent producing them as phase name."""
+        chunks = iter(chunks)
+        while True:
+            with self.phase(name):
+                chunk = next(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+
+# Module specifiers of TS/JS imports, re-exports, require() and dynamic import()
+_JS_IMPORT = re.compile(
+    r"""(?:\bimport\s*\(|\brequire\s*\(|\bfrom|\bimport)\s*(['"`])([^'"`\n]+)\1"""
+)
+
+
+def parse_imports(content: str, lang: str) -> list:
+    """
+    The imports of a source file, in source order: TS/JS module specifiers as
+    written, Python imports as [module, [names]] (module with its leading dots
+    for relative imports, names only for "from module import names").
+    """
+    if lang != "python":
+        return [match.group(2) for match in _JS_IMPORT.finditer(content)]
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")  # e.g. invalid escape sequences
+            tree = ast.parse(content)
+    except (SyntaxError, ValueError):
+        return []
+    found = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            found.extend((node.lineno, [alias.name, []]) for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            names = [alias.name for alias in node.names if alias.name != "*"]
+            found.append((node.lineno, ["." * node.level + (node.module or ""), names]))
+    found.sort(key=lambda item: item[0])
+    return [spec for _, spec in found]
+
+
+def resolve_js_import(importer: str, spec: str, known: Set[str]) -> List[str]:
+    """The included file a TS/JS import of importer refers to (none for packages)."""
+    spec = spec.split("?", 1)[0]
+    if spec.startswith("."):
+        bases = [posixpath.join(posixpath.dirname(importer), spec)]
+    elif spec.startswith("/"):
+        bases = [spec.lstrip("/")]
+    else:
+        bases = [posixpath.join(root, spec) for root in IMPORT_ROOTS]
+    for base in bases:
+        base = posixpath.normpath(base)
+        if base.startswith(".."):
+            continue
+        candidates = [base, *(base + ext for ext in JS_RESOLVE_EXTENSIONS)]
+        stem, ext = posixpath.splitext(base)
+        if ext in (".js", ".jsx", ".mjs", ".cjs"):
+            # TypeScript sources are imported by the name of their compiled output
+            candidates += [stem + ts_ext for ts_ext in (".ts", ".tsx", ".mts", ".cts")]
+        candidates += [posixpath.join(base, "index" + ext) for ext in JS_RESOLVE_EXTENSIONS]
+        for candidate in candidates:
+            if candidate in known:
+                return [candidate]
+    return []
+
+
+def resolve_python_import(
+    importer: str, module: str, names: List[str], roots: List[str], known: Set[str]
+) -> List[str]:
+    """
+    The included files a Python import of importer loads: the packages on
+    the way (their __init__.py), the module, and any names that are submodules.
+    """
+    level = len(module) - len(module.lstrip("."))
+    parts = [part for part in module[level:].split(".") if part]
+    if level:
+        base = posixpath.dirname(importer)
+        for _ in range(level - 1):
+            base = posixpath.dirname(base)
+        bases = [base]
+    else:
+        bases = roots
+    for base in bases:
+        found = []
+        path = base
+        for part in ([""] if level else []) + parts:
+            path = posixpath.join(path, part) if part else path
+            init = posixpath.join(path, "__init__.py")
+            if init in known and init != importer:
+                found.append(init)
+        if parts and path + ".py" in known:
+            found.append(path + ".py")
+        if not found and not level:
+            continue
+        for name in names:
+            submodule = posixpath.join(path, name)
+            for candidate in (submodule + ".py", posixpath.join(submodule, "__init__.py")):
+                if candidate in known:
+                    found.append(candidate)
+                    break
+        return found
+    return []
+
+
+# Byte order marks, longest first (the UTF-32 LE mark starts with the UTF-16 LE one)
+BOMS: Tuple[Tuple[bytes, str], ...] = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+# The BOMs of encodings whose text is full of NUL bytes
+_WIDE_BOMS: Tuple[bytes, ...] = tuple(bom for bom, _ in BOMS if bom != codecs.BOM_UTF8)
+
+
+# Control characters that do not occur in text (everything below 0x20 but \t \n \f \r ESC)
+_TEXT_CONTROLS = frozenset(b"\t\n\f\r\x1b")
+_BINARY_CONTROLS = bytes(c for c in range(32) if c not in _TEXT_CONTROLS)
+
+
+def sniff_binary(head: bytes) -> bool:
+    """
+    Decide from a file's first bytes whether it is binary.
+    
+    Known magic numbers and NUL bytes are conclusive (unless a UTF-16/32 BOM
+    explains the NULs); otherwise the share of control characters and of bytes
+    that are not valid UTF-8 is compared against SNIFF_BINARY_RATIO.
+    """
+    if not head:
+        return False
+    if head.startswith(BINARY_MAGIC):
+        return True
+    if head.startswith(_WIDE_BOMS):
+        return False
+    if b"\x00" in head:
+        return True
+    
+    controls = len(head) - len(head.translate(None, _BINARY_CONTROLS))
+    # The probe may end inside a multi-byte sequence; don't count that as invalid
+    text = codecs.getincrementaldecoder("utf-8")("replace").decode(head, final=False)
+    invalid = text.count("\ufffd")
+    return (controls + invalid) / len(head) > SNIFF_BINARY_RATIO
+
+
+# Lexical patterns for minify(): literals match in a group and survive, comments
+# match without one and are dropped. A comment on a line of its own takes the
+# line break before it along, so no blank line is left behind. Every top-level
+# alternative starts with a literal character (a group or a character class
+# there would hide it), which lets the regex engine skip ahead to the next
+# candidate instead of trying every position.
+_DQ_STRING = r'"[^"\\\n]*(?:\\.[^"\\\n]*)*"'
+_SQ_STRING = r"'[^'\\\n]*(?:\\.[^'\\\n]*)*'"
+_TRIPLE_DQ_STRING = r'"""[^"]*(?:"(?!"")[^"]*)*"""'
+_TRIPLE_SQ_STRING = r"'''[^']*(?:'(?!'')[^']*)*'''"
+_TEMPLATE_STRING = r"`(?:\\[\s\S]|[^`\\])*`"
+# Regex literals (only after an operator, unlike division) may hold // or /*
+_REGEX_OPERATORS = "(,=:[!&|?{};"
+_REGEX_LITERAL = r"[ \t]*/(?![/*])(?:\\.|\[(?:\\.|[^\]\\\n])*\]|[^/\\\n\[])+/[a-z]*"
+_BLOCK_COMMENT = r"/\*[^*]*\*+(?:[^/*][^*]*\*+)*/"
+_LINE_END = r"(?=[ \t]*(?:\n|$))"
+_C_COMMENTS = (
+    rf"\n[ \t]*(?://[^\n]*|{_BLOCK_COMMENT}{_LINE_END})"
+    # ... but not the // of an unquoted url(http://...)
+    rf"|/(?<!:/)/[^\n]*|{_BLOCK_COMMENT}"
+)
+
+
+def _keep(*literals: str) -> str:
+    """Alternatives for literals, each grouped after its first character (or escape)."""
+    heads = [2 if literal.startswith("\\") else 1 for literal in literals]
+    return "|".join(
+        f"{literal[:head]}({literal[head:]})" for literal, head in zip(literals, heads)
+    )
+
+
+_MINIFY_PATTERNS: Dict[str, "re.Pattern[str]"] = {
+    "script": re.compile(
+        rf"{_C_COMMENTS}|" + _keep(_DQ_STRING, _SQ_STRING, _TEMPLATE_STRING, *(
+            re.escape(operator) + _REGEX_LITERAL for operator in _REGEX_OPERATORS
+        ))
+    ),
+    "c": re.compile(rf"{_C_COMMENTS}|" + _keep(_DQ_STRING, _SQ_STRING, "`[^`]*`")),
+    "css": re.compile(
+        rf"\n[ \t]*{_BLOCK_COMMENT}{_LINE_END}|{_BLOCK_COMMENT}|" + _keep(_DQ_STRING, _SQ_STRING)
+    ),
+    # Outside a string every # is a comment (a shebang stays)
+    "python": re.compile(
+        r"\n[ \t]*#[^\n]*|#(?!!)[^\n]*|"
+        + _keep(_TRIPLE_DQ_STRING, _TRIPLE_SQ_STRING, _DQ_STRING, _SQ_STRING)
+    ),
+    # Only a # at a line start or after whitespace is a comment (not in ${#a} or url#frag)
+    "hash": re.compile(r"\n[ \t]*#[^\n]*| #[^\n]*|\t#[^\n]*|" + _keep(_DQ_STRING, _SQ_STRING)),
+    "markup": re.compile(
+        rf"\n[ \t]*<!--[\s\S]*?-->{_LINE_END}|<!--[\s\S]*?-->|" + _keep(r"<!\[CDATA\[[\s\S]*?\]\]>")
+    ),
+    "sql": re.compile(
+        rf"\n[ \t]*(?:--[^\n]*|{_BLOCK_COMMENT}{_LINE_END})|--[^\n]*|{_BLOCK_COMMENT}|"
+        + _keep("'[^']*'", '"[^"]*"')
+    ),
+}
+# Substrings a file must contain for the pattern of its style to remove anything
+_COMMENT_MARKERS: Dict[str, Tuple[str, ...]] = {
+    "script": ("//", "/*"),
+    "c": ("//", "/*"),
+    "css": ("/*",),
+    "python": ("#",),
+    "hash": ("#",),
+    "markup": ("<!--",),
+    "sql": ("--", "/*"),
+}
+_BLANK_RUNS = re.compile(r"\n\n\n+")
+_LONG_LITERAL = re.compile(r"[A-Za-z0-9+/]{%d,}={0,2}" % MINIFY_LONG_LITERAL)
+
+
+def _keep_literal(match: "re.Match[str]") -> str:
+    return match[0] if match.lastindex else ""
+
+
+def minify(content: str, lang: str) -> str:
+    """
+    Strip comments and collapse whitespace, for the comment syntax of lang.
+
+    Lexical, not a parser: string (and JS template/regex) literals are skipped
+    so comment markers inside them survive, and indentation is kept. Trailing
+    whitespace goes, blank-line runs shrink to one and long base64 runs are
+    replaced by a note of their length. The passes a file does not need are
+    skipped after a cheap substring check.
+    """
+    style = MINIFY_STYLES.get(lang, "")
+    pattern = _MINIFY_PATTERNS.get(style)
+    if pattern is not None:
+        if any(marker in content for marker in _COMMENT_MARKERS[style]):
+            content = pattern.sub(_keep_literal, content)
+        content = content.lstrip("\n")
+    lines = content.split("\n")
+    if " \n" in content or "\t\n" in content:
+        # Line by line: a regex would try every space in the file as the start of a run
+        lines[:-1] = [line.rstrip(" \t") for line in lines[:-1]]
+        content = "\n".join(lines)
+    if "\n\n\n" in content:
+        content = _BLANK_RUNS.sub("\n\n", content)
+    if max(map(len, lines)) >= MINIFY_LONG_LITERAL:
+        content = _LONG_LITERAL.sub(lambda m: f"…[{len(m.group()):,} base64 chars]", content)
+    return content
+
+
+def decode_bytes(buf) -> Tuple[str, str]:
+    """
+    Decode a file's bytes (any buffer, e.g. an mmap) without copying it first.
+    Returns: (text, encoding used)
+    
+    A BOM picks the first encoding to try, strict UTF-8 otherwise, followed by
+    FALLBACK_ENCODINGS, all on the same buffer. Newlines are normalized to "\\n"
+    like text-mode reads.
+    """
+    head = buf[:4]
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            break
+    else:
+        encoding = "utf-8"
+    
+    for encoding in (encoding, *FALLBACK_ENCODINGS):
+        try:
+            text = str(buf, encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        return "[Unable to decode file]", ""
+    
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text, encoding
+
+
+def excerpt_file(path: Path, pattern: Optional["re.Pattern[bytes]"] = None) -> Tuple[str, str]:
+    """
+    Excerpt a large text file: its first EXCERPT_HEAD_LINES and last
+    EXCERPT_TAIL_LINES lines and, with a pattern, up to EXCERPT_MAX_MATCHES
+    lines in between that match it. Returns: (excerpt, encoding) like decode_file.
+
+    The file is memory-mapped and only the kept lines are copied out; matching
+    and counting lines scan the mapping in place (counting a chunk at a time),
+    so the file is never read into memory as a whole.
+    """
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return _excerpt_mapping(buf, pattern)
+    except (OSError, ValueError) as e:
+        return f"[Error reading file: {e}]", ""
+
+
+def _excerpt_line(buf: mmap.mmap, start: int, end: int) -> bytes:
+    """One line of buf (without its line break), cut off past EXCERPT_LINE_BYTES."""
+    if end - start <= EXCERPT_LINE_BYTES:
+        return buf[start:end]
+    cut = start + EXCERPT_LINE_BYTES
+    while cut > start and buf[cut] & 0xC0 == 0x80:  # not inside a UTF-8 sequence
+        cut -= 1
+    return buf[start:cut] + " …".encode("utf-8")
+
+
+def _count_lines(buf: mmap.mmap, start: int, end: int) -> int:
+    """Line breaks in buf[start:end], counted a chunk at a time."""
+    step = 1 << 20
+    return sum(buf[i:min(i + step, end)].count(b"\n") for i in range(start, end, step))
+
+
+def _excerpt_mapping(buf: mmap.mmap, pattern: Optional["re.Pattern[bytes]"]) -> Tuple[str, str]:
+    size = len(buf)
+
+    head: List[bytes] = []
+    pos = 0
+    while pos < size and len(head) < EXCERPT_HEAD_LINES:
+        end = buf.find(b"\n", pos)
+        end = size if end < 0 else end
+        head.append(_excerpt_line(buf, pos, end))
+        pos = end + 1
+    head_end = min(pos, size)
+
+    tail: List[bytes] = []
+    end = size - 1 if buf[size - 1] == 0x0A else size
+    while end > head_end and len(tail) < EXCERPT_TAIL_LINES:
+        start = buf.rfind(b"\n", head_end, end) + 1 or head_end
+        tail.append(_excerpt_line(buf, start, end))
+        end = start - 1
+    tail.reverse()
+    tail_start = end + 1 if tail else head_end
+
+    matches: List[Tuple[int, bytes]] = []
+    if pattern is not None:
+        line_no = len(head) + 1
+        counted = head_end
+        pos = head_end
+        while pos < tail_start and len(matches) < EXCERPT_MAX_MATCHES:
+            m = pattern.search(buf, pos, tail_start)
+            if m is None:
+                break
+            start = buf.rfind(b"\n", 0, m.start()) + 1
+            end = buf.find(b"\n", m.start(), tail_start)
+            end = tail_start if end < 0 else end
+            line_no += _count_lines(buf, counted, start)
+            counted = start
+            matches.append((line_no, _excerpt_line(buf, start, end)))
+            pos = end + 1
+
+    if tail_start <= head_end:
+        # Nothing hidden: the tail, if any, picks up right after the head
+        return decode_bytes(b"\n".join(head + tail))
+    text, encoding = decode_bytes(b"\n".join(head))
+
+    first_hidden = len(head) + 1
+    last_hidden = first_hidden + _count_lines(buf, head_end, tail_start) - 1
+    total = last_hidden + len(tail)
+    parts = [text]
+    if matches:
+        parts.append(
+            f"… [lines {first_hidden:,}–{last_hidden:,} of {total:,} not shown, "
+            f"except {len(matches)} matching] …"
+        )
+        for line_no, line in matches:
+            parts.append(f"{line_no}: {decode_bytes(line)[0]}")
+        parts.append("…")
+    else:
+        parts.append(f"… [lines {first_hidden:,}–{last_hidden:,} of {total:,} not shown] …")
+    parts.append(decode_bytes(b"\n".join(tail))[0])
+    return "\n".join(parts), encoding
+
+
+class InotifyWatcher:
+    """Directory change notifications from Linux inotify (through libc via ctypes)."""
+    
+    IN_MODIFY = 0x002
+    IN_ATTRIB = 0x004
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_MOVE_SELF = 0x800
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ONLYDIR = 0x01000000
+    MASK = (
+        IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+        | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+    )
+    _EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+    
+    def __init__(self, skip: Optional[Callable[[Path], bool]] = None):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        self.skip = skip  # events about paths it accepts are dropped (the run's own outputs)
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # One watch descriptor can stand for several paths (symlinked directories)
+        self._dirs: Dict[int, Set[Path]] = defaultdict(set)
+        self._watched: Dict[Path, int] = {}
+    
+    def watch(self, directories: Iterable[Path]) -> None:
+        """Start watching any of directories not watched yet."""
+        for directory in directories:
+            if directory in self._watched:
+                continue
+            wd = self._libc.inotify_add_watch(
+                self._fd, os.fsencode(directory), self.MASK
+            )
+            if wd < 0:
+                errno = ctypes.get_errno()
+                if errno == 28:  # ENOSPC: out of watches (fs.inotify.max_user_watches)
+                    raise OSError(errno, "inotify watch limit reached")
+                continue  # vanished or unreadable in the meantime
+            self._dirs[wd].add(directory)
+            self._watched[directory] = wd
+    
+    def wait(self, timeout: Optional[float]) -> Optional[Set[Path]]:
+        """
+        Block up to timeout for events; return the directories whose contents
+        changed (empty on timeout), or None if events were lost and everything
+        must be rescanned.
+        """
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed: Set[Path] = set()
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = self._EVENT.unpack_from(data, offset)
+                offset += self._EVENT.size + length
+                if mask & self.IN_Q_OVERFLOW:
+                    return None
+                directories = self._dirs.get(wd)
+                if not directories:
+                    continue
+                if mask & self.IN_IGNORED:
+                    for directory in self._dirs.pop(wd):
+                        self._watched.pop(directory, None)
+                    continue
+                if length and self.skip is not None:
+                    start = offset - length
+                    name = os.fsdecode(data[start:offset].rstrip(b"\0"))
+                    if all(self.skip(directory / name) for directory in directories):
+                        continue
+                changed |= directories
+                if mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF):
+                    changed.update(directory.parent for directory in directories)
+        return changed
+    
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """
+    Portable fallback: periodically stat the watched directories and files.
+    
+    A directory whose mtime moved is only reported if its entries, other than
+    the files the run writes itself (see Scanner.writes), did change.
+    """
+    
+    def __init__(self, scanner: "Scanner", interval: float = WATCH_POLL_SECONDS):
+        self.scanner = scanner
+        self.interval = interval
+        self._seen = self._sweep()
+        self._names: Dict[Path, Optional[Set[str]]] = {
+            directory: self._list(directory) for directory in scanner.watched_dirs()
+        }
+    
+    def _list(self, directory: Path) -> Optional[Set[str]]:
+        """Names in directory, without the run's own outputs (None if unreadable)."""
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return None
+        return {name for name in names if not self.scanner.writes(directory / name)}
+    
+    def _entries_changed(self, directory: Path) -> bool:
+        names = self._list(directory)
+        previous = self._names.get(directory)
+        self._names[directory] = names
+        return names is None or names != previous
+    
+    def _sweep(self) -> Dict[Path, Tuple[int, int, int]]:
+        signatures: Dict[Path, Tuple[int, int, int]] = {}
+        for directory in self.scanner.watched_dirs():
+            try:
+                signatures[directory] = SnapshotCache.signature(os.stat(directory))
+            except OSError:
+                continue
+        for entry, _ in self.scanner.files_to_include:
+            try:
+                signatures[entry.path] = SnapshotCache.signature(os.stat(entry.path))
+            except OSError:
+                continue
+        return signatures
+    
+    def watch(self, directories: Iterable[Path]) -> None:
+        """Nothing to register: every sweep covers the scanner's current tree."""
+    
+    def wait(self, timeout: Optional[float]) -> Optional[Set[Path]]:
+        """Sleep for one interval (or timeout), then report what changed since the last sweep."""
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        current = self._sweep()
+        changed: Set[Path] = set()
+        for path in current.keys() | self._seen.keys():
+            if current.get(path) != self._seen.get(path):
+                # A directory's own mtime moves when entries are added or removed
+                if path in self.scanner._listings:
+                    if self._entries_changed(path):
+                        changed.add(path)
+                else:
+                    changed.add(path.parent)
+        self._seen = current
+        return changed
+    
+    def close(self) -> None:
+        pass
+
+
+def watch_and_regenerate(
+    scanner: "Scanner",
+    regenerate: Callable[[], None],
+    log: Callable[..., None],
+) -> None:
+    """
+    Keep the scanner's tree in memory and regenerate the output after every
+    burst of changes, re-listing only the directories that changed. Runs until
+    interrupted.
+    """
+    try:
+        watcher = InotifyWatcher(skip=scanner.writes)
+        watcher.watch(scanner.watched_dirs())
+        log("👀 Watching for changes (inotify). Press Ctrl+C to stop.")
+    except OSError:
+        watcher = PollingWatcher(scanner)
+        log(f"👀 Watching for changes (polling every {WATCH_POLL_SECONDS:g}s). Press Ctrl+C to stop.")
+    
+    try:
+        while True:
+            changed = watcher.wait(None)
+            if changed is not None and not changed:
+                continue
+            # Debounce: keep collecting until the burst goes quiet
+            while changed is not None:
+                more = watcher.wait(WATCH_DEBOUNCE_SECONDS)
+                if more is None:
+                    changed = None
+                elif not more:
+                    break
+                else:
+                    changed |= more
+            
+            started = time.perf_counter()
+            try:
+                if changed is not None:
+                    scanner.refresh(changed)
+            except OSError:
+                changed = None  # the tree moved under the refresh
+            if changed is None:
+                # Events were lost (or the refresh failed): start over from a full walk
+                scanner._listings = {}
+                scanner.scan()
+            regenerate()
+            watcher.watch(scanner.watched_dirs())
+            elapsed = (time.perf_counter() - started) * 1000
+            what = "everything" if changed is None else f"{len(changed)} dir(s)"
+            log(f"🔄 {time.strftime('%H:%M:%S')} regenerated after changes in {what} ({elapsed:.0f} ms)")
+    except KeyboardInterrupt:
+        log()
+        log("👋 Stopped watching.")
+    finally:
+        watcher.close()
+
+
+class WarmScanner:
+    """
+    A Scanner the daemon keeps in memory for one root and set of scan
+    options, with a watcher telling it what changed between requests and the
+    snapshots already rendered from the current tree.
+    """
+    
+    def __init__(self, scanner: Scanner, options: dict):
+        self.scanner = scanner
+        self.options = options
+        self.lock = Lock()  # one request at a time renders from the scanner
+        self.counter = TokenCounter()
+        # (max_tokens, priority) -> (snapshot, files, tokens), until the tree changes
+        self.rendered: "OrderedDict[tuple, Tuple[bytes, int, int]]" = OrderedDict()
+        self._prepared = False
+        self._broken = False  # a request failed halfway: walk the tree again before the next
+        scanner.retain_listings = True
+        if scanner.cache is not None:
+            scanner.cache.keep_in_memory()
+        scanner.scan()
+        try:
+            self.watcher = InotifyWatcher(skip=scanner.writes)
+            try:
+                self.watcher.watch(scanner.watched_dirs())
+            except OSError:
+                self.watcher.close()
+                raise
+        except OSError:
+            self.watcher = PollingWatcher(scanner)
+    
+    def sync(self) -> None:
+        """Catch up with the changes made since the last request."""
+        changed = self.watcher.wait(0)
+        if self._broken:
+            changed = None
+        if changed is not None and not changed:
+            return
+        self.rendered.clear()
+        self._prepared = False
+        try:
+            if changed is not None:
+                self.scanner.refresh(changed)
+        except OSError:
+            changed = None  # the tree moved under the refresh: start over
+        if changed is None:
+            self.scanner._listings = {}
+            self.scanner.scan()
+        self._broken = False
+        self.watcher.watch(self.scanner.watched_dirs())
+    
+    def prepare(self, max_tokens: Optional[int], priority: Optional[Dict[str, float]]) -> None:
+        """Run the passes that follow a scan, as main() does for a single run."""
+        scanner = self.scanner
+        if self._prepared:
+            # The passes annotate the tree: start again from a clean one (from the retained listings)
+            scanner.scan()
+        if scanner.excerpt_large:
+            scanner.make_excerpts()
+        if self.options["dedup"]:
+            scanner.find_duplicates()
+        if max_tokens is not None:
+            scanner.apply_budget(max_tokens, self.counter, dict(PRIORITY_WEIGHTS, **(priority or {})))
+        self._prepared = True
+    
+    def snapshot(
+        self,
+        max_tokens: Optional[int],
+        priority: Optional[Dict[str, float]],
+        exclude: Iterable[Path] = (),
+    ) -> Tuple[bytes, int, int, bool]:
+        """
+        The Markdown snapshot as (data, files, tokens, served from memory);
+        exclude names files the client writes (left out from now on).
+        """
+        key = (max_tokens, tuple(sorted((priority or {}).items())))
+        with self.lock, self._guard():
+            self._exclude(exclude)
+            self.sync()
+            hit = self.rendered.get(key)
+            if hit is not None:
+                self.rendered.move_to_end(key)
+                return hit + (True,)
+            self.prepare(max_tokens, priority)
+            stats = SnapshotStats(self.counter)
+            data = "".join(stats.count(self.scanner.iter_snapshot())).encode("utf-8")
+            rendered = (data, self.scanner.stats["included"], stats.tokens)
+            self.rendered[key] = rendered
+            while len(self.rendered) > DAEMON_MAX_RENDERED:
+                self.rendered.popitem(last=False)
+            self._flush()
+            return rendered + (False,)
+    
+    def pack(
+        self,
+        output: Path,
+        compression: str,
+        max_tokens: Optional[int],
+        priority: Optional[Dict[str, float]],
+        exclude: Iterable[Path] = (),
+    ) -> Tuple[int, int]:
+        """Write the snapshot as a pack to output; returns (files, tokens)."""
+        with self.lock, self._guard():
+            self._exclude([output, *exclude])
+            self.sync()
+            self.prepare(max_tokens, priority)
+            stats = write_pack(self.scanner, output, compression, self.counter)
+            self._flush()
+            return self.scanner.stats["included"], stats.tokens
+    
+    @contextmanager
+    def _guard(self) -> Iterator[None]:
+        """Around a request: if it fails halfway, the next one starts from a fresh walk."""
+        try:
+            yield
+        except BaseException:
+            self._broken = True
+            raise
+    
+    def _exclude(self, paths: Iterable[Path]) -> None:
+        """
+        Leave files written for requests out of the scanner's tree from now on
+        (see Scanner.exclude_outputs), re-listing the directories they are in.
+        """
+        scanner = self.scanner
+        new = [path for path in paths if not scanner.writes(path.resolve())]
+        if not new:
+            return
+        scanner.exclude_outputs(new)
+        listed = {path.resolve().parent for path in new} & scanner._listings.keys()
+        if listed:
+            scanner.refresh(listed)
+            self.rendered.clear()
+            self._prepared = False
+    
+    def _flush(self) -> None:
+        if self.scanner.cache is not None:
+            self.scanner.cache.flush()
+    
+    def close(self) -> None:
+        with self.lock:
+            self.watcher.close()
+
+
+class SnapshotDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Serve snapshots over a Unix domain socket from warm scanners (--serve).
+    
+    A client sends one JSON object on a line and gets back one JSON line
+    describing the result ({"ok": true, "files": N, "tokens": N, "cached":
+    bool, "ms": N}, or {"ok": false, "error": "..."}), followed by the
+    snapshot itself until the connection closes. Request keys:
+    
+        root         absolute path of the directory to snapshot (required)
+        git, ignore, excerpt, excerpt_grep, minify, dedup
+                     scan options, as the command-line flags
+        max_tokens, priority
+                     token budget (priority: {"depth": W, ...})
+        format       "markdown" (default) or "pack"
+        output, compress
+                     where the daemon writes a pack, and how it compresses it
+        exclude      absolute paths of files the client writes, such as the
+                     snapshot itself (left out of this and later snapshots)
+    
+    Requests for different roots run concurrently; requests for the same root
+    and scan options share one scanner, its snapshot cache and its rendered
+    snapshots.
+    """
+    
+    daemon_threads = True
+    
+    def __init__(
+        self,
+        socket_path: Path,
+        jobs: int = DEFAULT_JOBS,
+        cache_dir: Optional[Path] = None,
+        use_cache: bool = True,
+        log: Callable[..., None] = print,
+    ):
+        self.socket_path = socket_path
+        self.jobs = jobs
+        self.cache_dir = cache_dir
+        self.use_cache = use_cache
+        self.log = log
+        self._lock = Lock()
+        self._warm: "OrderedDict[tuple, WarmScanner]" = OrderedDict()
+        self._building: Dict[tuple, Lock] = {}  # key -> held while its warm scanner is created
+        self._caches: Dict[Path, SnapshotCache] = {}
+        if socket_path.exists():
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(str(socket_path))
+            except OSError:
+                socket_path.unlink()  # left behind by a daemon that died
+            else:
+                raise OSError(f"a daemon is already listening on {socket_path}")
+            finally:
+                probe.close()
+        socket_path.parent.mkdir(parents=True, exist_ok=True)
+        super().__init__(str(socket_path), _DaemonHandler)
+        os.chmod(socket_path, 0o600)
+    
+    def warm_scanner(self, request: dict) -> WarmScanner:
+        """The warm scanner for a request's root and scan options, created on first use."""
+        root = Path(request["root"])
+        if not root.is_absolute() or not root.is_dir():
+            raise ValueError(f"not an absolute path to a directory: {root}")
+        root = root.resolve()
+        options = {
+            "git": bool(request.get("git", False)),
+            "ignore": tuple(request.get("ignore", ())),
+            "excerpt": bool(request.get("excerpt", False) or request.get("excerpt_grep")),
+            "excerpt_grep": tuple(request.get("excerpt_grep", ())),
+            "minify": bool(request.get("minify", False)),
+            "dedup": DEDUPLICATE and bool(request.get("dedup", True)),
+        }
+        key = (root, *options.values())
+        with self._lock:
+            warm = self._warm.get(key)
+            if warm is not None:
+                self._warm.move_to_end(key)
+                return warm
+            building = self._building.setdefault(key, Lock())
+        # The cold scan runs under this key's lock only: other roots and options are served meanwhile
+        with building:
+            with self._lock:
+                warm = self._warm.get(key)
+                if warm is not None:  # built by a request that got here first
+                    self._warm.move_to_end(key)
+                    return warm
+                cache = self._caches.get(root)
+                if cache is None and self.use_cache:
+                    try:
+                        cache = self._caches[root] = SnapshotCache.for_root(root, self.cache_dir)
+                    except (OSError, sqlite3.Error) as e:
+                        self.log(f"⚠️  Snapshot cache unavailable for {root} ({e})")
+            scanner = Scanner(
+                root,
+                jobs=self.jobs,
+                cache=cache if cache is not None else SnapshotCache.in_memory(),
+                use_git=options["git"],
+                ignore_patterns=list(options["ignore"]),
+            )
+            scanner.minify = options["minify"]
+            scanner.excerpt_large = options["excerpt"]
+            if options["excerpt_grep"]:
+                scanner.excerpt_pattern = re.compile(
+                    "|".join(f"(?:{pattern})" for pattern in options["excerpt_grep"]).encode("utf-8")
+                )
+            warm = WarmScanner(scanner, options)
+            evicted: List[WarmScanner] = []
+            with self._lock:
+                self._warm[key] = warm
+                del self._building[key]
+                while len(self._warm) > DAEMON_MAX_SCANNERS:
+                    evicted.append(self._warm.popitem(last=False)[1])
+        # Closing waits for a request still rendering from the scanner: not under the daemon's lock
+        for stale in evicted:
+            stale.close()
+        return warm
+    
+    def serve_request(self, request: dict) -> Tuple[dict, bytes]:
+        """Answer one request: the JSON header and the snapshot that follows it."""
+        started = time.perf_counter()
+        max_tokens = request.get("max_tokens")
+        priority = request.get("priority")
+        exclude = [Path(path) for path in request.get("exclude", ())]
+        if not all(path.is_absolute() for path in exclude):
+            raise ValueError("exclude needs absolute paths")
+        pack = request.get("format", "markdown") == "pack"
+        if pack:
+            if not request.get("output"):
+                raise ValueError("a pack needs an output path")
+            compression = request.get("compress", PACK_COMPRESSION)
+            pack_codec(compression)  # reject unknown ones before scanning
+        warm = self.warm_scanner(request)
+        if pack:
+            output = Path(request["output"])
+            files, tokens = warm.pack(output, compression, max_tokens, priority, exclude)
+            data, cached = b"", False
+        else:
+            data, files, tokens, cached = warm.snapshot(max_tokens, priority, exclude)
+        elapsed = (time.perf_counter() - started) * 1000
+        header = {"ok": True, "files": files, "tokens": tokens, "cached": cached, "ms": round(elapsed, 2)}
+        how = "from memory" if cached else "rendered"
+        self.log(f"📨 {time.strftime('%H:%M:%S')} {warm.scanner.root} ({how}, {elapsed:.1f} ms)")
+        return header, data
+    
+    def server_close(self) -> None:
+        super().server_close()
+        with self._lock:
+            for warm in self._warm.values():
+                warm.close()
+            for cache in self._caches.values():
+                cache.close()
+            self._warm.clear()
+            self._caches.clear()
+        try:
+            self.socket_path.unlink()
+        except OSError:
+            pass
+
+
+class _DaemonHandler(socketserver.StreamRequestHandler):
+    """One client connection of a SnapshotDaemon."""
+    
+    def handle(self) -> None:
+        line = self.rfile.readline(DAEMON_MAX_REQUEST_BYTES)
+        data = b""
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("expected a JSON object")
+            header, data = self.server.serve_request(request)
+        except Exception as e:  # whatever went wrong, the client hears of it and the daemon goes on
+            header = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        try:
+            self.wfile.write(json.dumps(header).encode("utf-8") + b"\n")
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client went away
+
+
+def request_snapshot(socket_path: Path, request: dict) -> Tuple[dict, bytes]:
+    """Ask a running daemon for a snapshot: (its JSON header, the snapshot)."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(str(socket_path))
+        client.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        client.shutdown(socket.SHUT_WR)
+        with client.makefile("rb") as response:
+            header = json.loads(response.readline())
+            return header, response.read()
 
 
 def copy_to_clipboard(text: str) -> bool:
     """Copy text to clipboard. Cross-platform support."""
+    return stream_to_clipboard(lambda: (text,))
+
+
+def stream_to_clipboard(make_chunks: Callable[[], Iterable[str]]) -> bool:
+    """
+    Stream text chunks into the clipboard tool's stdin. Cross-platform support.
+    
+    make_chunks is only called once a clipboard tool has started, and again
+    for every further tool that has to be tried.
+    """
     try:
         if sys.platform == "darwin":
             # macOS
-            process = subprocess.Popen(
-                ["pbcopy"],
-                stdin=subprocess.PIPE,
-                stderr=subprocess.DEVNULL
-            )
-            process.communicate(text.encode("utf-8"))
-            return process.returncode == 0
+            return _pipe_chunks(["pbcopy"], make_chunks, "utf-8")
         
         elif sys.platform == "win32":
             # Windows - use clip.exe with UTF-16LE encoding (native Windows Unicode)
-            process = subprocess.Popen(
+            return _pipe_chunks(
                 ["clip.exe"],
-                stdin=subprocess.PIPE,
-                stderr=subprocess.DEVNULL,
+                make_chunks,
+                "utf-16le",
                 creationflags=subprocess.CREATE_NO_WINDOW if hasattr(subprocess, 'CREATE_NO_WINDOW') else 0
             )
-            # clip.exe expects UTF-16LE encoding for proper Unicode support
-            process.communicate(text.encode("utf-16le"))
-            return process.returncode == 0
         
         else:
             # Linux - try xclip, then xsel, then wl-copy (Wayland)
@@ -710,13 +3942,7 @@ def copy_to_clipboard(text: str) -> bool:
             
             for cmd in clipboard_commands:
                 try:
-                    process = subprocess.Popen(
-                        cmd,
-                        stdin=subprocess.PIPE,
-                        stderr=subprocess.DEVNULL
-                    )
-                    process.communicate(text.encode("utf-8"))
-                    if process.returncode == 0:
+                    if _pipe_chunks(cmd, make_chunks, "utf-8"):
                         return True
                 except FileNotFoundError:
                     continue
@@ -727,6 +3953,25 @@ def copy_to_clipboard(text: str) -> bool:
         return False
 
 
+def _pipe_chunks(
+    cmd: List[str], make_chunks: Callable[[], Iterable[str]], encoding: str, **popen_kwargs
+) -> bool:
+    """Write encoded chunks to a command's stdin; True if it exits cleanly."""
+    process = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        **popen_kwargs
+    )
+    try:
+        for chunk in make_chunks():
+            process.stdin.write(chunk.encode(encoding))
+        process.stdin.close()
+    except BrokenPipeError:
+        pass
+    return process.wait() == 0
+
+
 def format_size(size: int) -> str:
     """Format byte size to human readable."""
     for unit in ["B", "KB", "MB", "GB"]:
@@ -741,73 +3986,716 @@ def estimate_tokens(text: str) -> int:
     return len(text) // 4
 
 
+def log_minify_report(report: Dict[str, Tuple[int, int]], log: Callable[..., None]) -> None:
+    """Log the tokens --minify saved, overall and for the files it shrank most."""
+    before = sum(b for b, _ in report.values())
+    after = sum(a for _, a in report.values())
+    saved = 100 * (before - after) / before if before else 0.0
+    log(f"✂️  Minified:          {before:,} → {after:,} tokens (-{saved:.1f}%)")
+    ranked = sorted(report.items(), key=lambda item: (item[1][1] - item[1][0], item[0]))
+    shown = ranked[:MINIFY_REPORT_FILES] if MINIFY_REPORT_FILES else ranked
+    for i, (rel_path, (b, a)) in enumerate(shown):
+        connector = "└──" if i == len(shown) - 1 else "├──"
+        log(f"   {connector} {rel_path}: {b:,} → {a:,}")
+    if len(shown) < len(ranked):
+        log(f"       … and {len(ranked) - len(shown):,} more files")
+
+
+def profile_report(
+    scanner: Scanner,
+    profile: Profile,
+    snapshot_stats: SnapshotStats,
+    cache: Optional[SnapshotCache],
+) -> dict:
+    """Everything --profile and --stats-json report about the last run, JSON-ready."""
+    files = []
+    for rel_path, chars in profile.file_chars.items():
+        files.append((profile.file_tokens[rel_path], chars, rel_path))
+    files.sort(key=lambda item: (-item[0], item[2]))
+    dirs: Dict[str, int] = defaultdict(int)
+    for tokens, _, rel_path in files:
+        parts = rel_path.split("/")[:-1]
+        for depth in range(1, len(parts) + 1):
+            dirs["/".join(parts[:depth])] += tokens
+    top_dirs = sorted(dirs.items(), key=lambda item: (-item[1], item[0]))
+    return {
+        "root": str(scanner.root),
+        "elapsed": round(profile.elapsed, 6),
+        "phases": {name: round(seconds, 6) for name, seconds in profile.phases.items()},
+        "stats": dict(scanner.stats),
+        "bytes_read": scanner.stats.get("bytes_read", 0),
+        "syscalls": dict(scanner.syscalls.counts, total=scanner.syscalls.total),
+        "encodings": {encoding or "unreadable": n for encoding, n in scanner.encodings.items()},
+        "decode_fallbacks": sum(n for encoding, n in scanner.encodings.items() if encoding != "utf-8"),
+        "cache_hits": cache.hits if cache is not None else None,
+        "snapshot": {
+            "lines": snapshot_stats.lines,
+            "chars": snapshot_stats.chars,
+            "tokens": snapshot_stats.tokens,
+        },
+        "top_files": [
+            {
+                "path": rel_path,
+                "tokens": tokens,
+                "chars": chars,
+                "seconds": round(profile.file_seconds.get(rel_path, 0.0), 6),
+            }
+            for tokens, chars, rel_path in files[:PROFILE_TOP_N]
+        ],
+        "top_dirs": [{"path": path, "tokens": tokens} for path, tokens in top_dirs[:PROFILE_TOP_N]],
+    }
+
+
+def log_profile_report(report: dict, log: Callable[..., None]) -> None:
+    """Log a profile_report: time per phase, I/O, and the heaviest files and directories."""
+    elapsed = report["elapsed"]
+    log(f"⏱️  Profile:           {elapsed:.3f}s")
+    phases = sorted(report["phases"].items(), key=lambda item: -item[1])
+    for name, seconds in phases:
+        share = 100 * seconds / elapsed if elapsed else 0.0
+        log(f"   ├── {name + ':':<15}{seconds:.3f}s ({share:.0f}%)")
+    log(f"   ├── Bytes read:    {format_size(report['bytes_read'])}")
+    log(f"   ├── Syscalls:      {report['syscalls']['total']:,}")
+    log(f"   └── Not UTF-8:     {report['decode_fallbacks']}")
+    for title, key in (("Heaviest files", "top_files"), ("Heaviest dirs", "top_dirs")):
+        rows = report[key]
+        if not rows:
+            continue
+        log(f"   {title}:")
+        for i, row in enumerate(rows):
+            connector = "└──" if i == len(rows) - 1 else "├──"
+            timing = f", {row['seconds'] * 1000:.1f} ms" if "seconds" in row else ""
+            log(f"   {connector} {row['path']}: ~{row['tokens']:,} tokens{timing}")
+
+
+def ignore_patterns_from(args: argparse.Namespace) -> List[str]:
+    """The extra ignore patterns of --ignore-file and --ignore, in that order."""
+    return [
+        *(line for path in args.ignore_file for line in read_ignore_file(path)),
+        *args.ignore,
+    ]
+
+
+def parse_weights(text: str) -> Dict[str, float]:
+    """Parse "key=weight,key=weight" (argparse type for --priority)."""
+    weights: Dict[str, float] = {}
+    for pair in filter(None, text.split(",")):
+        key, sep, value = pair.partition("=")
+        if not sep or key.strip() not in PRIORITY_WEIGHTS:
+            raise argparse.ArgumentTypeError(
+                f"expected KEY=WEIGHT with KEY in {', '.join(PRIORITY_WEIGHTS)}: {pair!r}"
+            )
+        try:
+            weights[key.strip()] = float(value)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"not a number: {value!r}")
+    return weights
+
+
 def main():
     """Main entry point."""
+    parser = argparse.ArgumentParser(description="Capture a project snapshot for LLM context.")
+    parser.add_argument(
+        "directory",
+        nargs="?",
+        default=None,
+        help="Directory to scan (defaults to the current working directory).",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help="Worker threads for directory enumeration and file reads (1 = serial).",
+    )
+    parser.add_argument(
+        "--processes",
+        action="store_true",
+        help="Read and decode files in a process pool instead of threads (with --jobs > 1).",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Neither use nor update the persistent snapshot cache.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=None,
+        help="Directory for the snapshot cache (defaults to $XDG_CACHE_HOME/scanner).",
+    )
+    parser.add_argument(
+        "--git",
+        action="store_true",
+        help="List files from the git index (tracked + untracked, honoring .gitignore).",
+    )
+    parser.add_argument(
+        "--ignore",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+        help="Extra gitignore-style pattern (repeatable; '!pattern' re-includes).",
+    )
+    parser.add_argument(
+        "--ignore-file",
+        action="append",
+        default=[],
+        type=Path,
+        metavar="FILE",
+        help=f"Read more patterns from a gitignore-style file (in addition to {IGNORE_FILE_NAME}).",
+    )
+    parser.add_argument(
+        "--no-dedup",
+        action="store_true",
+        help="Emit byte-identical files in full instead of referencing the first copy.",
+    )
+    parser.add_argument(
+        "--max-tokens",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Fit the snapshot into N tokens, truncating or omitting low-priority files.",
+    )
+    parser.add_argument(
+        "--priority",
+        type=parse_weights,
+        default=None,
+        metavar="KEY=W,...",
+        help="Priority weights for --max-tokens (keys: depth, recency, type).",
+    )
+    parser.add_argument(
+        "--entry",
+        action="append",
+        default=[],
+        metavar="FILE",
+        help="Only include FILE and what it imports, transitively (TS/JS and Python; repeatable).",
+    )
+    parser.add_argument(
+        "--excerpt",
+        action="store_true",
+        help=f"Include text files over {format_size(MAX_FILE_SIZE)} as head/tail excerpts.",
+    )
+    parser.add_argument(
+        "--excerpt-grep",
+        action="append",
+        default=[],
+        metavar="REGEX",
+        help="Also show the lines of excerpted files matching REGEX (repeatable; implies --excerpt).",
+    )
+    parser.add_argument(
+        "--minify",
+        action="store_true",
+        help="Strip comments and collapse whitespace in file bodies (per language).",
+    )
+    parser.add_argument(
+        "--shard-tokens",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Split the snapshot into self-contained shards of at most N tokens (needs -o FILE).",
+    )
+    parser.add_argument(
+        "--format",
+        choices=("markdown", "pack"),
+        default="markdown",
+        help="Output format: Markdown, or a random-access pack of the same files (needs -o FILE).",
+    )
+    parser.add_argument(
+        "--compress",
+        choices=("none", "gzip", "zstd"),
+        default=PACK_COMPRESSION,
+        help=f"Compression of each block of a pack (default: {PACK_COMPRESSION}).",
+    )
+    parser.add_argument(
+        "--since",
+        type=Path,
+        default=None,
+        metavar="MANIFEST",
+        help="Only emit files added, removed or modified since the run that wrote MANIFEST.",
+    )
+    parser.add_argument(
+        "--diff",
+        action="store_true",
+        help="With --since, render modified files as unified diffs when the old version is cached.",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=Path,
+        default=None,
+        metavar="FILE",
+        help=f"Write the manifest here (default: next to -o FILE, with a {MANIFEST_SUFFIX} suffix).",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and regenerate the output whenever files change.",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Run as a daemon keeping scanners warm, serving snapshots over a Unix socket.",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Ask the running daemon for the snapshot (falls back to scanning locally).",
+    )
+    parser.add_argument(
+        "--socket",
+        type=Path,
+        default=None,
+        metavar="PATH",
+        help="The daemon's socket (default: scanner.sock in $XDG_RUNTIME_DIR or the cache directory).",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Report time per phase, bytes read and the heaviest files and directories.",
+    )
+    parser.add_argument(
+        "--stats-json",
+        default=None,
+        metavar="FILE",
+        help="Write the run's statistics and profile as JSON to FILE ('-' for stderr).",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        help="Write the snapshot to this file ('-' for stdout) instead of the clipboard.",
+    )
+    args = parser.parse_args()
+    if args.watch and args.output == "-":
+        parser.error("--watch needs -o FILE or the clipboard, not stdout")
+    if args.shard_tokens is not None:
+        if args.output in (None, "-"):
+            parser.error("--shard-tokens needs -o FILE to name the shards after")
+        if args.max_tokens is not None:
+            parser.error("--shard-tokens and --max-tokens cannot be combined")
+    if args.format == "pack":
+        if args.output in (None, "-"):
+            parser.error("--format pack needs -o FILE")
+        if args.shard_tokens is not None:
+            parser.error("--format pack and --shard-tokens cannot be combined")
+        if args.compress == "zstd" and zstandard is None:
+            parser.error("--compress zstd needs the zstandard package")
+    excerpt_pattern: Optional["re.Pattern[bytes]"] = None
+    if args.excerpt_grep:
+        try:
+            excerpt_pattern = re.compile(
+                "|".join(f"(?:{pattern})" for pattern in args.excerpt_grep).encode("utf-8")
+            )
+        except re.error as e:
+            parser.error(f"invalid --excerpt-grep pattern: {e}")
+    if args.diff and args.since is None:
+        parser.error("--diff needs --since MANIFEST")
+    if args.daemon:
+        if args.serve:
+            parser.error("--daemon and --serve cannot be combined")
+        for flag, value in (("--entry", args.entry), ("--since", args.since), ("--watch", args.watch),
+                            ("--shard-tokens", args.shard_tokens), ("--profile", args.profile),
+                            ("--stats-json", args.stats_json)):
+            if value:
+                parser.error(f"{flag} is not available with --daemon")
+    socket_path = args.socket or default_socket_path()
+    profile = Profile(enabled=args.profile or args.stats_json is not None)
+    
+    # Informational output goes to stderr when the snapshot itself goes to stdout
+    to_stdout = args.output == "-"
+    log_stream = sys.stderr if to_stdout else sys.stdout
+    
+    def log(*values: object) -> None:
+        print(*values, file=log_stream)
+    
+    if args.serve:
+        try:
+            server = SnapshotDaemon(socket_path, args.jobs, args.cache_dir, not args.no_cache, log)
+        except OSError as e:
+            log(f"❌ Error: Cannot start the daemon: {e}")
+            sys.exit(1)
+        log(f"🛰️  Serving snapshots on {socket_path}. Press Ctrl+C to stop.")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            log()
+            log("👋 Daemon stopped.")
+        finally:
+            server.server_close()
+        return
+    
     # Determine target directory
-    if len(sys.argv) > 1:
-        target = Path(sys.argv[1])
+    if args.directory is not None:
+        target = Path(args.directory)
         if not target.exists():
-            print(f"❌ Error: Path does not exist: {target}")
+            log(f"❌ Error: Path does not exist: {target}")
             sys.exit(1)
         if not target.is_dir():
-            print(f"❌ Error: Path is not a directory: {target}")
+            log(f"❌ Error: Path is not a directory: {target}")
             sys.exit(1)
         root = target.resolve()
     else:
         root = Path.cwd()
     
+    # Entry points, relative to the root (as given, or relative to the current directory)
+    entries: List[str] = []
+    for entry in args.entry:
+        path = Path(entry)
+        if not path.is_absolute() and not (root / path).exists():
+            path = Path.cwd() / path
+        rel_path = os.path.relpath(os.path.abspath(root / path), root)
+        if rel_path.startswith(".."):
+            log(f"❌ Error: Entry point is outside {root}: {entry}")
+            sys.exit(1)
+        entries.append(Path(rel_path).as_posix())
+    
+    # Manifest of this run (size, mtime and hash of every included file)
+    manifest_path: Optional[Path] = args.manifest
+    if manifest_path is None and args.output not in (None, "-"):
+        manifest_path = Path(args.output + MANIFEST_SUFFIX)
+    since: Optional[dict] = None
+    if args.since is not None:
+        try:
+            since = load_manifest(args.since)
+        except (OSError, ValueError, KeyError) as e:
+            log(f"❌ Error: Cannot use manifest {args.since}: {e}")
+            sys.exit(1)
+    
     # Banner
-    print("┌─────────────────────────────────────────┐")
-    print("│      📸 Project Snapshot Scanner        │")
-    print("└─────────────────────────────────────────┘")
-    print()
-    print(f"📂 Target: {root}")
-    print()
+    log("┌─────────────────────────────────────────┐")
+    log("│      📸 Project Snapshot Scanner        │")
+    log("└─────────────────────────────────────────┘")
+    log()
+    log(f"📂 Target: {root}")
+    log()
+    
+    if args.daemon:
+        request = {
+            "root": str(root),
+            "git": args.git,
+            "ignore": ignore_patterns_from(args),
+            "excerpt": args.excerpt,
+            "excerpt_grep": args.excerpt_grep,
+            "minify": args.minify,
+            "dedup": not args.no_dedup,
+            "max_tokens": args.max_tokens,
+            "priority": args.priority,
+            "format": args.format,
+            "compress": args.compress,
+        }
+        if args.format == "pack":
+            request["output"] = str(Path(args.output).resolve())
+        elif args.output is None:
+            request["exclude"] = [str(root / "snapshot.md")]  # the clipboard fallback
+        elif args.output != "-":
+            request["exclude"] = [str(Path(args.output).resolve())]
+        try:
+            header, data = request_snapshot(socket_path, request)
+        except (OSError, ValueError) as e:
+            log(f"⚠️  Scanner daemon unavailable ({e}), scanning locally.")
+            log()
+        else:
+            if not header.get("ok"):
+                log(f"❌ Error from the daemon: {header.get('error')}")
+                sys.exit(1)
+            how = "from memory" if header["cached"] else "rendered"
+            log(f"🛰️  Served by the daemon in {header['ms']:.1f} ms ({how}): "
+                f"{header['files']:,} files, ~{header['tokens']:,} tokens")
+            log()
+            text = data.decode("utf-8")
+            if args.format == "pack":
+                log(f"✅ Pack saved to: {Path(args.output).resolve()}")
+            elif to_stdout:
+                sys.stdout.write(text)
+                sys.stdout.flush()
+            elif args.output is not None:
+                try:
+                    with open(args.output, "w", encoding="utf-8") as f:
+                        f.write(text)
+                    log(f"✅ Snapshot saved to: {Path(args.output).resolve()}")
+                except OSError as e:
+                    log(f"❌ Error saving file: {e}")
+            elif copy_to_clipboard(text):
+                log("✅ Snapshot copied to clipboard!")
+            else:
+                output_file = root / "snapshot.md"
+                output_file.write_text(text, encoding="utf-8")
+                log(f"⚠️  Could not copy to clipboard, saved to: {output_file}")
+            return
     
     # Scan
-    scanner = Scanner(root)
-    scanner.scan()
+    cache: Optional[SnapshotCache] = None
+    if not args.no_cache:
+        try:
+            cache = SnapshotCache.for_root(root, args.cache_dir)
+        except (OSError, sqlite3.Error) as e:
+            log(f"⚠️  Snapshot cache unavailable ({e}), reading every file.")
+            log()
+    
+    ignore_patterns = ignore_patterns_from(args)
+    scanner = Scanner(
+        root,
+        jobs=args.jobs,
+        use_processes=args.processes,
+        cache=cache,
+        use_git=args.git,
+        ignore_patterns=ignore_patterns,
+    )
+    # Leave what this run writes out of the snapshot (and out of what --watch reacts to)
+    outputs: List[Path] = []
+    if args.output is None:
+        outputs.append(root / "snapshot.md")  # the clipboard fallback
+    elif args.output != "-":
+        outputs.append(Path(args.output))
+    if args.stats_json not in (None, "-"):
+        outputs.append(Path(args.stats_json))
+    # Manifests too: this run's, and the one --since reads (written by an earlier run)
+    outputs.extend(path for path in (manifest_path, args.since) if path is not None)
+    shards_of: Optional[Path] = None
+    if args.shard_tokens is not None:
+        shards_of = Path(args.output)
+        outputs.append(shard_index_path(shards_of))
+    scanner.exclude_outputs(outputs, shards_of)
+    if args.watch:
+        scanner.retain_listings = True
+        if scanner.cache is None:
+            # Watching relies on cached contents to re-read only what changed
+            scanner.cache = SnapshotCache.in_memory()
+        scanner.cache.keep_in_memory()
+    scanner.minify = args.minify
+    scanner.excerpt_large = args.excerpt or bool(args.excerpt_grep)
+    scanner.excerpt_pattern = excerpt_pattern
+    if args.diff:
+        scanner.diff_changes = True
+        if scanner.cache is None:
+            log("⚠️  --diff needs the snapshot cache, emitting modified files in full.")
+            log()
+    if profile.enabled:
+        scanner.profile = profile
+    with profile.phase("scan"):
+        scanner.scan()
+    if args.git and scanner.enumeration != "git":
+        log("⚠️  Not a git work tree (or git unavailable), walked the filesystem instead.")
+        log()
+    
+    counter: Optional[TokenCounter] = None
+    if args.max_tokens is not None or args.shard_tokens is not None:
+        counter = TokenCounter()
+    
+    manifest: Optional[dict] = None
+    
+    def prepare() -> None:
+        """Run the passes that follow a scan."""
+        nonlocal manifest
+        if entries:
+            with profile.phase("entry"):
+                scanner.apply_entries(entries)
+        if scanner.excerpt_large:
+            with profile.phase("excerpts"):
+                scanner.make_excerpts()
+        if manifest_path is not None or since is not None:
+            with profile.phase("manifest"):
+                # Hash only what looks changed since the last manifest built
+                manifest = scanner.build_manifest(manifest or since)
+                if since is not None:
+                    scanner.apply_since(since, manifest, args.since.name)
+        if DEDUPLICATE and not args.no_dedup:
+            with profile.phase("dedup"):
+                scanner.find_duplicates()
+        if args.max_tokens is not None:
+            weights = dict(PRIORITY_WEIGHTS, **(args.priority or {}))
+            with profile.phase("budget"):
+                scanner.apply_budget(args.max_tokens, counter, weights)
+        if args.shard_tokens is not None:
+            with profile.phase("shards"):
+                scanner.plan_shards(args.shard_tokens, counter)
+    
+    # Stream the snapshot to its destination, counting it on the way
+    snapshot_stats = SnapshotStats(counter)
+    
+    def render() -> Iterator[str]:
+        chunks = scanner.iter_snapshot()
+        if profile.enabled:
+            chunks = profile.timed("render", chunks)
+        return snapshot_stats.count(chunks)
     
-    # Generate snapshot
-    snapshot = scanner.generate_snapshot()
+    shard_stats: List[SnapshotStats] = []
+    
+    def deliver() -> List[str]:
+        """Write the snapshot out; returns the lines reporting where it went."""
+        nonlocal snapshot_stats, shard_stats
+        outcome: List[str] = []
+        if args.format == "pack":
+            try:
+                snapshot_stats = write_pack(scanner, Path(args.output), args.compress, counter)
+                outcome.append(f"✅ Pack saved to: {Path(args.output).resolve()}")
+            except OSError as e:
+                outcome.append(f"❌ Error saving pack: {e}")
+        elif args.shard_tokens is not None:
+            try:
+                shard_stats, index_path = write_shards(scanner, Path(args.output), counter)
+                snapshot_stats = SnapshotStats.combined(shard_stats, counter)
+                outcome.append(f"✅ {len(shard_stats)} shards saved, index: {index_path.resolve()}")
+            except OSError as e:
+                outcome.append(f"❌ Error saving shards: {e}")
+        elif to_stdout:
+            sys.stdout.writelines(render())
+            sys.stdout.flush()
+        elif args.output is not None:
+            try:
+                with open(args.output, "w", encoding="utf-8") as f:
+                    f.writelines(render())
+                outcome.append(f"✅ Snapshot saved to: {Path(args.output).resolve()}")
+            except OSError as e:
+                outcome.append(f"❌ Error saving file: {e}")
+        elif stream_to_clipboard(render):
+            outcome.append("✅ Snapshot copied to clipboard!")
+        else:
+            outcome.append("⚠️  Could not copy to clipboard.")
+            outcome.append("   Saving to 'snapshot.md' instead...")
+            try:
+                output_file = root / "snapshot.md"
+                with open(output_file, "w", encoding="utf-8") as f:
+                    f.writelines(render())
+                outcome.append(f"   ✅ Saved to: {output_file}")
+            except Exception as e:
+                log(f"   ❌ Error saving file: {e}")
+                log()
+                log("─" * 50)
+                log("Snapshot output:")
+                log("─" * 50)
+                sys.stdout.writelines(render())
+                sys.stdout.write("\n")
+        return outcome
+    
+    def save_manifest(outcome: List[str]) -> None:
+        """Write the manifest next to a successfully delivered snapshot."""
+        if manifest_path is None or any(line.startswith("❌") for line in outcome):
+            return
+        try:
+            write_manifest(manifest_path, manifest)
+            outcome.append(f"🧾 Manifest saved to: {manifest_path.resolve()}")
+        except OSError as e:
+            outcome.append(f"❌ Error saving manifest: {e}")
+    
+    def report_profile() -> None:
+        """Emit --profile and --stats-json for the run that just finished."""
+        if not profile.enabled:
+            return
+        report = profile_report(scanner, profile, snapshot_stats, scanner.cache)
+        if args.profile:
+            log_profile_report(report, log)
+            log()
+        if args.stats_json is None:
+            return
+        text = json.dumps(report, indent=2) + "\n"
+        if args.stats_json == "-":
+            sys.stderr.write(text)
+            return
+        try:
+            with open(args.stats_json, "w", encoding="utf-8") as f:
+                f.write(text)
+        except OSError as e:
+            log(f"❌ Error saving stats: {e}")
+    
+    try:
+        prepare()
+    except ValueError as e:
+        log(f"❌ Error: {e}")
+        sys.exit(1)
+    with profile.phase("output"):
+        outcome = deliver()
+    save_manifest(outcome)
+    
+    if cache is not None and not args.watch:
+        cache.close()
     
     # Stats
-    char_count = len(snapshot)
-    line_count = snapshot.count("\n") + 1
-    token_estimate = estimate_tokens(snapshot)
-    
-    print("📊 Statistics:")
-    print(f"   ├── Directories:   {scanner.stats['dirs']}")
-    print(f"   ├── Files found:   {scanner.stats['files']}")
-    print(f"   ├── Files included:{scanner.stats['included']}")
-    print(f"   ├── Binary files:  {scanner.stats['binary']}")
-    print(f"   ├── Large files:   {scanner.stats['large']}")
-    print(f"   └── Empty files:   {scanner.stats['empty']}")
-    print()
-    print("📄 Snapshot:")
-    print(f"   ├── Lines:         {line_count:,}")
-    print(f"   ├── Characters:    {char_count:,}")
-    print(f"   ├── Size:          {format_size(char_count)}")
-    print(f"   └── Est. tokens:   ~{token_estimate:,}")
-    print()
-    
-    # Copy to clipboard
-    if copy_to_clipboard(snapshot):
-        print("✅ Snapshot copied to clipboard!")
+    log("📊 Statistics:")
+    log(f"   ├── Directories:   {scanner.stats['dirs']}")
+    log(f"   ├── Files found:   {scanner.stats['files']}")
+    log(f"   ├── Files included:{scanner.stats['included']}")
+    log(f"   ├── Binary files:  {scanner.stats['binary']}")
+    if scanner.excerpt_large:
+        log(f"   ├── Large files:   {scanner.stats['large']} ({scanner.stats['excerpted']} excerpted)")
     else:
-        print("⚠️  Could not copy to clipboard.")
-        print("   Saving to 'snapshot.md' instead...")
-        try:
-            output_file = root / "snapshot.md"
-            output_file.write_text(snapshot, encoding="utf-8")
-            print(f"   ✅ Saved to: {output_file}")
-        except Exception as e:
-            print(f"   ❌ Error saving file: {e}")
-            print()
-            print("─" * 50)
-            print("Snapshot output:")
-            print("─" * 50)
-            print(snapshot)
+        log(f"   ├── Large files:   {scanner.stats['large']}")
+    log(f"   ├── Empty files:   {scanner.stats['empty']}")
+    syscall_kinds = ", ".join(f"{n:,} {kind}" for kind, n in scanner.syscalls.counts.items())
+    log(f"   ├── Syscalls:      {scanner.syscalls.total:,} ({syscall_kinds})")
+    fallbacks = sum(n for encoding, n in scanner.encodings.items() if encoding != "utf-8")
+    if fallbacks:
+        decodings = ", ".join(
+            f"{encoding or 'unreadable'} {n}"
+            for encoding, n in scanner.encodings.most_common()
+            if encoding != "utf-8"
+        )
+        log(f"   ├── Not UTF-8:     {fallbacks} ({decodings})")
+    if entries:
+        log(f"   ├── Reachable:     {scanner.stats['reachable']} of {scanner.stats['included']} "
+            f"files from {len(entries)} entry point(s)")
+    if since is not None:
+        log(f"   ├── Changes:       {scanner.stats['added']} added, "
+            f"{scanner.stats['modified']} modified, {scanner.stats['removed']} removed")
+    if scanner.duplicate_of:
+        log(f"   ├── Duplicates:    {len(scanner.duplicate_of)} "
+            f"(saved {format_size(scanner.dedup_saved_bytes)}, ~{scanner.dedup_saved_tokens:,} tokens)")
+    if cache is not None:
+        log(f"   └── Cache hits:    {cache.hits:,} ({scanner.stats.get('read', 0):,} files read)")
+    else:
+        log("   └── Cache:         disabled")
+    log()
+    log("📄 Snapshot:")
+    log(f"   ├── Lines:         {snapshot_stats.lines:,}")
+    log(f"   ├── Characters:    {snapshot_stats.chars:,}")
+    log(f"   ├── Size:          {format_size(snapshot_stats.chars)}")
+    if args.shard_tokens is not None:
+        if counter.exact:
+            log(f"   ├── Tokens:        {snapshot_stats.tokens:,} ({counter.name})")
+        else:
+            log(f"   ├── Est. tokens:   ~{snapshot_stats.tokens:,}")
+        over = sum(1 for part in shard_stats if part.tokens > args.shard_tokens)
+        largest = max((part.tokens for part in shard_stats), default=0)
+        log(f"   └── Shards:        {len(shard_stats)} of ≤{args.shard_tokens:,} tokens "
+            f"(largest {largest:,}" + (f", {over} over the limit)" if over else ")"))
+    elif counter is None:
+        log(f"   └── Est. tokens:   ~{snapshot_stats.tokens:,}")
+    else:
+        if counter.exact:
+            log(f"   ├── Tokens:        {snapshot_stats.tokens:,} ({counter.name})")
+        else:
+            log(f"   ├── Est. tokens:   ~{snapshot_stats.tokens:,}")
+        log(f"   └── Budget:        {args.max_tokens:,} tokens → "
+            f"{scanner.stats.get('truncated', 0)} truncated, {scanner.stats.get('omitted', 0)} omitted")
+    log()
+    if scanner.minify_report:
+        log_minify_report(scanner.minify_report, log)
+        log()
+    report_profile()
+    
+    for line in outcome:
+        log(line)
+    
+    if args.watch:
+        log()
+        
+        def regenerate() -> None:
+            profile.reset()
+            try:
+                prepare()
+            except ValueError as e:
+                log(f"❌ Error: {e}")
+                return
+            with profile.phase("output"):
+                outcome = deliver()
+            save_manifest(outcome)
+            for line in outcome:
+                if not line.startswith(("✅", "🧾")):
+                    log(line)
+            report_profile()
+            scanner.cache.flush()
+        
+        watch_and_regenerate(scanner, regenerate, log)
+        scanner.cache.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,43 @@
+"""Fixtures for the tests of scanner.py and the Python tools."""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(REPO), str(REPO / "tools")]
+
+from helpers import write_tree  # noqa: E402
+
+
+@pytest.fixture
+def project(tmp_path: Path) -> Path:
+    """A small tree with nested directories, ignored entries, a binary and an empty file."""
+    return write_tree(
+        tmp_path / "project",
+        {
+            "main.py": "import util\n\nprint(util.VALUE)\n",
+            "util.py": "VALUE = 1\n",
+            "src/app.ts": "export const app = 1;\n",
+            "src/lib/a.ts": "export const a = 'a';\n",
+            "src/lib/b.ts": "export const b = 'b';\n",
+            "src/lib/deep/c.ts": "export const c = 'c';\n",
+            "docs/guide.txt": "Read me.\n",
+            "node_modules/pkg/index.js": "module.exports = 1;\n",
+            "image.bin": b"\x00\x01\x02\x03" * 64,
+            "empty.py": "",
+        },
+    )
+
+
+@pytest.fixture(autouse=True, scope="session")
+def cache_home(tmp_path_factory: pytest.TempPathFactory) -> Iterator[Path]:
+    """Caches (the scanner's, clean_sprite's key tables) go to a directory of the session."""
+    path = tmp_path_factory.mktemp("cache-home")
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("XDG_CACHE_HOME", str(path))
+        yield path
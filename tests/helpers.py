@@ -0,0 +1,58 @@
+"""Helpers shared by the tests."""
+
+from __future__ import annotations
+
+import subprocess
+import sys
+from pathlib import Path
+
+import scanner
+
+
+def write_tree(root: Path, files: dict[str, str | bytes]) -> Path:
+    """Create files (rel_path -> text or bytes) under root; returns root."""
+    for rel_path, content in files.items():
+        path = root / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if isinstance(content, bytes):
+            path.write_bytes(content)
+        else:
+            path.write_text(content, encoding="utf-8")
+    return root
+
+
+def scan(root: Path, **options) -> scanner.Scanner:
+    """A Scanner built with options that has scanned root."""
+    result = scanner.Scanner(root, **options)
+    result.scan()
+    return result
+
+
+def snapshot(root: Path, **options) -> str:
+    """The Markdown snapshot of root from a fresh Scanner built with options."""
+    return scan(root, **options).generate_snapshot()
+
+
+def run_cli(*args: str | Path, cwd: Path | None = None) -> subprocess.CompletedProcess:
+    """Run scanner.py with args; fails the test if it exits non-zero."""
+    return subprocess.run(
+        [sys.executable, scanner.__file__, *map(str, args)],
+        cwd=cwd, capture_output=True, text=True, check=True,
+    )
+
+
+def sprite(height: int, width: int, seed: int = 0) -> np.ndarray:
+    """An RGBA sheet: green screen around opaque figures with green-tinted edges and noise."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    rgba = np.empty((height, width, 4), dtype=np.uint8)
+    rgba[...] = (20, 230, 30, 255)
+    for _ in range(max(1, height * width // 400)):
+        y, x = rng.integers(0, height), rng.integers(0, width)
+        h, w = rng.integers(2, 12, size=2)
+        rgba[y : y + h, x : x + w, :3] = rng.integers(0, 200, size=3)
+        rgba[y + h : y + h + 1, x : x + w, :3] = (90, 170, 80)  # spill on the edge below
+    noise = rng.random((height, width)) < 0.02
+    rgba[noise, :3] = rng.integers(0, 256, size=(int(noise.sum()), 3))
+    return rgba
@@ -0,0 +1,95 @@
+"""clean_sprite --band-rows: strip-by-strip processing gives the whole-image output."""
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import clean_sprite
+from helpers import sprite
+
+
+def params(**overrides):
+    g_min, delta, ratio = clean_sprite.MODE_DEFAULTS["all-green"]
+    defaults = dict(
+        mode="all-green", g_min=g_min, delta=delta, ratio=ratio, key_space="rgb",
+        key_color=clean_sprite.DEFAULT_KEY_COLOR, tolerance=0.0, connectivity=4,
+        despill=True, despill_radius=1, despill_strength=1.0,
+    )
+    return clean_sprite.CleanParams(**dict(defaults, **overrides))
+
+
+@pytest.fixture(scope="module")
+def sheet(tmp_path_factory):
+    path = tmp_path_factory.mktemp("banded") / "sheet.png"
+    Image.fromarray(sprite(61, 47, seed=5), mode="RGBA").save(path)
+    return path
+
+
+def cleaned(in_path, out_path, clean, band_rows=None):
+    removed, total = clean_sprite.clean_image(in_path, out_path, clean, band_rows)
+    pixels = np.load(out_path) if out_path.suffix == ".npy" else np.array(Image.open(out_path))
+    return removed, total, pixels
+
+
+@pytest.mark.parametrize("band_rows", [1, 4, 16, 100])
+@pytest.mark.parametrize("clean", [
+    params(),
+    params(despill=False),
+    params(despill_radius=3, despill_strength=0.5),
+    params(mode="background"),
+    params(mode="background", connectivity=8, despill_radius=2),
+], ids=["all-green", "no-despill", "radius-3", "background", "background-8"])
+def test_banded_matches_whole(sheet, tmp_path, clean, band_rows):
+    whole = cleaned(sheet, tmp_path / "whole.png", clean)
+    banded = cleaned(sheet, tmp_path / "banded.png", clean, band_rows)
+    assert banded[:2] == whole[:2]
+    assert np.array_equal(banded[2], whole[2])
+    # Nothing left behind next to the output
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["banded.png", "whole.png"]
+
+
+@pytest.mark.parametrize("channels", [3, 4])
+def test_npy_in_and_out(sheet, tmp_path, channels):
+    clean = params(mode="background")
+    rgba = np.array(Image.open(sheet))
+    npy = tmp_path / "sheet.npy"
+    np.save(npy, np.ascontiguousarray(rgba[..., :channels]))
+    source = sheet
+    if channels == 3:
+        source = tmp_path / "rgb.png"
+        Image.fromarray(rgba[..., :3], mode="RGB").save(source)
+    _, _, whole = cleaned(source, tmp_path / "whole.png", clean)
+    _, _, banded = cleaned(npy, tmp_path / "banded.npy", clean, 8)
+    assert np.array_equal(banded, whole)
+
+
+@pytest.mark.parametrize("mode", ["RGBA", "RGB", "LA", "L", "P", "1", "I;16"])
+@pytest.mark.parametrize("band_rows", [1, 5, 64])
+def test_png_strips_decode_like_pillow(tmp_path, mode, band_rows):
+    rgba = sprite(37, 29, seed=8)
+    img = Image.fromarray(rgba, mode="RGBA")
+    if mode == "P":
+        img = img.convert("RGB").quantize(64)
+        img.info["transparency"] = 3
+    elif mode == "I;16":
+        img = Image.fromarray(rgba[..., 1].astype(np.uint16) * 257)
+    else:
+        img = img.convert(mode)
+    path = tmp_path / "in.png"
+    img.save(path)
+    layout = clean_sprite.png_layout(path)
+    assert layout is not None
+    strips = list(clean_sprite.png_strips(path, layout, band_rows))
+    assert [strip.height for strip in strips[:-1]] == [band_rows] * (len(strips) - 1)
+    decoded = np.concatenate([np.array(strip.convert("RGBA")) for strip in strips])
+    with Image.open(path) as expected:
+        assert np.array_equal(decoded, np.array(expected.convert("RGBA")))
+
+
+def test_other_inputs_fall_back_to_pillow(sheet, tmp_path):
+    bmp = tmp_path / "sheet.bmp"
+    Image.open(sheet).convert("RGB").save(bmp)
+    assert clean_sprite.png_layout(bmp) is None
+    _, _, whole = cleaned(bmp, tmp_path / "whole.png", params())
+    _, _, banded = cleaned(bmp, tmp_path / "banded.png", params(), 7)
+    assert np.array_equal(banded, whole)
@@ -0,0 +1,88 @@
+"""clean_sprite batch mode: many images through a pool, unchanged ones skipped."""
+
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import clean_sprite
+from helpers import sprite
+
+
+def run_tool(*args, cwd, check=True):
+    return subprocess.run(
+        [sys.executable, clean_sprite.__file__, *map(str, args)],
+        cwd=cwd, capture_output=True, text=True, check=check,
+    )
+
+
+@pytest.fixture
+def sheets(tmp_path):
+    root = tmp_path / "sprites"
+    for i, rel in enumerate(["a.png", "b.png", "nested/c.png", "nested/deeper/d.png"]):
+        path = root / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        Image.fromarray(sprite(30 + i, 40, seed=i), mode="RGBA").save(path)
+    return root
+
+
+def test_collect_inputs(sheets, tmp_path):
+    (sheets / "a_clean.png").write_bytes(b"")  # an output of an earlier run
+    pairs = dict(clean_sprite.collect_inputs([str(sheets)], None, "_clean"))
+    assert pairs == {
+        sheets / rel: sheets / rel.replace(".png", "_clean.png")
+        for rel in ["a.png", "b.png", "nested/c.png", "nested/deeper/d.png"]
+    }
+    out = tmp_path / "out"
+    pairs = dict(clean_sprite.collect_inputs([str(sheets / "**" / "*.png")], out, ""))
+    assert pairs[sheets / "nested" / "c.png"] == out / "c.png"
+    pairs = dict(clean_sprite.collect_inputs([str(sheets)], out, ""))
+    assert pairs[sheets / "nested" / "deeper" / "d.png"] == out / "nested" / "deeper" / "d.png"
+
+
+def test_colliding_outputs_are_refused(sheets, tmp_path):
+    Image.fromarray(sprite(8, 8), mode="RGBA").save(sheets / "nested" / "a.png")
+    with pytest.raises(ValueError, match="would both be written to"):
+        clean_sprite.collect_inputs([str(sheets / "**" / "a.png")], tmp_path / "out", "")
+
+
+def test_batch_matches_single_runs_and_skips_unchanged(sheets, tmp_path):
+    out = tmp_path / "out"
+    batch = (sheets, "--out-dir", out, "--suffix", "")
+    first = run_tool(*batch, "-j", 2, cwd=tmp_path).stdout
+    assert first.count("cleaned  ") == 4
+    for in_path in sheets.rglob("*.png"):
+        single = tmp_path / "single.png"
+        run_tool(in_path, "-o", single, cwd=tmp_path)
+        cleaned = out / in_path.relative_to(sheets)
+        assert np.array_equal(np.array(Image.open(cleaned)), np.array(Image.open(single)))
+    
+    again = run_tool(*batch, "-j", 2, cwd=tmp_path).stdout
+    assert again.count("skipped  ") == 4
+    
+    # A changed input, a changed output or new parameters are cleaned again
+    Image.fromarray(sprite(12, 12, seed=9), mode="RGBA").save(sheets / "b.png")
+    (out / "a.png").write_bytes(b"tampered")
+    rerun = run_tool(*batch, cwd=tmp_path).stdout
+    assert rerun.count("cleaned  ") == 2 and rerun.count("skipped  ") == 2
+    rerun = run_tool(*batch, "--mode", "background", cwd=tmp_path).stdout
+    assert rerun.count("cleaned  ") == 4
+
+
+def test_a_broken_image_fails_alone(sheets, tmp_path):
+    (sheets / "broken.png").write_bytes(b"not a png")
+    result = run_tool(sheets, "--out-dir", tmp_path / "out", "-j", 2, cwd=tmp_path, check=False)
+    assert result.returncode == 1
+    assert result.stdout.count("cleaned  ") == 4 and "failed   " in result.stdout
+    assert "broken.png" not in (tmp_path / "out" / clean_sprite.MANIFEST_NAME).read_text()
+
+
+@pytest.mark.parametrize("args, error", [
+    (["-o", "x.png"], "use --out-dir in batch mode"),
+    (["--suffix", ""], "an empty --suffix needs --out-dir"),
+])
+def test_bad_batch_arguments(sheets, tmp_path, args, error):
+    result = run_tool(sheets, *args, cwd=tmp_path, check=False)
+    assert result.returncode == 2 and error in result.stderr
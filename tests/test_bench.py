@@ -0,0 +1,39 @@
+"""tools/bench_scanner.py: reproducible trees and a complete results file."""
+
+import json
+import subprocess
+import sys
+
+import bench_scanner
+
+
+def listing(root):
+    files = [path for path in root.rglob("*") if path.is_file()]
+    return sorted((str(path.relative_to(root)), path.stat().st_size) for path in files)
+
+
+def test_trees_are_reproducible(tmp_path):
+    first = bench_scanner.generate_tree(tmp_path / "a", 120, 5, 0.1, 0.15, seed=3)
+    second = bench_scanner.generate_tree(tmp_path / "b", 120, 5, 0.1, 0.15, seed=3)
+    assert first == second
+    assert listing(tmp_path / "a") == listing(tmp_path / "b")
+    assert first["files"] == len(listing(tmp_path / "a")) == 120
+    assert max(len(path.split("/")) for path, _ in listing(tmp_path / "a")) <= 5 + 1
+    assert first["binary"] and first["ignored"]
+
+
+def test_results_cover_every_phase(tmp_path):
+    output = tmp_path / "results.json"
+    subprocess.run(
+        [sys.executable, bench_scanner.__file__, "--cases", "80", "--repeat", "1",
+         "--dir", str(tmp_path), "-o", str(output)],
+        check=True, capture_output=True,
+    )
+    results = json.loads(output.read_text(encoding="utf-8"))
+    (case,) = results["cases"]
+    assert case["tree"]["files"] == 80
+    assert set(case["phases"]) == {"walk", "stat", "sniff", "read", "render", "output", "total"}
+    assert case["stats"]["included"] > 0 and case["snapshot_chars"] >= case["chars_read"]
+    assert case["peak_rss_bytes"] > 0
+    # The generated trees are removed unless --keep
+    assert [path.name for path in tmp_path.iterdir()] == ["results.json"]
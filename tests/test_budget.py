@@ -0,0 +1,60 @@
+"""--max-tokens keeps the snapshot within its budget, preferring whole files."""
+
+import random
+
+import pytest
+
+import scanner
+from helpers import scan, write_tree
+
+
+def body(seed, lines):
+    rng = random.Random(seed)
+    return "".join(f"value_{i} = {rng.randrange(10**6)}  # {'x' * rng.randrange(40)}\n"
+                   for i in range(lines))
+
+
+@pytest.fixture
+def sized(tmp_path):
+    files = {f"pkg/m{i}.py": body(i, 5 + 40 * (i % 7)) for i in range(24)}
+    files.update({f"top{i}.py": body(100 + i, 3) for i in range(4)})
+    files["big/huge.py"] = body(999, 900)
+    files["copies/a.py"] = files["copies/b.py"] = body(7, 60)
+    return write_tree(tmp_path / "sized", files)
+
+
+def budgeted(root, max_tokens):
+    result = scan(root)
+    result.find_duplicates()
+    counter = scanner.TokenCounter()
+    result.apply_budget(max_tokens, counter, scanner.PRIORITY_WEIGHTS)
+    return result, counter.count(result.generate_snapshot())
+
+
+@pytest.mark.parametrize("max_tokens", range(1_000, 30_000, 1_013))
+def test_snapshot_stays_within_the_budget(sized, max_tokens):
+    result, tokens = budgeted(sized, max_tokens)
+    assert tokens <= max_tokens
+    assert "omitted" in result.budget_plan.values() or "truncated" in result.budget_plan.values()
+
+
+def test_generous_budget_keeps_everything(sized):
+    full = scanner.TokenCounter().count(scan(sized).generate_snapshot())
+    result, tokens = budgeted(sized, full * 2)
+    assert set(result.budget_plan.values()) == {"full"}
+
+
+def test_duplicates_never_refer_to_left_out_content(sized):
+    result, _ = budgeted(sized, 1_500)
+    for copy, original in result.duplicate_of.items():
+        assert result.budget_plan[original] == "full"
+
+
+def test_plan_budget_prefers_value_per_token():
+    items = [
+        scanner.BudgetItem(score=1.0, listed_cost=1, truncated_cost=None, full_cost=10),
+        scanner.BudgetItem(score=1.0, listed_cost=1, truncated_cost=None, full_cost=100),
+        scanner.BudgetItem(score=5.0, listed_cost=1, truncated_cost=30, full_cost=1000),
+    ]
+    assert scanner.plan_budget(items, 50) == ["full", "omitted", "truncated"]
+    assert scanner.plan_budget(items, 3) == ["omitted", "omitted", "omitted"]
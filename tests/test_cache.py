@@ -0,0 +1,76 @@
+"""The snapshot cache serves unchanged files, keyed on (inode, size, mtime_ns)."""
+
+import os
+
+import pytest
+
+import scanner
+from helpers import scan
+
+
+@pytest.fixture
+def db(tmp_path):
+    return tmp_path / "cache" / "snapshot.sqlite3"
+
+
+def cached_run(root, db):
+    """(snapshot, files read) of a scan through a cache opened, and closed, for this run."""
+    cache = scanner.SnapshotCache(db)
+    try:
+        result = scan(root, cache=cache)
+        text = result.generate_snapshot()
+    finally:
+        cache.close()
+    return text, result.stats.get("read", 0)
+
+
+def test_warm_run_reads_nothing(project, db):
+    cold, read = cached_run(project, db)
+    assert read == 7
+    warm, read = cached_run(project, db)
+    assert (warm, read) == (cold, 0)
+
+
+def test_new_mtime_is_read_again(project, db):
+    cached_run(project, db)
+    path = project / "util.py"
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert cached_run(project, db)[1] == 1
+
+
+def test_new_size_is_read_again_despite_same_mtime(project, db):
+    cached_run(project, db)
+    path = project / "util.py"
+    st = path.stat()
+    path.write_text("VALUE = 22\n", encoding="utf-8")
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    text, read = cached_run(project, db)
+    assert read == 1
+    assert "VALUE = 22" in text
+
+
+def test_replaced_file_is_read_again_despite_same_size_and_mtime(project, db):
+    cached_run(project, db)
+    path = project / "util.py"
+    st = path.stat()
+    replacement = project / "util.py.new"
+    replacement.write_text("VALUE = 2\n", encoding="utf-8")
+    os.utime(replacement, ns=(st.st_atime_ns, st.st_mtime_ns))
+    os.replace(replacement, path)
+    assert path.stat().st_ino != st.st_ino
+    text, read = cached_run(project, db)
+    assert read == 1
+    assert "VALUE = 2\n" in text and "VALUE = 1\n" not in text
+
+
+def test_eviction_keeps_content_under_the_bound(project, db):
+    cache = scanner.SnapshotCache(db, max_bytes=40)
+    scan(project, cache=cache).generate_snapshot()
+    cache.close()
+    cache = scanner.SnapshotCache(db, max_bytes=40)
+    try:
+        total = cache._db.execute("SELECT SUM(nbytes) FROM files").fetchone()[0]
+    finally:
+        cache.close()
+    assert total <= 40
@@ -0,0 +1,94 @@
+"""--serve: snapshots from warm scanners over a Unix socket."""
+
+import shutil
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import scanner
+from helpers import snapshot, write_tree
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="needs Unix domain sockets")
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    server = scanner.SnapshotDaemon(
+        tmp_path / "d.sock", cache_dir=tmp_path / "cache", log=lambda *_: None
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def ask(daemon, **request):
+    header, data = scanner.request_snapshot(daemon.socket_path, request)
+    return header, data.decode("utf-8")
+
+
+def test_snapshot_matches_a_cold_run_and_is_kept_warm(daemon, project):
+    header, text = ask(daemon, root=str(project))
+    assert header["ok"] and header["files"] == 7 and not header["cached"]
+    assert text == snapshot(project)
+    header, again = ask(daemon, root=str(project))
+    assert header["cached"] and again == text
+
+
+def test_changes_are_picked_up(daemon, project):
+    ask(daemon, root=str(project))
+    (project / "src" / "lib" / "new.ts").write_text("export const n = 1;\n", encoding="utf-8")
+    shutil.rmtree(project / "src" / "lib" / "deep")
+    (project / "util.py").write_text("VALUE = 2\n", encoding="utf-8")
+    header, text = ask(daemon, root=str(project))
+    assert header["ok"] and not header["cached"]
+    assert text == snapshot(project)
+
+
+def test_excluded_output_stays_out(daemon, project):
+    output = project / "snapshot.md"
+    _, text = ask(daemon, root=str(project), exclude=[str(output)])
+    output.write_text(text, encoding="utf-8")
+    header, again = ask(daemon, root=str(project), exclude=[str(output)])
+    assert header["ok"] and again == text
+
+
+@pytest.mark.parametrize("request_line, error", [
+    ({"root": "relative/path"}, "not an absolute path"),
+    ({"exclude": ["relative.md"]}, "absolute paths"),
+    ({"format": "pack"}, "needs an output path"),
+    ({"format": "pack", "output": "/dev/null", "compress": "lzma"}, "unknown compression"),
+])
+def test_bad_requests_are_answered(daemon, project, request_line, error):
+    header, text = ask(daemon, **{"root": str(project), **request_line})
+    assert not header["ok"] and error in header["error"] and text == ""
+    # ...and the daemon goes on serving
+    assert ask(daemon, root=str(project))[0]["ok"]
+
+
+def test_pack(daemon, project, tmp_path):
+    output = tmp_path / "out.pack"
+    header, _ = ask(daemon, root=str(project), format="pack", output=str(output))
+    assert header["ok"] and header["files"] == 7
+    with scanner.PackReader(output) as pack:
+        assert pack.read("util.py") == "VALUE = 1"
+
+
+def test_bad_requests_are_rejected_before_scanning(daemon, project):
+    header, _ = ask(daemon, root=str(project), format="pack")
+    assert not header["ok"] and not daemon._warm
+
+
+def test_concurrent_requests_share_one_scanner(daemon, project, tmp_path):
+    other = write_tree(tmp_path / "other", {"only.py": "x = 1\n"})
+    roots = [project, other] * 6
+    with ThreadPoolExecutor(max_workers=len(roots)) as executor:
+        answers = list(executor.map(lambda root: ask(daemon, root=str(root)), roots))
+    assert all(header["ok"] for header, _ in answers)
+    assert {text for _, text in answers[::2]} == {snapshot(project)}
+    assert {text for _, text in answers[1::2]} == {snapshot(other)}
+    assert len(daemon._warm) == 2
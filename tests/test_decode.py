@@ -0,0 +1,38 @@
+"""Files are read once and decoded from the same buffer: BOMs, UTF-8, then fallbacks."""
+
+import pytest
+
+import scanner
+
+TEXT = "naïve café — “quoted”\nline two\n"
+
+
+@pytest.mark.parametrize("data, text, encoding", [
+    (TEXT.encode("utf-8"), TEXT, "utf-8"),
+    (b"\xef\xbb\xbf" + TEXT.encode("utf-8"), TEXT, "utf-8-sig"),
+    (TEXT.encode("utf-16"), TEXT, "utf-16"),
+    (TEXT.encode("utf-16-be"), None, "cp1252"),  # no BOM: not recognised as UTF-16
+    (TEXT.encode("utf-32"), TEXT, "utf-32"),
+    (TEXT.encode("cp1252"), TEXT, "cp1252"),
+    (b"\x81\x8d\x8f\x90\x9d", "\x81\x8d\x8f\x90\x9d", "latin-1"),  # undefined in cp1252
+    (b"one\r\ntwo\rthree\n", "one\ntwo\nthree\n", "utf-8"),
+    (b"", "", "utf-8"),
+])
+def test_decode_bytes(data, text, encoding):
+    decoded, used = scanner.decode_bytes(data)
+    assert used == encoding
+    if text is not None:
+        assert decoded == text
+
+
+@pytest.mark.parametrize("size", [100, scanner.MMAP_THRESHOLD + 1])
+def test_decode_file_small_and_mapped(tmp_path, size):
+    body = ("é" + "x" * 99 + "\r\n") * (size // 102 + 1)
+    path = tmp_path / "file.txt"
+    path.write_bytes(body.encode("utf-8"))
+    assert scanner.Scanner.decode_file(path) == (body.replace("\r\n", "\n"), "utf-8")
+
+
+def test_unreadable_file(tmp_path):
+    text, encoding = scanner.Scanner.decode_file(tmp_path / "missing.txt")
+    assert encoding == "" and text.startswith("[Error reading file:")
@@ -0,0 +1,46 @@
+"""Byte-identical files are emitted once; later copies refer to the first."""
+
+import os
+
+import scanner
+from helpers import scan, write_tree
+
+SHARED = "def shared():\n    return 'the same body in three places'\n"
+
+
+def deduped(root, **options):
+    result = scan(root, **options)
+    result.find_duplicates()
+    return result
+
+
+def test_copies_refer_to_the_first(tmp_path):
+    root = write_tree(tmp_path / "tree", {
+        "a/one.py": SHARED, "b/two.py": SHARED, "c/three.py": SHARED,
+        "near.py": SHARED + "# differs\n",
+    })
+    result = deduped(root)
+    assert result.duplicate_of == {"b/two.py": "a/one.py", "c/three.py": "a/one.py"}
+    text = result.generate_snapshot()
+    assert text.count("the same body in three places") == 2  # a/one.py and near.py
+    assert "### b/two.py\n*Identical to `a/one.py`.*" in text
+    assert "### c/three.py\n*Identical to `a/one.py`.*" in text
+    assert result.dedup_saved_bytes == 2 * len(SHARED)
+
+
+def test_without_duplicates_the_snapshot_is_unchanged(project):
+    assert deduped(project).generate_snapshot() == scan(project).generate_snapshot()
+
+
+def test_cached_hashes_follow_edits(tmp_path):
+    root = write_tree(tmp_path / "tree", {"one.py": SHARED, "two.py": SHARED})
+    cache = scanner.SnapshotCache(tmp_path / "cache.sqlite3")
+    try:
+        assert deduped(root, cache=cache).duplicate_of == {"two.py": "one.py"}
+        path = root / "two.py"
+        st = path.stat()
+        path.write_text(SHARED.upper(), encoding="utf-8")
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        assert deduped(root, cache=cache).duplicate_of == {}
+    finally:
+        cache.close()
@@ -0,0 +1,72 @@
+"""clean_sprite despill: grows the background without wrapping, in reusable buffers."""
+
+import numpy as np
+import pytest
+
+import clean_sprite
+from helpers import sprite
+
+
+def grown_reference(mask, radius):
+    """Every pixel within Manhattan distance radius of a mask pixel."""
+    h, w = mask.shape
+    ys, xs = np.nonzero(mask)
+    yy, xx = np.mgrid[0:h, 0:w]
+    grown = np.zeros_like(mask)
+    for y, x in zip(ys, xs):
+        grown |= np.abs(yy - y) + np.abs(xx - x) <= radius
+    return grown
+
+
+@pytest.mark.parametrize("radius", [0, 1, 2, 3, 5])
+def test_grow_mask_matches_the_reference(radius):
+    rng = np.random.default_rng(radius)
+    mask = rng.random((19, 23)) < 0.05
+    expected = grown_reference(mask, radius)
+    assert np.array_equal(clean_sprite.grow_mask(mask, radius), expected)
+    out, scratch = np.empty_like(mask), np.empty_like(mask)
+    assert clean_sprite.grow_mask(mask, radius, out, scratch) is out
+    assert np.array_equal(out, expected)
+
+
+@pytest.mark.parametrize("pixel", [(1, 4), (2, 0), (0, 0), (3, 4)])
+def test_grow_mask_does_not_wrap_around(pixel):
+    # A flat or rolled shift would carry row ends into the next row, or the last row to the top
+    mask = np.zeros((4, 5), dtype=bool)
+    mask[pixel] = True
+    y, x = pixel
+    expected = {(y, x), (y - 1, x), (y + 1, x), (y, x - 1), (y, x + 1)}
+    expected = {(j, i) for j, i in expected if 0 <= j < 4 and 0 <= i < 5}
+    assert set(zip(*np.nonzero(clean_sprite.grow_mask(mask, 1)))) == expected
+
+
+@pytest.mark.parametrize("radius", [1, 2, 4])
+@pytest.mark.parametrize("strength", [1.0, 0.5, 0.0])
+def test_despill_touches_only_spill_near_the_background(radius, strength):
+    rgba = sprite(40, 50, seed=radius)
+    background = clean_sprite.build_green_mask(rgba[..., :3], 1, 0, 1.0)
+    before = rgba.copy()
+    clean_sprite.despill_edges(rgba, background, radius, strength)
+    
+    changed = np.any(rgba != before, axis=-1)
+    near = clean_sprite.grow_mask(background, radius) & ~background
+    assert not (changed & ~near).any()
+    assert np.array_equal(rgba[..., [0, 2, 3]], before[..., [0, 2, 3]])  # only green moves
+    max_rb = before[..., [0, 2]].max(axis=-1).astype(int)
+    excess = before[..., 1].astype(int) - max_rb
+    spilled = near & (excess > 0)
+    expected = before[..., 1].astype(int) - np.rint(excess * strength).astype(int)
+    assert np.array_equal(rgba[..., 1][spilled], expected[spilled])
+    assert changed.any() == (strength > 0 and spilled.any())
+
+
+def test_despill_buffers_are_reused_and_give_the_same_result():
+    rgba = sprite(33, 21, seed=4)
+    background = clean_sprite.build_green_mask(rgba[..., :3], 1, 0, 1.0)
+    expected = rgba.copy()
+    clean_sprite.despill_edges(expected, background, 3, 1.0)
+    buffers = np.empty((2, 40, 21), dtype=bool)  # taller than the image, as for strips
+    for _ in range(2):
+        again = rgba.copy()
+        clean_sprite.despill_edges(again, background, 3, 1.0, buffers=buffers)
+        assert np.array_equal(again, expected)
@@ -0,0 +1,89 @@
+"""--entry narrows the snapshot to the files an entry point imports, importers first."""
+
+import pytest
+
+import scanner
+from helpers import scan, write_tree
+
+TREE = {
+    "app.py": "import os\nfrom pkg import models\nfrom pkg.util import helper\n",
+    "pkg/__init__.py": "\"\"\"The package.\"\"\"\n",
+    "pkg/models.py": "from . import base\n",
+    "pkg/base.py": "from .util import helper\n",
+    "pkg/util.py": "import json\n",
+    "pkg/unused.py": "x = 1\n",
+    "web/src/main.ts": (
+        "import { a } from './lib/a';\nimport 'react';\nconst b = require('./lib/b.js');\n"
+    ),
+    "web/src/lib/a.ts": "export * from './shared';\n",
+    "web/src/lib/b.ts": "import data from './data.json';\n",
+    "web/src/lib/data.json": "{}\n",
+    "web/src/lib/shared/index.ts": "export const s = 1;\n",
+    "web/src/lib/unused.ts": "export {};\n",
+    "broken.py": "def (:\n",
+}
+
+
+@pytest.fixture
+def tree(tmp_path):
+    return write_tree(tmp_path / "tree", TREE)
+
+
+def closure(root, *entries):
+    result = scan(root)
+    result.apply_entries(list(entries))
+    return result, [rel_path for _, rel_path in result.files_to_include]
+
+
+def test_python_closure_in_import_order(tree):
+    _, order = closure(tree, "app.py")
+    assert sorted(order) == [
+        "app.py", "pkg/__init__.py", "pkg/base.py", "pkg/models.py", "pkg/util.py",
+    ]
+    imports = {
+        "app.py": ["pkg/__init__.py", "pkg/models.py", "pkg/util.py"],
+        "pkg/models.py": ["pkg/__init__.py", "pkg/base.py"],
+        "pkg/base.py": ["pkg/__init__.py", "pkg/util.py"],
+    }
+    for importer, targets in imports.items():
+        assert all(order.index(importer) < order.index(target) for target in targets)
+
+
+def test_import_cycles_end(tmp_path):
+    root = write_tree(tmp_path / "cycle", {
+        "a.py": "import b\n", "b.py": "from c import x\n",
+        "c.py": "import a\n", "d.py": "import a\n",
+    })
+    _, order = closure(root, "a.py")
+    assert order == ["a.py", "b.py", "c.py"]
+
+
+def test_typescript_closure_in_import_order(tree):
+    _, order = closure(tree, "web/src/main.ts")
+    assert order == [
+        "web/src/main.ts", "web/src/lib/a.ts", "web/src/lib/shared/index.ts",
+        "web/src/lib/b.ts", "web/src/lib/data.json",
+    ]
+
+
+def test_several_entries(tree):
+    result, order = closure(tree, "web/src/lib/b.ts", "pkg/unused.py", "broken.py")
+    assert order == ["web/src/lib/b.ts", "web/src/lib/data.json", "pkg/unused.py", "broken.py"]
+    assert result.structure_heading == "Dependencies of web/src/lib/b.ts, pkg/unused.py, broken.py"
+    assert "### web/src/lib/unused.ts" not in result.generate_snapshot()
+
+
+def test_unknown_entry(tree):
+    with pytest.raises(ValueError, match="not an included file: missing.py"):
+        closure(tree, "missing.py")
+
+
+@pytest.mark.parametrize("lang, content, expected", [
+    ("python", "import a.b, c\nfrom ..d import e, f\nfrom . import *\n",
+     [["a.b", []], ["c", []], ["..d", ["e", "f"]], [".", []]]),
+    ("typescript", "import x from \"./x\";\nexport { y } from '../y';\nawait import(`./z`);\n",
+     ["./x", "../y", "./z"]),
+    ("python", "not python (", []),
+])
+def test_parse_imports(lang, content, expected):
+    assert scanner.parse_imports(content, lang) == expected
@@ -0,0 +1,47 @@
+"""--excerpt keeps the head, the tail and the matching lines of large files."""
+
+import re
+
+import pytest
+
+import scanner
+
+HEAD, TAIL = scanner.EXCERPT_HEAD_LINES, scanner.EXCERPT_TAIL_LINES
+
+
+def expected_excerpt(lines, pattern=None):
+    """The excerpt of a file of lines, built the obvious way."""
+    if len(lines) <= HEAD + TAIL:
+        return "\n".join(lines)
+    hidden = range(HEAD, len(lines) - TAIL)
+    parts = lines[:HEAD]
+    matches = [i for i in hidden if pattern and re.search(pattern, lines[i])]
+    matches = matches[:scanner.EXCERPT_MAX_MATCHES]
+    note = f"lines {HEAD + 1:,}–{len(lines) - TAIL:,} of {len(lines):,} not shown"
+    if matches:
+        parts.append(f"… [{note}, except {len(matches)} matching] …")
+        parts += [f"{i + 1}: {lines[i]}" for i in matches]
+        parts.append("…")
+    else:
+        parts.append(f"… [{note}] …")
+    return "\n".join(parts + lines[-TAIL:])
+
+
+@pytest.mark.parametrize("count", [1, HEAD, HEAD + TAIL // 2, HEAD + TAIL, HEAD + TAIL + 1, 5_000])
+@pytest.mark.parametrize("newline", ["\n", ""])
+@pytest.mark.parametrize("pattern", [None, r"needle", r"line 1\d\d$"])
+def test_excerpt_matches_the_reference(tmp_path, count, newline, pattern):
+    lines = [f"line {i}" + (" needle" if i % 97 == 0 else "") for i in range(count)]
+    path = tmp_path / "big.txt"
+    path.write_text("\n".join(lines) + newline, encoding="utf-8")
+    compiled = re.compile(pattern.encode("utf-8"), re.M) if pattern else None
+    text, encoding = scanner.excerpt_file(path, compiled)
+    assert encoding == "utf-8"
+    assert text == expected_excerpt(lines, pattern)
+
+
+def test_long_lines_are_cut_on_a_character_boundary(tmp_path):
+    path = tmp_path / "bundle.js"
+    path.write_text("é" * 1_000 + "\n", encoding="utf-8")
+    text, _ = scanner.excerpt_file(path)
+    assert text == "é" * (scanner.EXCERPT_LINE_BYTES // 2) + " …"
@@ -0,0 +1,66 @@
+"""clean_sprite.flood_fill_from_edges: run-based labeling gives the pixel flood fill."""
+
+from collections import deque
+
+import numpy as np
+import pytest
+
+import clean_sprite
+
+NEIGHBORS = {
+    4: [(-1, 0), (1, 0), (0, -1), (0, 1)],
+    8: [(dy, dx) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if dy or dx],
+}
+
+
+def bfs_from_edges(mask, connectivity):
+    """The plain flood fill: every mask pixel reachable from a mask pixel on the border."""
+    h, w = mask.shape
+    filled = np.zeros_like(mask)
+    queue = deque(
+        (y, x) for y in range(h) for x in range(w)
+        if mask[y, x] and (y in (0, h - 1) or x in (0, w - 1))
+    )
+    for y, x in queue:
+        filled[y, x] = True
+    while queue:
+        y, x = queue.popleft()
+        for dy, dx in NEIGHBORS[connectivity]:
+            ny, nx = y + dy, x + dx
+            if 0 <= ny < h and 0 <= nx < w and mask[ny, nx] and not filled[ny, nx]:
+                filled[ny, nx] = True
+                queue.append((ny, nx))
+    return filled
+
+
+@pytest.mark.parametrize("connectivity", [4, 8])
+@pytest.mark.parametrize("density", [0.3, 0.55, 0.7, 0.9])
+@pytest.mark.parametrize("shape", [(1, 1), (1, 17), (23, 1), (16, 16), (37, 53)])
+def test_matches_bfs_on_random_masks(connectivity, density, shape):
+    rng = np.random.default_rng(hash((connectivity, density, shape)) % 2**32)
+    for _ in range(5):
+        mask = rng.random(shape) < density
+        expected = bfs_from_edges(mask, connectivity)
+        assert np.array_equal(clean_sprite.flood_fill_from_edges(mask, connectivity), expected)
+
+
+@pytest.mark.parametrize("connectivity", [4, 8])
+def test_enclosed_regions_stay(connectivity):
+    mask = np.ones((9, 9), dtype=bool)
+    mask[2:7, 2:7] = False  # a ring of foreground...
+    mask[4, 4] = True  # ...around a keyed pixel that does not touch the border
+    filled = clean_sprite.flood_fill_from_edges(mask, connectivity)
+    assert not filled[4, 4] and filled[0, 0] and filled.sum() == 81 - 25
+
+
+def test_diagonal_gaps_need_8_connectivity():
+    mask = np.zeros((5, 5), dtype=bool)
+    mask[0, 0] = mask[1, 1] = mask[2, 2] = True
+    assert clean_sprite.flood_fill_from_edges(mask, 4).sum() == 1
+    assert clean_sprite.flood_fill_from_edges(mask, 8).sum() == 3
+
+
+@pytest.mark.parametrize("fill", [False, True])
+def test_uniform_masks(fill):
+    mask = np.full((6, 7), fill)
+    assert np.array_equal(clean_sprite.flood_fill_from_edges(mask), mask)
@@ -0,0 +1,40 @@
+"""--git lists the files of the git index (plus untracked ones), honouring .gitignore."""
+
+import shutil
+import subprocess
+
+import pytest
+
+from helpers import scan, snapshot, write_tree
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="needs git")
+
+
+def git(root, *args):
+    subprocess.run(["git", *args], cwd=root, check=True, capture_output=True)
+
+
+@pytest.fixture
+def repo(project):
+    git(project, "init", "-q")
+    git(project, "add", "main.py", "src")
+    return project
+
+
+def test_git_listing_matches_the_walk(repo):
+    result = scan(repo, use_git=True)
+    assert result.enumeration == "git"
+    assert result.generate_snapshot() == snapshot(repo)
+
+
+def test_gitignored_files_are_left_out(repo):
+    write_tree(repo, {".gitignore": "docs/\n*.bin\n"})
+    result = scan(repo, use_git=True)
+    included = {rel_path for _, rel_path in result.files_to_include}
+    assert "docs/guide.txt" not in included
+    assert "util.py" in included  # untracked, but not ignored
+    assert "image.bin" not in "\n".join(result.tree_lines)
+
+
+def test_outside_a_work_tree_falls_back_to_walking(project):
+    assert scan(project, use_git=True).enumeration == "walk"
@@ -0,0 +1,73 @@
+"""Ignore patterns follow .gitignore semantics (IgnoreMatcher, --ignore, .scannerignore)."""
+
+import pytest
+
+import scanner
+from helpers import scan, write_tree
+
+
+def matches(patterns, rel_path, is_dir=False):
+    name = rel_path.rsplit("/", 1)[-1]
+    return scanner.IgnoreMatcher((), patterns).match(rel_path, name, is_dir)
+
+
+@pytest.mark.parametrize(
+    "pattern, rel_path, is_dir, expected",
+    [
+        # Without a slash a pattern matches a name at any depth
+        ("*.log", "debug.log", False, True),
+        ("*.log", "a/b/debug.log", False, True),
+        ("*.log", "debug.log.txt", False, None),
+        # A leading or inner slash anchors it at the root
+        ("/build.txt", "build.txt", False, True),
+        ("/build.txt", "sub/build.txt", False, None),
+        ("docs/*.md", "docs/a.md", False, True),
+        ("docs/*.md", "x/docs/a.md", False, None),
+        # * and ? stay within one segment, ** crosses them
+        ("docs/*.md", "docs/sub/a.md", False, None),
+        ("docs/**/*.md", "docs/sub/deep/a.md", False, True),
+        ("docs/**/*.md", "docs/a.md", False, True),
+        ("**/cache", "a/b/cache", True, True),
+        ("logs/**", "logs/a/b.txt", False, True),
+        ("file?.txt", "file1.txt", False, True),
+        ("file?.txt", "file10.txt", False, None),
+        # Character classes, with ! negating them
+        ("file[0-9].txt", "file7.txt", False, True),
+        ("file[!0-9].txt", "file7.txt", False, None),
+        ("file[!0-9].txt", "fileA.txt", False, True),
+        # A trailing slash only matches directories
+        ("generated/", "generated", True, True),
+        ("generated/", "generated", False, None),
+        # Escapes, blank lines and comments
+        ("\\#notes.txt", "#notes.txt", False, True),
+        ("\\!important.txt", "!important.txt", False, True),
+        ("# comment", "# comment", False, None),
+        ("", "anything", False, None),
+    ],
+)
+def test_pattern_semantics(pattern, rel_path, is_dir, expected):
+    assert matches([pattern], rel_path, is_dir) is expected
+
+
+def test_last_matching_pattern_wins():
+    patterns = ["*.log", "!keep.log", "very/keep.log"]
+    assert matches(patterns, "debug.log") is True
+    assert matches(patterns, "keep.log") is False
+    assert matches(patterns, "a/keep.log") is False
+    assert matches(patterns, "very/keep.log") is True
+
+
+def test_plain_names_are_matched_after_patterns():
+    matcher = scanner.IgnoreMatcher({"secret.txt"}, ["!secret.txt"])
+    assert matcher.match("secret.txt", "secret.txt", False) is False
+    assert scanner.IgnoreMatcher({"secret.txt"}, []).match("a/secret.txt", "secret.txt", False)
+
+
+def test_scanner_applies_ignore_file_and_extra_patterns(project):
+    write_tree(project, {scanner.IGNORE_FILE_NAME: "src/lib/\n*.txt\n"})
+    result = scan(project, ignore_patterns=["!docs/guide.txt", "util.py"])
+    included = {rel_path for _, rel_path in result.files_to_include}
+    assert included == {"main.py", "src/app.ts", "docs/guide.txt"}
+    tree = "\n".join(result.tree_lines)
+    assert "lib/" not in tree and "node_modules" not in tree
+
@@ -0,0 +1,58 @@
+"""clean_sprite key tables: a lookup per pixel gives what evaluate_key works out."""
+
+import numpy as np
+import pytest
+
+import clean_sprite
+
+SPECS = [
+    clean_sprite.KeySpec("rgb", *clean_sprite.MODE_DEFAULTS["all-green"], "", 0.0),
+    clean_sprite.KeySpec("rgb", *clean_sprite.MODE_DEFAULTS["background"], "", 0.0),
+    clean_sprite.KeySpec("hsv", 0, 0, 0.0, "00ff00", 30.0),
+    clean_sprite.KeySpec("hsv", 0, 0, 0.0, "ff00ff", 10.0),  # a key hue that wraps around 0
+    clean_sprite.KeySpec("ycbcr", 0, 0, 0.0, "00ff00", 40.0),
+    clean_sprite.KeySpec("ycbcr", 0, 0, 0.0, "0047bb", 25.0),
+]
+
+
+@pytest.mark.parametrize("spec", SPECS, ids=lambda spec: f"{spec.space}-{spec.color or spec.g_min}")
+@pytest.mark.parametrize("channels", [3, 4])
+def test_table_matches_evaluate_key(spec, channels):
+    rng = np.random.default_rng(channels)
+    # Random colours, plus the corners and the greys; odd sizes straddle the chunks
+    count = clean_sprite.KEY_CHUNK_PIXELS * 2 + 7
+    pixels = rng.integers(0, 256, size=(count, channels), dtype=np.uint8)
+    corners = np.array([[r, g, b] for r in (0, 255) for g in (0, 255) for b in (0, 255)])
+    pixels[:8, :3] = corners
+    pixels[8:264, :3] = np.arange(256)[:, np.newaxis]
+    pixels = pixels.reshape(1, count, channels)
+    expected = clean_sprite.evaluate_key(pixels[..., :3], spec)
+    table = clean_sprite.key_table(spec)
+    assert np.array_equal(clean_sprite.apply_key_table(pixels, table), expected)
+
+
+def test_non_contiguous_input():
+    spec = SPECS[0]
+    rgba = np.random.default_rng(1).integers(0, 256, size=(40, 60, 4), dtype=np.uint8)
+    view = rgba[::2, 5:50]
+    table = clean_sprite.key_table(spec)
+    for pixels in (view, rgba[..., :3]):
+        expected = clean_sprite.evaluate_key(pixels, spec)
+        assert np.array_equal(clean_sprite.apply_key_table(pixels, table), expected)
+
+
+def test_tables_are_cached_on_disk(cache_home):
+    spec = clean_sprite.KeySpec("ycbcr", 0, 0, 0.0, "123456", 12.5)
+    tables = cache_home / "clean_sprite"
+    before = set(tables.glob("*.bits"))
+    table = clean_sprite.key_table(spec)
+    (path,) = set(tables.glob("*.bits")) - before
+    assert path.stat().st_size == clean_sprite.KEY_TABLE_BYTES
+    clean_sprite.key_table.cache_clear()
+    assert np.array_equal(clean_sprite.key_table(spec), table)
+    
+    # A truncated table is compiled again
+    path.write_bytes(path.read_bytes()[:100])
+    clean_sprite.key_table.cache_clear()
+    assert np.array_equal(clean_sprite.key_table(spec), table)
+    assert path.stat().st_size == clean_sprite.KEY_TABLE_BYTES
@@ -0,0 +1,53 @@
+"""--minify strips comments and whitespace without touching string literals."""
+
+import pytest
+
+import scanner
+from helpers import scan, write_tree
+
+
+@pytest.mark.parametrize("lang, source, expected", [
+    ("python",
+     'def f(x):\n    # comment\n    return "# not a comment"  # trailing\n\n\n\ny = 1   \n',
+     'def f(x):\n    return "# not a comment"\n\ny = 1\n'),
+    ("typescript",
+     'const a = "// keep"; // drop\n/* block\n comment */\nconst t = `/* keep */`;\n',
+     'const a = "// keep";\nconst t = `/* keep */`;\n'),
+    ("javascript", "const re = /\\/\\/x/; // drop\n", "const re = /\\/\\/x/;\n"),
+    ("c", 'int a = 1; // drop\nchar *s = "/* keep */";\n', 'int a = 1;\nchar *s = "/* keep */";\n'),
+    ("css", "a { color: red; } /* drop */\n", "a { color: red; }\n"),
+    ("bash", 'echo "#keep" # drop\n', 'echo "#keep"\n'),
+    ("html", "<p>x</p><!-- drop -->\n", "<p>x</p>\n"),
+    ("sql", "select '--keep' -- drop\n", "select '--keep'\n"),
+    ("text", "# stays\n\n\n\nand so do these\n", "# stays\n\nand so do these\n"),
+])
+def test_minify(lang, source, expected):
+    assert scanner.minify(source, lang) == expected
+
+
+def test_long_base64_runs_are_elided():
+    blob = "QUJD" * 100
+    assert scanner.minify(f"data = '{blob}'\n", "python") == "data = '…[400 base64 chars]'\n"
+    short = "QUJD" * 10
+    assert scanner.minify(f"data = '{short}'\n", "python") == f"data = '{short}'\n"
+
+
+def test_cached_counts_follow_the_minify_version(tmp_path, monkeypatch):
+    root = write_tree(tmp_path / "tree", {"main.py": "x = 1  # " + "words " * 50 + "\n"})
+    cache = scanner.SnapshotCache(tmp_path / "cache.sqlite3")
+    counter = scanner.TokenCounter()
+    
+    def minified_tokens():
+        result = scan(root, cache=cache)
+        result.minify = True
+        return result._count_file_tokens(counter)["main.py"]
+    
+    try:
+        assert minified_tokens() == counter.count("x = 1")
+        monkeypatch.setattr(scanner, "minify", lambda content, lang: content)
+        assert minified_tokens() == counter.count("x = 1")  # served from the cache
+        monkeypatch.setattr(scanner, "MINIFY_VERSION", scanner.MINIFY_VERSION + 1)
+        monkeypatch.setattr(scanner, "MINIFIED_SUFFIX", f"\0minified-v{scanner.MINIFY_VERSION}")
+        assert minified_tokens() == counter.count((root / "main.py").read_text().rstrip())
+    finally:
+        cache.close()
@@ -0,0 +1,64 @@
+"""--format pack: every body comes back out of PackReader as the snapshot emitted it."""
+
+import pytest
+
+import scanner
+from helpers import run_cli, scan, write_tree
+
+COMPRESSIONS = [
+    "none",
+    "gzip",
+    pytest.param("zstd", marks=pytest.mark.skipif(
+        scanner.zstandard is None, reason="needs the zstandard package"
+    )),
+]
+
+
+@pytest.fixture
+def tree(project):
+    shared = "export const shared = 'same in both';\n"
+    return write_tree(project, {
+        "src/one.ts": shared, "src/two.ts": shared, "latin1.txt": "caf\xe9\n".encode("latin-1"),
+    })
+
+
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+def test_round_trip(tree, tmp_path, compression):
+    result = scan(tree)
+    result.find_duplicates()
+    path = tmp_path / "snapshot.pack"
+    scanner.write_pack(result, path, compression)
+    entries = list(result.iter_entries())
+    
+    with scanner.PackReader(path) as pack:
+        assert pack.structure() == "\n".join(result.tree_lines)
+        assert list(pack.files) == [entry.rel_path for entry in entries]
+        for entry in entries:
+            expected = entry.content
+            if entry.kind == "duplicate":
+                expected = result._expand_duplicate(entry.rel_path).content
+            assert pack.read(entry.rel_path) == expected
+        # A duplicate points at the block of the file it repeats
+        copy, original = pack.files["src/two.ts"], pack.files["src/one.ts"]
+        assert copy["duplicate_of"] == "src/one.ts"
+        assert copy["offset"] == original["offset"]
+        assert pack.files["latin1.txt"]["encoding"] != "utf-8"
+        with pytest.raises(KeyError):
+            pack.read("node_modules/pkg/index.js")
+
+
+def test_not_a_pack(tmp_path):
+    path = tmp_path / "snapshot.md"
+    path.write_text("# not a pack\n" * 10, encoding="utf-8")
+    with pytest.raises(ValueError):
+        scanner.PackReader(path)
+
+
+def test_pack_under_the_root_is_not_packed(tree):
+    output = tree / "snapshot.pack"
+    run_cli(tree, "--no-cache", "--format", "pack", "-o", output)
+    first = output.read_bytes()
+    run_cli(tree, "--no-cache", "--format", "pack", "-o", output)
+    assert output.read_bytes() == first
+    with scanner.PackReader(output) as pack:
+        assert not [rel_path for rel_path in pack.files if rel_path.startswith("snapshot.pack")]
@@ -0,0 +1,22 @@
+"""Parallel walks and reads (--jobs, --processes) give the serial snapshot."""
+
+import pytest
+
+from helpers import scan, snapshot
+
+COUNTED = ("dirs", "files", "included", "binary", "empty")
+
+
+@pytest.mark.parametrize("jobs", [2, 8])
+def test_threads_match_serial(project, jobs):
+    assert snapshot(project, jobs=jobs) == snapshot(project, jobs=1)
+
+
+def test_processes_match_serial(project):
+    assert snapshot(project, jobs=4, use_processes=True) == snapshot(project, jobs=1)
+
+
+def test_stats_match_serial(project):
+    serial, parallel = scan(project, jobs=1), scan(project, jobs=4)
+    assert [serial.stats[k] for k in COUNTED] == [parallel.stats[k] for k in COUNTED]
+    assert serial.stats["included"] == 7
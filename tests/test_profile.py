@@ -0,0 +1,54 @@
+"""--profile / --stats-json: phase times and a machine-readable report of the run."""
+
+import json
+import time
+
+import scanner
+from helpers import run_cli
+
+
+def test_nested_phases_count_their_own_time():
+    profile = scanner.Profile(enabled=True)
+    with profile.phase("outer"):
+        time.sleep(0.01)
+        with profile.phase("inner"):
+            time.sleep(0.2)
+    assert profile.phases["inner"] >= 0.2
+    assert 0.01 <= profile.phases["outer"] < 0.15
+    assert sum(profile.phases.values()) <= profile.elapsed
+
+
+def test_timed_streams_count_as_their_phase():
+    profile = scanner.Profile(enabled=True)
+    
+    def slow_chunks():
+        for chunk in "abc":
+            time.sleep(0.01)
+            yield chunk
+    
+    assert "".join(profile.timed("render", slow_chunks())) == "abc"
+    assert profile.phases["render"] >= 0.03
+
+
+def test_stats_json_describes_the_snapshot(project):
+    output, stats_path = project / "out.md", project / "stats.json"
+    run_cli(project, "--no-cache", "--stats-json", stats_path, "-o", output)
+    stats = json.loads(stats_path.read_text(encoding="utf-8"))
+    text = output.read_text(encoding="utf-8")
+    
+    assert stats["root"] == str(project.resolve())
+    assert stats["snapshot"]["chars"] == len(text)
+    assert stats["snapshot"]["lines"] == text.count("\n") + 1
+    assert stats["stats"]["included"] == 7
+    assert {"scan", "render", "output"} <= set(stats["phases"])
+    assert stats["syscalls"]["total"] == sum(
+        count for name, count in stats["syscalls"].items() if name != "total"
+    )
+    assert {item["path"] for item in stats["top_files"]} <= {
+        "main.py", "util.py", "src/app.ts", "src/lib/a.ts", "src/lib/b.ts",
+        "src/lib/deep/c.ts", "docs/guide.txt",
+    }
+    
+    # Neither the snapshot nor the report of the previous run shows up in the next one
+    run_cli(project, "--no-cache", "--stats-json", stats_path, "-o", output)
+    assert output.read_text(encoding="utf-8") == text
@@ -0,0 +1,66 @@
+"""--shard-tokens splits the snapshot into self-contained shards within the limit."""
+
+import json
+import random
+
+import pytest
+
+import scanner
+from helpers import run_cli, scan, write_tree
+
+
+@pytest.fixture
+def sized(tmp_path):
+    rng = random.Random(13)
+    files = {
+        f"{rng.choice(['a', 'b/c', 'b/d/e'])}/f{i}.py": "".join(
+            f"name_{j} = {rng.randrange(10**6)}\n" for j in range(rng.randrange(2, 80))
+        )
+        for i in range(40)
+    }
+    files["copies/one.py"] = files["copies/two.py"] = "shared = True\n" * 20
+    return write_tree(tmp_path / "sized", files)
+
+
+@pytest.mark.parametrize("shard_tokens", range(400, 8_000, 607))
+def test_shards_stay_within_the_limit_and_cover_every_file(sized, tmp_path, shard_tokens):
+    result = scan(sized)
+    result.find_duplicates()
+    counter = scanner.TokenCounter()
+    result.plan_shards(shard_tokens, counter)
+    stats, index_path = scanner.write_shards(result, tmp_path / "out.md", counter)
+    
+    assert [path for shard in result.shards for path in shard] == [
+        rel_path for _, rel_path in result.files_to_include
+    ]
+    for shard, shard_stats in zip(result.shards, stats):
+        assert shard_stats.tokens <= shard_tokens or len(shard) == 1
+    index = json.loads(index_path.read_text(encoding="utf-8"))
+    for number, entry in enumerate(index["shards"], 1):
+        text = (tmp_path / entry["file"]).read_text(encoding="utf-8")
+        assert entry["file"] == f"out.part{number:02d}.md"
+        # Each shard emits the content of its own files, references only within itself
+        for rel_path in entry["paths"]:
+            assert f"### {rel_path}\n" in text
+        assert counter.count(text) == entry["tokens"]
+
+
+def test_fewer_shards_remove_the_leftovers(sized, tmp_path):
+    output = tmp_path / "out.md"
+    for shard_tokens, expected in ((600, None), (10**6, 1)):
+        result = scan(sized)
+        result.plan_shards(shard_tokens, scanner.TokenCounter())
+        scanner.write_shards(result, output)
+        expected = expected or len(result.shards)
+        assert len(list(tmp_path.glob("out.part*.md"))) == expected
+
+
+def test_shards_under_the_root_are_not_snapshotted(sized):
+    output = sized / "out.md"
+    run_cli(sized, "--no-cache", "--shard-tokens", 1_000, "-o", output)
+    first = sorted(path.name for path in sized.iterdir())
+    assert "out.part02.md" in first and "out.index.json" in first
+    run_cli(sized, "--no-cache", "--shard-tokens", 1_000, "-o", output)
+    assert sorted(path.name for path in sized.iterdir()) == first
+    index = json.loads((sized / "out.index.json").read_text(encoding="utf-8"))
+    assert not [rel_path for rel_path in index["paths"] if rel_path.startswith("out.")]
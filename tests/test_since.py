@@ -0,0 +1,49 @@
+"""--since emits only what changed since the run that wrote a manifest."""
+
+import json
+
+from helpers import run_cli
+
+
+def test_delta_lists_added_modified_and_removed(project):
+    output = project / "out.md"
+    run_cli(project, "--no-cache", "-o", output)
+    manifest = project / "out.md.manifest.json"
+    assert "util.py" in json.loads(manifest.read_text(encoding="utf-8"))["files"]
+    
+    (project / "util.py").write_text("VALUE = 2\n", encoding="utf-8")
+    (project / "docs" / "guide.txt").unlink()
+    (project / "src" / "lib" / "new.ts").write_text("export {};\n", encoding="utf-8")
+    run_cli(project, "--no-cache", "--since", manifest, "-o", output)
+    delta = output.read_text(encoding="utf-8")
+    
+    assert "util.py [modified]" in delta
+    assert "guide.txt [removed]" in delta
+    assert "new.ts [added]" in delta
+    assert "### util.py\n```python\nVALUE = 2\n```" in delta
+    assert "### src/lib/new.ts" in delta
+    # Unchanged files, and the run's own snapshot and manifest, are left out
+    assert "main.py" not in delta
+    assert "out.md" not in delta.replace("out.md.manifest.json", "")
+    assert "### out.md.manifest.json" not in delta
+
+
+def test_nothing_changed_gives_an_empty_delta(project):
+    output = project / "out.md"
+    manifest = project / "out.md.manifest.json"
+    run_cli(project, "--no-cache", "-o", output)
+    # Rewriting the snapshot and the manifest under the root is not a change either
+    run_cli(project, "--no-cache", "--since", manifest, "-o", output)
+    run_cli(project, "--no-cache", "--since", manifest, "-o", output)
+    assert "## Files" not in output.read_text(encoding="utf-8")
+
+
+def test_diff_renders_modified_files_from_the_cache(project, tmp_path):
+    cache = ("--cache-dir", tmp_path / "cache")
+    output = tmp_path / "out.md"
+    run_cli(project, *cache, "-o", output)
+    (project / "main.py").write_text("import util\n\nprint(util.VALUE + 1)\n", encoding="utf-8")
+    run_cli(project, *cache, "--since", f"{output}.manifest.json", "--diff", "-o", output)
+    delta = output.read_text(encoding="utf-8")
+    assert "### main.py (diff)" in delta
+    assert "-print(util.VALUE)\n+print(util.VALUE + 1)" in delta
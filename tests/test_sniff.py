@@ -0,0 +1,43 @@
+"""Binary files are told apart by their contents, whatever their extension."""
+
+import codecs
+
+import pytest
+
+import scanner
+from helpers import scan, write_tree
+
+TEXT = "def f():\n    return 'héllo'\n"
+
+
+@pytest.mark.parametrize(
+    "head, expected",
+    [
+        (b"", False),
+        (TEXT.encode("utf-8"), False),
+        (codecs.BOM_UTF8 + TEXT.encode("utf-8"), False),
+        (TEXT.encode("latin-1"), False),
+        (codecs.BOM_UTF16_LE + TEXT.encode("utf-16-le"), False),
+        (codecs.BOM_UTF16_BE + TEXT.encode("utf-16-be"), False),
+        (codecs.BOM_UTF32_LE + TEXT.encode("utf-32-le"), False),
+        (codecs.BOM_UTF32_BE + TEXT.encode("utf-32-be"), False),
+        (b"\x89PNG\r\n\x1a\n" + b"IHDR", True),
+        (b"text with a \x00 NUL", True),
+        (bytes(range(1, 32)) * 4, True),
+        (bytes(range(0x80, 0x100)), True),
+    ],
+)
+def test_sniff_binary(head, expected):
+    assert scanner.sniff_binary(head) is expected
+
+
+def test_probe_ending_inside_a_character_is_not_invalid():
+    head = ("é" * 100).encode("utf-8")[:-1]
+    assert scanner.sniff_binary(head) is False
+
+
+def test_unknown_extensions_are_sniffed(tmp_path):
+    root = write_tree(tmp_path / "root", {"blob.dat": b"\x00\xff" * 200, "notes.dat": TEXT})
+    result = scan(root)
+    assert [rel_path for _, rel_path in result.files_to_include] == ["notes.dat"]
+    assert "blob.dat [binary]" in "\n".join(result.tree_lines)
@@ -0,0 +1,29 @@
+"""The snapshot streams to its destination in chunks and is counted on the way."""
+
+import pytest
+
+import scanner
+from helpers import run_cli, scan
+
+
+def test_chunks_join_to_the_snapshot(project):
+    result = scan(project)
+    chunks = list(result.iter_snapshot())
+    assert len(chunks) > 1
+    assert "".join(chunks) == result.generate_snapshot()
+
+
+def test_stdout_matches_the_output_file(project, tmp_path):
+    output = tmp_path / "snapshot.md"
+    run_cli(project, "--no-cache", "-o", output)
+    streamed = run_cli(project, "--no-cache", "-o", "-").stdout
+    assert streamed == output.read_text(encoding="utf-8")
+
+
+@pytest.mark.parametrize("text", ["", "one line", "a\nb\n", "x" * 1_001 + "\n\ny"])
+def test_stats_count_what_streams_by(text):
+    stats = scanner.SnapshotStats()
+    chunks = [text[i : i + 7] for i in range(0, len(text), 7)]
+    assert list(stats.count(chunks)) == chunks
+    assert (stats.chars, stats.lines) == (len(text), text.count("\n") + 1)
+    assert stats.tokens == scanner.estimate_tokens(text)
@@ -0,0 +1,49 @@
+"""The scandir walker: one stat per kept file, and a finite walk over any symlinks."""
+
+import os
+import sys
+
+import pytest
+
+from helpers import scan, write_tree
+
+needs_symlinks = pytest.mark.skipif(sys.platform == "win32", reason="needs symlinks")
+
+
+def test_one_stat_per_file(project):
+    result = scan(project)
+    # Directories come from d_type; every file left after the ignore rules is stat'ed once
+    assert result.syscalls.counts["stat"] == result.stats["files"] == 9
+    assert result.syscalls.counts["scandir"] == result.stats["dirs"] + 1
+
+
+@needs_symlinks
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_symlink_cycles_are_not_followed(tmp_path, jobs):
+    root = write_tree(tmp_path / "tree", {"sub/a.py": "a = 1\n", "other/o.py": "o = 1\n"})
+    outside = write_tree(tmp_path / "outside", {"z.py": "z = 1\n"})
+    os.symlink(".", root / "sub" / "self")
+    os.symlink("..", root / "sub" / "up")
+    os.symlink("../other", root / "sub" / "sibling")
+    os.symlink(outside, root / "ext")
+    os.symlink(root, outside / "back")  # a loop through a directory outside the root
+    os.symlink("loop", root / "loop")
+    os.symlink("missing", root / "broken")
+    
+    result = scan(root, jobs=jobs)
+    assert sorted(rel_path for _, rel_path in result.files_to_include) == [
+        "ext/z.py", "other/o.py", "sub/a.py", "sub/sibling/o.py",
+    ]
+
+
+@pytest.mark.skipif(sys.platform == "win32" or os.geteuid() == 0, reason="needs permissions")
+def test_unreadable_directories_are_skipped(project):
+    locked = project / "src" / "lib"
+    locked.chmod(0)
+    try:
+        result = scan(project)
+    finally:
+        locked.chmod(0o755)
+    included = [rel_path for _, rel_path in result.files_to_include]
+    assert "src/app.ts" in included
+    assert not [rel_path for rel_path in included if rel_path.startswith("src/lib")]
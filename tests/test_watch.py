@@ -0,0 +1,67 @@
+"""--watch regenerates on changes to the tree, never on the run's own output."""
+
+import sys
+
+import pytest
+
+import scanner
+from helpers import run_cli, scan
+
+
+WATCHERS = [
+    pytest.param(lambda result: scanner.PollingWatcher(result, interval=0), id="polling"),
+    pytest.param(
+        lambda result: scanner.InotifyWatcher(skip=result.writes), id="inotify",
+        marks=pytest.mark.skipif(not sys.platform.startswith("linux"), reason="needs inotify"),
+    ),
+]
+
+
+def watched(root):
+    """A Scanner that has scanned root keeping its listings, as --watch does."""
+    result = scanner.Scanner(root)
+    result.retain_listings = True
+    result.scan()
+    return result
+
+
+def test_output_under_the_root_is_not_snapshotted(project):
+    output = project / "snapshot-out.md"
+    run_cli(project, "--no-cache", "-o", output)
+    first = output.read_text(encoding="utf-8")
+    run_cli(project, "--no-cache", "-o", output)
+    assert output.read_text(encoding="utf-8") == first
+    assert "snapshot-out" not in first
+
+
+@pytest.mark.parametrize("make_watcher", WATCHERS)
+def test_writing_the_output_is_not_a_change(project, make_watcher):
+    result = watched(project)
+    output = project / "out.md"
+    result.exclude_outputs([output])
+    watcher = make_watcher(result)
+    try:
+        watcher.watch(result.watched_dirs())
+        output.write_text("snapshot", encoding="utf-8")
+        (project / "out.md.tmp").write_text("partial", encoding="utf-8")
+        (project / "out.md.tmp").replace(output)
+        assert not watcher.wait(0.05)
+        (project / "src" / "new.ts").write_text("export {};\n", encoding="utf-8")
+        assert watcher.wait(0.05) == {project.resolve() / "src"}
+    finally:
+        watcher.close()
+
+
+@pytest.mark.parametrize("make_watcher", WATCHERS)
+def test_refresh_picks_up_the_change(project, make_watcher):
+    result = watched(project)
+    watcher = make_watcher(result)
+    try:
+        watcher.watch(result.watched_dirs())
+        (project / "src" / "lib" / "new.ts").write_text("export {};\n", encoding="utf-8")
+        (project / "docs" / "guide.txt").unlink()
+        result.refresh(watcher.wait(0.05))
+        assert "### src/lib/new.ts" in result.generate_snapshot()
+        assert result.generate_snapshot() == scan(project).generate_snapshot()
+    finally:
+        watcher.close()
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Benchmark scanner.py on synthetic project trees and write the results as JSON.
+
+- Generates reproducible trees (1k/10k/100k files by default presets) with
+  mixed file sizes, a share of binaries, deep nesting and ignored directories,
+  in a tmpfs directory (/dev/shm when available) so the disk is not measured.
+- Times each phase: walk (directory traversal and tree building), stat
+  (stat and classification of each file) and sniff (probing file heads for
+  binary content), all three taken from the scanner's Profile within one
+  Scanner.scan() (CPU time summed over the threads with --jobs > 1);
+  read/decode (cold, filling the snapshot cache), render
+  (streaming the snapshot from the warm cache) and output (approximate: a
+  second render streamed into a file, minus the render time).
+- Runs every case in a fresh child process to record its own peak RSS.
+
+Usage: python tools/bench_scanner.py [--cases 1k,10k] [--jobs N] [--repeat N] [-o results.json]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# name -> (files, max depth)
+PRESETS: dict[str, tuple[int, int]] = {
+    "1k": (1_000, 6),
+    "10k": (10_000, 10),
+    "100k": (100_000, 14),
+}
+
+# (weight, min bytes, max bytes) of the text file sizes; the last bucket exceeds MAX_FILE_SIZE
+SIZE_BUCKETS: list[tuple[float, int, int]] = [
+    (0.55, 100, 2_000),
+    (0.30, 2_000, 16_000),
+    (0.13, 16_000, 90_000),
+    (0.02, 110_000, 400_000),
+]
+
+TEXT_EXTENSIONS = [".ts", ".tsx", ".py", ".json", ".md", ".css", ".txt", ".unknownext"]
+BINARY_EXTENSIONS = [".png", ".woff2"]  # skipped by extension
+SNIFFED_EXTENSIONS = [".blob", ""]  # binary content the scanner has to sniff
+IGNORED_DIRS = ["node_modules", ".git", "dist"]
+
+
+def default_base_dir() -> Path:
+    shm = Path("/dev/shm")
+    if shm.is_dir() and os.access(shm, os.W_OK):
+        return shm
+    return Path(tempfile.gettempdir())
+
+
+def text_pool(rng: random.Random, size: int = 1 << 19) -> str:
+    """A block of code-like text that file contents are sliced from."""
+    words = ["const", "return", "import", "value", "items", "render", "player", "level",
+             "update", "export", "function", "if", "else", "for", "tile", "sprite", "=", "{", "}"]
+    lines = []
+    total = 0
+    while total < size:
+        indent = "    " * rng.randrange(4)
+        line = indent + " ".join(rng.choice(words) for _ in range(rng.randrange(2, 12)))
+        lines.append(line)
+        total += len(line) + 1
+    return "\n".join(lines) + "\n"
+
+
+def pick_size(rng: random.Random) -> int:
+    roll = rng.random()
+    for weight, low, high in SIZE_BUCKETS:
+        if roll < weight:
+            return rng.randrange(low, high)
+        roll -= weight
+    return SIZE_BUCKETS[-1][1]
+
+
+def generate_tree(
+    root: Path,
+    files: int,
+    depth: int,
+    binary_ratio: float,
+    ignored_ratio: float,
+    seed: int,
+) -> dict:
+    """Write a synthetic tree under root; returns a summary of what was written."""
+    rng = random.Random(seed)
+    pool = text_pool(rng)
+    binary_pool = rng.randbytes(1 << 16)
+
+    # A skewed directory tree: a few wide directories, some deep chains
+    dirs = [root]
+    for _ in range(max(1, files // 12)):
+        parent = rng.choice(dirs)
+        if len(parent.relative_to(root).parts) >= depth:
+            parent = root
+        dirs.append(parent / f"d{len(dirs)}")
+    ignored = [root / name / f"pkg{i}" for name in IGNORED_DIRS for i in range(3)]
+    for directory in dirs + ignored:
+        directory.mkdir(parents=True, exist_ok=True)
+
+    summary = {"files": 0, "dirs": len(dirs) + len(ignored), "bytes": 0, "binary": 0, "ignored": 0}
+    for i in range(files):
+        if rng.random() < ignored_ratio:
+            directory = rng.choice(ignored)
+            summary["ignored"] += 1
+        else:
+            directory = rng.choice(dirs)
+        if rng.random() < binary_ratio:
+            ext = rng.choice(BINARY_EXTENSIONS + SNIFFED_EXTENSIONS)
+            size = rng.randrange(512, 64_000)
+            start = rng.randrange(len(binary_pool) - min(size, len(binary_pool) - 1))
+            data = (binary_pool[start:] + binary_pool)[:size]
+            (directory / f"f{i}{ext}").write_bytes(data)
+            summary["binary"] += 1
+        else:
+            size = pick_size(rng)
+            start = rng.randrange(len(pool))
+            text = (pool[start:] + pool * (1 + size // len(pool)))[:size]
+            (directory / f"f{i}{rng.choice(TEXT_EXTENSIONS)}").write_text(text, encoding="utf-8")
+        summary["files"] += 1
+        summary["bytes"] += size
+    return summary
+
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_case(root: Path, jobs: int, repeat: int) -> dict:
+    """Time the phases on an existing tree (best of repeat); runs in a child process."""
+    sys.path.insert(0, str(REPO_ROOT))
+    import scanner as scanner_module
+
+    best: dict[str, float] = {}
+    result: dict = {}
+    cache_path = root.parent / f"{root.name}.cache.sqlite3"
+    out_path = root.parent / f"{root.name}.snapshot.md"
+    for _ in range(repeat):
+        cache_path.unlink(missing_ok=True)
+        cache = scanner_module.SnapshotCache(cache_path)
+        scanner = scanner_module.Scanner(root, jobs=jobs, cache=cache)
+
+        # walk, stat, sniff: one scan(), split by the phases the scanner records in its Profile.
+        # Each phase counts its own time only, so they add up to the scan; with jobs > 1, stat
+        # and sniff run in the worker threads and are summed over them instead
+        profile = scanner_module.Profile()
+        scanner.profile = profile
+        start = time.perf_counter()
+        with profile.phase("walk"):
+            scanner.scan()
+        scanned = time.perf_counter() - start
+        scanner.profile = None
+        phases = {name: profile.phases.get(name, 0.0) for name in ("walk", "stat", "sniff")}
+
+        # read/decode: every included file, stored into the cache (on the same tmpfs)
+        start = time.perf_counter()
+        chars_read = sum(len(loaded.content) for loaded in scanner._load_all())
+        phases["read"] = time.perf_counter() - start
+
+        # render: the snapshot stream, contents served from the cache
+        start = time.perf_counter()
+        snapshot_chars = sum(len(chunk) for chunk in scanner.iter_snapshot())
+        phases["render"] = time.perf_counter() - start
+
+        # output: what streaming the same snapshot into a file adds on top of rendering it
+        start = time.perf_counter()
+        with open(out_path, "w", encoding="utf-8") as f:
+            f.writelines(scanner.iter_snapshot())
+        phases["output"] = max(0.0, time.perf_counter() - start - phases["render"])
+        out_path.unlink()
+
+        phases["total"] = scanned + phases["read"] + phases["render"] + phases["output"]
+        for phase, seconds in phases.items():
+            best[phase] = min(best.get(phase, seconds), seconds)
+        result = {
+            "stats": dict(scanner.stats),
+            "syscalls": dict(scanner.syscalls.counts),
+            "chars_read": chars_read,
+            "snapshot_chars": snapshot_chars,
+        }
+        cache.close()
+    cache_path.unlink(missing_ok=True)
+
+    result["phases"] = {phase: round(seconds, 6) for phase, seconds in best.items()}
+    result["peak_rss_bytes"] = peak_rss_bytes()
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark scanner.py on synthetic trees.")
+    parser.add_argument(
+        "--cases",
+        default="1k,10k",
+        help=f"Comma-separated presets ({', '.join(PRESETS)}) or file counts.",
+    )
+    parser.add_argument("--jobs", type=int, default=1, help="Scanner worker threads.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case (best time is kept).")
+    parser.add_argument(
+        "--binary-ratio", type=float, default=0.1, help="Share of files with binary content."
+    )
+    parser.add_argument(
+        "--ignored-ratio",
+        type=float,
+        default=0.15,
+        help="Share of files placed in ignored directories (node_modules, .git, dist).",
+    )
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the generated trees.")
+    parser.add_argument(
+        "--dir",
+        type=Path,
+        default=None,
+        help="Where to generate the trees (defaults to /dev/shm, else the temp directory).",
+    )
+    parser.add_argument("--keep", action="store_true", help="Keep the generated trees.")
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        help="Write the JSON results here (defaults to stdout).",
+    )
+    parser.add_argument("--run-case", type=Path, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case is not None:
+        json.dump(run_case(args.run_case, args.jobs, args.repeat), sys.stdout)
+        return 0
+
+    base = Path(tempfile.mkdtemp(prefix="bench-scanner-", dir=args.dir or default_base_dir()))
+    results = {
+        "version": 1,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "base_dir": str(base.parent),
+        "jobs": args.jobs,
+        "repeat": args.repeat,
+        "cases": [],
+    }
+    try:
+        for name in args.cases.split(","):
+            files, depth = PRESETS[name] if name in PRESETS else (int(name), 10)
+            root = base / f"tree-{name}"
+            start = time.perf_counter()
+            tree = generate_tree(root, files, depth, args.binary_ratio, args.ignored_ratio, args.seed)
+            generated = time.perf_counter() - start
+
+            child = subprocess.run(
+                [sys.executable, __file__, "--run-case", str(root),
+                 "--jobs", str(args.jobs), "--repeat", str(args.repeat)],
+                check=True,
+                capture_output=True,
+                text=True,
+            )
+            case = {"name": name, "depth": depth, "tree": tree, **json.loads(child.stdout)}
+            results["cases"].append(case)
+
+            phases = "  ".join(f"{phase} {seconds:.3f}s" for phase, seconds in case["phases"].items())
+            print(
+                f"{name:>6}: {phases}  peak RSS {case['peak_rss_bytes'] / 2**20:.1f} MB"
+                f"  (generated in {generated:.1f}s)",
+                file=sys.stderr,
+            )
+            if not args.keep:
+                shutil.rmtree(root)
+    finally:
+        if not args.keep:
+            shutil.rmtree(base, ignore_errors=True)
+
+    text = json.dumps(results, indent=2) + "\n"
+    if args.output is None:
+        sys.stdout.write(text)
+    else:
+        Path(args.output).write_text(text, encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,87 +2,959 @@
 """
 Clean a green-screen sprite sheet and output a transparent PNG.
 
-- Detects green background by chroma key thresholds
+- Detects green background by chroma key thresholds (or by distance from a
+  key colour in HSV or YCbCr), looked up in a precompiled per-colour table,
   and keeps only the regions connected to the image edges.
 - Applies a small green "despill" on edge pixels to reduce halos.
+- Batch mode (several inputs, directories or globs) cleans many sheets in a
+  process pool, skipping those unchanged since the last run.
+- Banded mode (--band-rows) streams huge sheets through in strips of rows,
+  so memory stays bounded by the strip size rather than the sheet size.
 """
 
 from __future__ import annotations
 
 import argparse
-from collections import deque
+import functools
+import glob
+import hashlib
+import io
+import json
+import os
+import struct
+import tempfile
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+from typing import Iterator, NamedTuple
 
 import numpy as np
 from PIL import Image
 
+# (g_min, delta, ratio) of each --mode unless given explicitly
+MODE_DEFAULTS: dict[str, tuple[int, int, float]] = {
+    "all-green": (1, 0, 1.0),
+    "background": (120, 40, 1.25),
+}
+
+KEY_SPACES = ("rgb", "hsv", "ycbcr")
+DEFAULT_KEY_COLOR = "00ff00"
+# --tolerance of each --key-space unless given: hue degrees for hsv, CbCr distance for ycbcr
+KEY_TOLERANCE_DEFAULTS: dict[str, float] = {"rgb": 0.0, "hsv": 30.0, "ycbcr": 40.0}
+HSV_MIN_SATURATION = 0.25
+HSV_MIN_VALUE = 0.25
+# Key tables: one bit per colour (2**24 of them, 2 MB), indexed by R | G << 8 | B << 16 (an
+# RGBA pixel read as a little-endian uint32, alpha masked off), applied this many pixels at a time
+KEY_TABLE_BYTES = 1 << 21
+KEY_CHUNK_PIXELS = 1 << 16
+# Bump when a change to the keying itself should invalidate the tables cached on disk
+KEY_TABLE_VERSION = 1
+
+# Cleaned when run without arguments
+DEFAULT_INPUT = "public/assets/sprites/feka.png"
+DEFAULT_OUTPUT = "public/assets/sprites/feka_clean.png"
+
+# Batch mode: outputs are named <stem><suffix>.png next to their input (or under --out-dir)
+DEFAULT_SUFFIX = "_clean"
+MANIFEST_NAME = ".clean_sprite_manifest.json"
+MANIFEST_VERSION = 1
+# Bump when a change to the cleaning itself should invalidate every cached output
+PARAMS_VERSION = 2
+
+# Banded mode writes its PNG itself, a strip at a time, at this zlib level (Pillow's default)
+PNG_COMPRESS_LEVEL = 6
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# ...and reads PNG inputs a strip at a time, inflating at most this many bytes at once
+PNG_READ_BYTES = 1 << 16
+# Channels of each PNG colour type, and the 8-bit colour type with each number of bytes a pixel
+PNG_CHANNELS: dict[int, int] = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+PNG_RAW_COLOR_TYPES: dict[int, int] = {1: 0, 2: 4, 3: 2, 4: 6}
+
+
+def spill_channels(rgb: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """max(R, B) (uint8) and the green margin G - max(R, B) (int16) of every pixel."""
+    max_rb = np.maximum(rgb[..., 0], rgb[..., 2])
+    margin = rgb[..., 1].astype(np.int16)
+    margin -= max_rb
+    return max_rb, margin
+
 
 def build_green_mask(rgb: np.ndarray, g_min: int, delta: int, ratio: float) -> np.ndarray:
-    r = rgb[..., 0].astype(np.int16)
-    g = rgb[..., 1].astype(np.int16)
-    b = rgb[..., 2].astype(np.int16)
-    max_rb = np.maximum(r, b)
-    return (g >= g_min) & ((g - max_rb) >= delta) & (g >= (max_rb * ratio))
+    max_rb, margin = spill_channels(rgb)
+    g = rgb[..., 1]
+    return (g >= np.int16(g_min)) & (margin >= delta) & (g >= (max_rb * ratio))
+
+
+class KeySpec(NamedTuple):
+    """Everything that decides which colours are keyed out; one key table per KeySpec."""
+
+    space: str
+    g_min: int
+    delta: int
+    ratio: float
+    color: str
+    tolerance: float
+
+
+def hsv_of(rgb: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Hue (degrees), saturation and value (0-1) of every pixel."""
+    r, g, b = (rgb[..., i] / np.float32(255) for i in range(3))
+    value = np.maximum(np.maximum(r, g), b)
+    chroma = value - np.minimum(np.minimum(r, g), b)
+    saturation = np.divide(chroma, value, out=np.zeros_like(value), where=value > 0)
+    chroma[chroma == 0] = 1  # grey: any hue, saturation is 0
+    hue = np.where(value == g, 2 + (b - r) / chroma, 4 + (r - g) / chroma)
+    hue = np.where(value == r, (g - b) / chroma, hue)
+    return (hue * 60) % 360, saturation, value
+
+
+def ycbcr_chroma(rgb: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Cb and Cr (BT.601, full range) of every pixel."""
+    r, g, b = (rgb[..., i].astype(np.float32) for i in range(3))
+    return 128 - 0.168736 * r - 0.331264 * g + 0.5 * b, 128 + 0.5 * r - 0.418688 * g - 0.081312 * b
+
+
+def evaluate_key(rgb: np.ndarray, spec: KeySpec) -> np.ndarray:
+    """Pixels keyed out under spec, worked out per pixel (key tables are compiled from this)."""
+    if spec.space == "rgb":
+        return build_green_mask(rgb, spec.g_min, spec.delta, spec.ratio)
+    key = np.frombuffer(bytes.fromhex(spec.color), dtype=np.uint8).reshape(1, 3)
+    if spec.space == "hsv":
+        hue, saturation, value = hsv_of(rgb)
+        distance = np.abs(hue - hsv_of(key)[0][0])
+        distance = np.minimum(distance, 360 - distance)
+        return (
+            (saturation >= HSV_MIN_SATURATION)
+            & (value >= HSV_MIN_VALUE)
+            & (distance <= spec.tolerance)
+        )
+    cb, cr = ycbcr_chroma(rgb)
+    key_cb, key_cr = ycbcr_chroma(key)
+    return np.hypot(cb - key_cb[0], cr - key_cr[0]) <= spec.tolerance
+
+
+def compile_key_table(spec: KeySpec) -> np.ndarray:
+    """evaluate_key on all 2**24 colours, packed into a bitset (bit i of byte n is colour 8n+i)."""
+    colors = np.empty((1 << 16, 3), dtype=np.uint8)
+    colors[:, 0] = np.arange(1 << 16) & 0xFF
+    colors[:, 1] = np.arange(1 << 16) >> 8
+    table = np.empty(KEY_TABLE_BYTES, dtype=np.uint8)
+    for blue in range(256):
+        colors[:, 2] = blue
+        keyed = evaluate_key(colors, spec)
+        table[blue << 13 : (blue + 1) << 13] = np.packbits(keyed, bitorder="little")
+    return table
+
+
+def key_table_dir() -> Path:
+    xdg = os.environ.get("XDG_CACHE_HOME")
+    base = Path(xdg) if xdg else Path.home() / ".cache"
+    return base / "clean_sprite"
 
 
-def flood_fill_from_edges(mask: np.ndarray) -> np.ndarray:
+@functools.lru_cache(maxsize=8)
+def key_table(spec: KeySpec) -> np.ndarray:
+    """spec's key table: already loaded, cached on disk by an earlier run, or compiled now."""
+    digest = hashlib.sha256(json.dumps([KEY_TABLE_VERSION, *spec]).encode()).hexdigest()[:24]
+    path = key_table_dir() / f"key-{spec.space}-{digest}.bits"
+    try:
+        table = np.fromfile(path, dtype=np.uint8)
+    except OSError:
+        table = None
+    if table is None or table.size != KEY_TABLE_BYTES:
+        table = compile_key_table(spec)
+        # Written atomically: batch workers may compile the same table at once
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            table.tofile(tmp)
+            os.replace(tmp, path)
+        except OSError:
+            pass  # an unwritable cache only costs the next run a compile
+    table.flags.writeable = False
+    return table
+
+
+def apply_key_table(pixels: np.ndarray, table: np.ndarray) -> np.ndarray:
+    """
+    Look every pixel (RGB or RGBA) up in a key table. Works through
+    KEY_CHUNK_PIXELS at a time with reused buffers, so the index arithmetic
+    stays in cache instead of making full-size passes.
+    """
+    flat = np.ascontiguousarray(pixels).reshape(-1, pixels.shape[-1])
+    keyed = np.empty(len(flat), dtype=bool)
+    index = np.empty(KEY_CHUNK_PIXELS, dtype=np.uint32)
+    bit = np.empty(KEY_CHUNK_PIXELS, dtype=np.uint8)
+    found = np.empty(KEY_CHUNK_PIXELS, dtype=np.uint8)
+    for start in range(0, len(flat), KEY_CHUNK_PIXELS):
+        chunk = flat[start : start + KEY_CHUNK_PIXELS]
+        n = len(chunk)
+        if flat.shape[1] == 4:
+            np.bitwise_and(chunk.view("<u4")[:, 0], 0xFFFFFF, out=index[:n])
+        else:
+            # Each pixel's bytes plus the next pixel's first, read as one (unaligned) word;
+            # the very last pixel has no next one
+            words = min(n, len(flat) - start - 1)
+            unaligned = np.ndarray((words,), "<u4", buffer=flat, offset=start * 3, strides=(3,))
+            np.bitwise_and(unaligned, 0xFFFFFF, out=index[:words])
+            if words < n:
+                r, g, b = (int(v) for v in chunk[-1])
+                index[n - 1] = r | g << 8 | b << 16
+        np.bitwise_and(index[:n], 7, out=bit[:n], casting="unsafe")
+        index[:n] >>= 3
+        np.take(table, index[:n], out=found[:n])
+        found[:n] >>= bit[:n]
+        np.bitwise_and(found[:n], 1, out=keyed[start : start + n].view(np.uint8))
+    return keyed.reshape(pixels.shape[:-1])
+
+
+def mask_runs(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Horizontal runs of True pixels as (rows, starts, ends), ends exclusive, in raster order."""
     h, w = mask.shape
-    bg = np.zeros_like(mask, dtype=bool)
-    q: deque[tuple[int, int]] = deque()
+    padded = np.zeros((h, w + 2), dtype=bool)
+    padded[:, 1:-1] = mask
+    flat = padded.ravel()
+    # Every row is padded with False on both sides, so its transitions alternate start, end
+    transitions = np.flatnonzero(flat[1:] != flat[:-1])
+    rows = transitions[0::2] // (w + 2)
+    return rows, transitions[0::2] - rows * (w + 2), transitions[1::2] - rows * (w + 2)
+
+
+def touching_runs(
+    rows: np.ndarray, starts: np.ndarray, ends: np.ndarray, width: int, connectivity: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """Pairs (i, j) of runs in consecutive rows that touch (share an edge, or a corner with 8)."""
+    stride = width + 1
+    start_keys = rows * stride + starts
+    end_keys = rows * stride + ends
+    reach = 1 if connectivity == 8 else 0
+    # Runs of the next row that overlap run i form one contiguous range of the sorted runs
+    lo = np.searchsorted(end_keys, (rows + 1) * stride + starts - reach, side="right")
+    hi = np.searchsorted(start_keys, (rows + 1) * stride + ends + reach, side="left")
+    counts = np.maximum(hi - lo, 0)
+    first = np.repeat(np.arange(len(rows)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return first, np.repeat(lo, counts) + offsets
+
+
+def label_runs(count: int, first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """Component label (the smallest run index in it) of each run, given the touching pairs."""
+    labels = np.arange(count)
+    while True:
+        a, b = labels[first], labels[second]
+        if np.array_equal(a, b):
+            return labels
+        # Hook the larger root of every pair under the smaller, then flatten the trees
+        low = np.minimum(a, b)
+        np.minimum.at(labels, a, low)
+        np.minimum.at(labels, b, low)
+        while True:
+            parents = labels[labels]
+            if np.array_equal(parents, labels):
+                break
+            labels = parents
+
+
+def run_pixels(width: int, rows: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Flat indices of every pixel of the given runs."""
+    lengths = ends - starts
+    first = rows * width + starts - (np.cumsum(lengths) - lengths)
+    return np.repeat(first, lengths) + np.arange(lengths.sum())
+
+
+def edge_connected_runs(
+    rows: np.ndarray, starts: np.ndarray, ends: np.ndarray, height: int, width: int,
+    connectivity: int,
+) -> np.ndarray:
+    """
+    Which runs belong to a component with a run on the image border: runs in
+    consecutive rows that touch are joined into components.
+    """
+    labels = label_runs(len(rows), *touching_runs(rows, starts, ends, width, connectivity))
+    on_border = (rows == 0) | (rows == height - 1) | (starts == 0) | (ends == width)
+    return np.isin(labels, labels[on_border])
+
+
+def flood_fill_from_edges(mask: np.ndarray, connectivity: int = 4) -> np.ndarray:
+    """
+    The pixels of mask connected to the image border through mask, with
+    4- or 8-connectivity.
+
+    Works on horizontal runs instead of pixels (see edge_connected_runs).
+    """
+    h, w = mask.shape
+    rows, starts, ends = mask_runs(mask)
+    if len(rows) == 0:
+        return np.zeros_like(mask, dtype=bool)
+    keep = edge_connected_runs(rows, starts, ends, h, w, connectivity)
+    # Paint whichever is smaller: the kept runs, or the mask minus the others
+    lengths = ends - starts
+    if lengths[keep].sum() <= lengths[~keep].sum():
+        background = np.zeros(mask.shape, dtype=bool)
+        background.flat[run_pixels(w, rows[keep], starts[keep], ends[keep])] = True
+    else:
+        background = np.array(mask, dtype=bool)
+        background.flat[run_pixels(w, rows[~keep], starts[~keep], ends[~keep])] = False
+    return background
+
+
+def grow_mask(
+    mask: np.ndarray, radius: int, out: np.ndarray | None = None, scratch: np.ndarray | None = None
+) -> np.ndarray:
+    """
+    mask grown by radius 4-connected steps (every pixel within that Manhattan
+    distance), into out. Each step ORs in slices of the step before, so nothing
+    wraps around the borders and no padded copy is made; scratch holds every
+    other step when radius > 1. Either buffer is allocated if not given.
+    """
+    if out is None:
+        out = np.empty(mask.shape, dtype=bool)
+    if radius > 1 and scratch is None:
+        scratch = np.empty_like(out)
+    if radius == 0:
+        np.copyto(out, mask)
+    source = mask
+    for step in range(radius):
+        # Alternate between the buffers so that the last step lands in out
+        grown = out if (radius - step) % 2 else scratch
+        np.copyto(grown, source)
+        np.logical_or(grown[1:], source[:-1], out=grown[1:])
+        np.logical_or(grown[:-1], source[1:], out=grown[:-1])
+        np.logical_or(grown[:, 1:], source[:, :-1], out=grown[:, 1:])
+        np.logical_or(grown[:, :-1], source[:, 1:], out=grown[:, :-1])
+        source = grown
+    return out
 
-    def push(y: int, x: int) -> None:
-        if 0 <= y < h and 0 <= x < w and mask[y, x] and not bg[y, x]:
-            bg[y, x] = True
-            q.append((y, x))
 
-    for x in range(w):
-        push(0, x)
-        push(h - 1, x)
-    for y in range(h):
-        push(y, 0)
-        push(y, w - 1)
+def despill_edges(
+    rgba: np.ndarray,
+    background: np.ndarray,
+    radius: int = 1,
+    strength: float = 1.0,
+    top: int = 0,
+    buffers: np.ndarray | None = None,
+) -> None:
+    """
+    Pull G toward max(R, B) on foreground pixels within radius of the
+    background, by strength (1 removes all the green excess). background may
+    extend past rgba by halo rows when rgba is a strip: rgba's rows are
+    background[top:]. Only the pixels near the background are read.
+
+    buffers, a (1 or 2, rows, width) bool array with at least background's
+    rows, holds the grown mask (see grow_mask) so callers can reuse it across
+    images or strips; it is allocated if not given.
+    """
+    rows = slice(top, top + len(rgba))
+    out = scratch = None
+    if buffers is not None:
+        out = buffers[0, : len(background)]
+        if len(buffers) > 1:
+            scratch = buffers[1, : len(background)]
+    near = grow_mask(background, radius, out, scratch)[rows]
+    np.greater(near, background[rows], out=near)  # and not background itself
+    index = np.flatnonzero(near)
+    candidates = np.stack([rgba[..., c].flat[index] for c in range(3)], axis=-1)
+    max_rb, margin = spill_channels(candidates)
+    spill = margin > 0
+    index, max_rb, margin = index[spill], max_rb[spill], margin[spill]
+    green = rgba[..., 1]
+    if strength >= 1:
+        green.flat[index] = max_rb
+    else:
+        green.flat[index] = green.flat[index] - np.rint(margin * strength).astype(np.uint8)
 
-    while q:
-        y, x = q.popleft()
-        push(y - 1, x)
-        push(y + 1, x)
-        push(y, x - 1)
-        push(y, x + 1)
 
-    return bg
+class CleanParams(NamedTuple):
+    """Everything that decides the cleaned output of an input image."""
 
+    mode: str
+    g_min: int
+    delta: int
+    ratio: float
+    key_space: str
+    key_color: str
+    tolerance: float
+    connectivity: int
+    despill: bool
+    despill_radius: int
+    despill_strength: float
 
-def despill_edges(rgba: np.ndarray, background: np.ndarray) -> None:
-    r = rgba[..., 0].astype(np.int16)
-    g = rgba[..., 1].astype(np.int16)
-    b = rgba[..., 2].astype(np.int16)
 
-    neighbor_bg = (
-        np.roll(background, 1, axis=0)
-        | np.roll(background, -1, axis=0)
-        | np.roll(background, 1, axis=1)
-        | np.roll(background, -1, axis=1)
+def resolve_params(args: argparse.Namespace) -> CleanParams:
+    """Fill in the per-mode defaults of the keying thresholds."""
+    g_min, delta, ratio = MODE_DEFAULTS[args.mode]
+    tolerance = KEY_TOLERANCE_DEFAULTS[args.key_space]
+    return CleanParams(
+        mode=args.mode,
+        g_min=g_min if args.g_min is None else args.g_min,
+        delta=delta if args.delta is None else args.delta,
+        ratio=ratio if args.ratio is None else args.ratio,
+        key_space=args.key_space,
+        key_color=args.key_color.lower().lstrip("#"),
+        tolerance=tolerance if args.tolerance is None else args.tolerance,
+        connectivity=args.connectivity,
+        despill=not args.no_despill,
+        despill_radius=args.despill_radius,
+        despill_strength=args.despill_strength,
     )
-    edge = (~background) & neighbor_bg
 
-    max_rb = np.maximum(r, b)
-    spill = edge & (g > max_rb)
-    rgba[..., 1][spill] = max_rb[spill].astype(np.uint8)
+
+def key_mask(pixels: np.ndarray, params: CleanParams) -> np.ndarray:
+    """Pixels (RGB or RGBA) keyed out, through the key table of params."""
+    # Only what the key space uses goes into the spec, so equal keys share a table
+    if params.key_space == "rgb":
+        spec = KeySpec("rgb", params.g_min, params.delta, params.ratio, "", 0.0)
+    else:
+        spec = KeySpec(params.key_space, 0, 0, 0.0, params.key_color, params.tolerance)
+    return apply_key_table(pixels, key_table(spec))
+
+
+def clean_image(
+    in_path: Path, out_path: Path, params: CleanParams, band_rows: int | None = None
+) -> tuple[int, int]:
+    """
+    Clean one sprite sheet into out_path; returns (removed, total) pixels.
+    With band_rows the sheet is streamed through in strips (clean_image_banded).
+    """
+    if band_rows:
+        return clean_image_banded(in_path, out_path, params, band_rows)
+    img = Image.open(in_path).convert("RGBA")
+    rgba = np.array(img)
+
+    keyed = key_mask(rgba, params)
+    if params.mode == "all-green":
+        background = keyed
+    else:
+        background = flood_fill_from_edges(keyed, params.connectivity)
+
+    rgba[..., 3][background] = 0
+    if params.despill:
+        # The key mask is spent once the background is filled from it: grow into its memory
+        buffers = keyed[np.newaxis] if background is not keyed else None
+        despill_edges(rgba, background, params.despill_radius, params.despill_strength, 0, buffers)
+
+    Image.fromarray(rgba, mode="RGBA").save(out_path)
+    return int(background.sum()), rgba.shape[0] * rgba.shape[1]
+
+
+class PixelFile(NamedTuple):
+    """Raw (height, width, channels) uint8 pixels in a file, starting at offset."""
+
+    path: Path
+    offset: int
+    height: int
+    width: int
+    channels: int
+
+    def read(self, y0: int, y1: int) -> np.ndarray:
+        """Rows y0:y1, read with a positioned read (so nothing else stays resident)."""
+        row = self.width * self.channels
+        count = (y1 - y0) * row
+        data = np.fromfile(self.path, dtype=np.uint8, count=count, offset=self.offset + y0 * row)
+        return data.reshape(y1 - y0, self.width, self.channels)
+
+
+def png_chunk(kind: bytes, data: bytes) -> bytes:
+    """One PNG chunk: length, type, data and CRC."""
+    crc = zlib.crc32(data, zlib.crc32(kind))
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", crc)
+
+
+class PngLayout(NamedTuple):
+    """What decoding a PNG a strip at a time needs from the chunks before its first IDAT."""
+
+    width: int
+    height: int
+    ihdr: bytes
+    palette: bytes  # its PLTE and tRNS chunks, as stored (copied into every strip)
+    row_bytes: int  # per row, filter type byte excluded
+    pixel_bytes: int  # the byte distance that filters look back by
+    idat: int  # file offset of the first IDAT chunk
+
+
+def png_layout(in_path: Path) -> PngLayout | None:
+    """
+    in_path's layout if it is a PNG that png_strips can decode: not interlaced,
+    with filters looking back 1 to 4 bytes (any colour type at up to 8 bits a
+    channel, or 16-bit grey with or without alpha). None otherwise.
+    """
+    with open(in_path, "rb") as f:
+        if f.read(len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+            return None
+        ihdr, palette = b"", b""
+        while True:
+            head = f.read(8)
+            if len(head) < 8:
+                return None
+            length, kind = struct.unpack(">I4s", head)
+            if kind == b"IDAT":
+                idat = f.tell() - 8
+                break
+            data = f.read(length)
+            f.seek(4, os.SEEK_CUR)  # CRC
+            if kind == b"IHDR":
+                ihdr = data
+            elif kind in (b"PLTE", b"tRNS"):
+                palette += png_chunk(kind, data)
+    if len(ihdr) != 13:
+        return None
+    width, height, depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", ihdr)
+    channels = PNG_CHANNELS.get(color_type)
+    if channels is None or interlace:
+        return None
+    pixel_bytes = max(1, channels * depth // 8)
+    if pixel_bytes not in PNG_RAW_COLOR_TYPES:
+        return None
+    row_bytes = (width * channels * depth + 7) // 8
+    return PngLayout(width, height, ihdr, palette, row_bytes, pixel_bytes, idat)
+
+
+def png_data(in_path: Path, idat: int) -> Iterator[bytes]:
+    """The inflated image data of a PNG, from its IDAT chunks on, PNG_READ_BYTES at a time."""
+    inflate = zlib.decompressobj()
+    with open(in_path, "rb") as f:
+        f.seek(idat)
+        while True:
+            head = f.read(8)
+            if len(head) < 8:
+                return
+            length, kind = struct.unpack(">I4s", head)
+            if kind == b"IEND":
+                return
+            if kind != b"IDAT":
+                f.seek(length + 4, os.SEEK_CUR)
+                continue
+            while length:
+                pending = f.read(min(PNG_READ_BYTES, length))
+                if not pending:
+                    return
+                length -= len(pending)
+                while True:
+                    data = inflate.decompress(pending, PNG_READ_BYTES)
+                    if not data:
+                        break
+                    yield data
+                    pending = inflate.unconsumed_tail
+            f.seek(4, os.SEEK_CUR)  # CRC
+
+
+def decode_png(ihdr: bytes, palette: bytes, lines: bytes) -> Image.Image:
+    """Pillow's decoding of a PNG made of these chunks and the (filtered) lines."""
+    data = b"".join(
+        (
+            PNG_SIGNATURE,
+            png_chunk(b"IHDR", ihdr),
+            palette,
+            png_chunk(b"IDAT", zlib.compress(lines, 0)),
+            png_chunk(b"IEND", b""),
+        )
+    )
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    return img
+
+
+def png_strips(in_path: Path, layout: PngLayout, band_rows: int) -> Iterator[Image.Image]:
+    """
+    in_path decoded band_rows rows at a time, as Pillow would decode them.
+
+    Each strip's filtered rows are unfiltered by Pillow as a PNG of plain bytes
+    whose first row is the last unfiltered row of the strip before (the one the
+    filters of the strip's first row look back at), then decoded again as
+    unfiltered rows with the original colour type, depth and palette.
+    """
+    stride = layout.row_bytes + 1
+    raw_width = layout.row_bytes // layout.pixel_bytes
+    raw_type = PNG_RAW_COLOR_TYPES[layout.pixel_bytes]
+    previous = bytes(layout.row_bytes)
+    pending = bytearray()
+    data = png_data(in_path, layout.idat)
+    for y0 in range(0, layout.height, band_rows):
+        n = min(band_rows, layout.height - y0)
+        while len(pending) < n * stride:
+            piece = next(data, None)
+            if piece is None:
+                raise ValueError(f"{in_path}: image data ends after row {y0}")
+            pending += piece
+        filtered = bytes(pending[: n * stride])
+        del pending[: n * stride]
+        raw_ihdr = struct.pack(">IIBBBBB", raw_width, n + 1, 8, raw_type, 0, 0, 0)
+        raw = decode_png(raw_ihdr, b"", b"\0" + previous + filtered).tobytes()
+        lines = np.zeros((n, stride), dtype=np.uint8)
+        lines[:, 1:] = np.frombuffer(raw, dtype=np.uint8, offset=layout.row_bytes).reshape(n, -1)
+        previous = raw[-layout.row_bytes :]
+        yield decode_png(struct.pack(">II", layout.width, n) + layout.ihdr[8:], layout.palette,
+                         lines.tobytes())
+
+
+def open_pixels(in_path: Path, scratch: Path, band_rows: int) -> PixelFile:
+    """
+    The pixels of an image as a PixelFile that strips can be read from. A .npy
+    input (3 or 4 channels) is read in place; a PNG is decoded a strip at a
+    time (see png_strips) and spilled to the scratch file as RGBA. Anything
+    else (and interlaced or 16-bit colour PNGs) is decoded by Pillow as a
+    whole first, so memory is only bounded for .npy and PNG inputs.
+    """
+    if in_path.suffix.lower() == ".npy":
+        with open(in_path, "rb") as f:
+            if np.lib.format.read_magic(f) == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            offset = f.tell()
+        if dtype != np.uint8 or fortran_order or len(shape) != 3 or shape[2] not in (3, 4):
+            raise ValueError(f"{in_path}: expected a (height, width, 3 or 4) uint8 array")
+        return PixelFile(in_path, offset, *shape)
+    layout = png_layout(in_path)
+    if layout is not None:
+        with open(scratch, "wb") as f:
+            for strip in png_strips(in_path, layout, band_rows):
+                f.write(strip.convert("RGBA").tobytes())
+        return PixelFile(scratch, 0, layout.height, layout.width, 4)
+    with Image.open(in_path) as img, open(scratch, "wb") as f:
+        w, h = img.size
+        for y0 in range(0, h, band_rows):
+            f.write(img.crop((0, y0, w, min(h, y0 + band_rows))).convert("RGBA").tobytes())
+    return PixelFile(scratch, 0, h, w, 4)
+
+
+class NpyStripWriter:
+    """Write an (height, width, 4) uint8 .npy file a strip of rows at a time."""
+
+    def __init__(self, path: Path, width: int, height: int):
+        self._file = open(path, "wb")
+        header = {"descr": "|u1", "fortran_order": False, "shape": (height, width, 4)}
+        np.lib.format.write_array_header_1_0(self._file, header)
+
+    def write(self, rgba: np.ndarray) -> None:
+        """Append the rows of an (n, width, 4) uint8 strip."""
+        self._file.write(np.ascontiguousarray(rgba).tobytes())
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class PngStripWriter:
+    """
+    Write an RGBA PNG a strip of rows at a time: rows are filtered (None, Sub
+    or Up, whichever has the smallest sum of signed bytes) and deflated as a
+    stream, so only one strip is ever in memory.
+    """
+
+    def __init__(self, path: Path, width: int, height: int, level: int = PNG_COMPRESS_LEVEL):
+        self._file = open(path, "wb")
+        self._file.write(PNG_SIGNATURE)
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+        self._deflate = zlib.compressobj(level)
+        self._previous = np.zeros(width * 4, dtype=np.uint8)
+
+    def _chunk(self, kind: bytes, data: bytes) -> None:
+        self._file.write(png_chunk(kind, data))
+
+    def write(self, rgba: np.ndarray) -> None:
+        """Append the rows of an (n, width, 4) uint8 strip."""
+        raw = np.ascontiguousarray(rgba).reshape(len(rgba), -1)
+        sub = raw.copy()
+        sub[:, 4:] -= raw[:, :-4]
+        up = raw.copy()
+        up[0] -= self._previous
+        up[1:] -= raw[:-1]
+        costs = [np.abs(f.view(np.int8), dtype=np.int16).sum(axis=1) for f in (raw, sub, up)]
+        choice = np.argmin(costs, axis=0).astype(np.uint8)
+        lines = np.empty((len(raw), raw.shape[1] + 1), dtype=np.uint8)
+        lines[:, 0] = choice
+        for kind, filtered in enumerate((raw, sub, up)):
+            lines[choice == kind, 1:] = filtered[choice == kind]
+        self._previous = raw[-1].copy()
+        data = self._deflate.compress(lines.tobytes())
+        if data:
+            self._chunk(b"IDAT", data)
+
+    def close(self) -> None:
+        self._chunk(b"IDAT", self._deflate.flush())
+        self._chunk(b"IEND", b"")
+        self._file.close()
+
+
+def clean_image_banded(
+    in_path: Path, out_path: Path, params: CleanParams, band_rows: int
+) -> tuple[int, int]:
+    """
+    clean_image in strips of band_rows rows, with the same output. Memory is
+    bounded by the strip size, plus the runs of keyed pixels in background
+    mode and, for inputs other than .npy and PNG (see open_pixels), Pillow's
+    decoded copy while it is spilled to a raw scratch file. A .npy output is
+    written as raw rows too.
+
+    In background mode, a first pass collects the runs of the key mask strip
+    by strip; run labelling then resolves the edge-connected background across
+    strip boundaries as it does for a whole image. The second pass repaints the
+    background of each strip plus a halo of despill_radius rows (those despill
+    looks at) and writes the strip out.
+    """
+    fd, scratch_name = tempfile.mkstemp(suffix=".rgba", dir=out_path.parent)
+    os.close(fd)
+    scratch = Path(scratch_name)
+    try:
+        pixels = open_pixels(in_path, scratch, band_rows)
+        h, w, channels = pixels.height, pixels.width, pixels.channels
+
+        def keyed_rows(y0: int, y1: int) -> np.ndarray:
+            return key_mask(pixels.read(y0, y1), params)
+
+        if params.mode == "all-green":
+            background_rows = keyed_rows
+        else:
+            found = []
+            for y0 in range(0, h, band_rows):
+                rows, starts, ends = mask_runs(keyed_rows(y0, min(h, y0 + band_rows)))
+                found.append((rows + y0, starts, ends))
+            rows, starts, ends = (np.concatenate(parts) for parts in zip(*found))
+            keep = edge_connected_runs(rows, starts, ends, h, w, params.connectivity)
+            rows, starts, ends = rows[keep], starts[keep], ends[keep]
+
+            def background_rows(y0: int, y1: int) -> np.ndarray:
+                i0, i1 = np.searchsorted(rows, [y0, y1])
+                background = np.zeros((y1 - y0, w), dtype=bool)
+                background.flat[run_pixels(w, rows[i0:i1] - y0, starts[i0:i1], ends[i0:i1])] = True
+                return background
+
+        writer_class = NpyStripWriter if out_path.suffix.lower() == ".npy" else PngStripWriter
+        writer = writer_class(out_path, w, h)
+        halo = params.despill_radius if params.despill else 0
+        # One set of despill buffers, sized for the tallest strip plus its halos, serves every strip
+        buffers = None
+        if params.despill:
+            depth = 2 if params.despill_radius > 1 else 1
+            buffers = np.empty((depth, min(h, band_rows + 2 * halo), w), dtype=bool)
+        removed = 0
+        for y0 in range(0, h, band_rows):
+            y1 = min(h, y0 + band_rows)
+            top = y0 - max(0, y0 - halo)
+            background = background_rows(y0 - top, min(h, y1 + halo))
+            core = background[top : top + y1 - y0]
+            rgba = np.empty((y1 - y0, w, 4), dtype=np.uint8)
+            rgba[..., :channels] = pixels.read(y0, y1)
+            if channels == 3:
+                rgba[..., 3] = 255
+            rgba[..., 3][core] = 0
+            if params.despill:
+                radius, strength = params.despill_radius, params.despill_strength
+                despill_edges(rgba, background, radius, strength, top, buffers)
+            removed += int(core.sum())
+            writer.write(rgba)
+        writer.close()
+        return removed, h * w
+    finally:
+        scratch.unlink(missing_ok=True)
+
+
+def clean_job(
+    in_path: Path, out_path: Path, params: CleanParams, band_rows: int | None = None
+) -> tuple[int, int, float]:
+    """clean_image, timed (runs in a worker process in batch mode)."""
+    start = time.perf_counter()
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    removed, total = clean_image(in_path, out_path, params, band_rows)
+    return removed, total, time.perf_counter() - start
+
+
+def collect_inputs(
+    patterns: list[str], out_dir: Path | None, suffix: str
+) -> list[tuple[Path, Path]]:
+    """
+    (input, output) pairs for the batch: every PNG under the directories,
+    matching the globs, or named. Outputs go next to their input with suffix
+    added, or under out_dir (mirroring the layout below a directory input).
+    Files that already carry the suffix are outputs of an earlier run and are
+    skipped. Raises ValueError when two inputs would be written to the same
+    output (e.g. same-named files from different directories under out_dir).
+    """
+    pairs: dict[Path, Path] = {}
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            found = [(p, p.relative_to(path)) for p in sorted(path.rglob("*.png"))]
+        elif glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+            found = [(Path(p), Path(Path(p).name)) for p in matches]
+        else:
+            found = [(path, Path(path.name))]
+        for in_path, rel in found:
+            if not in_path.is_file() or (suffix and in_path.stem.endswith(suffix)):
+                continue
+            name = rel.with_name(f"{rel.stem}{suffix}{rel.suffix}")
+            pairs.setdefault(in_path, out_dir / name if out_dir else in_path.with_name(name.name))
+    sources: dict[Path, Path] = {}
+    for in_path, out_path in pairs.items():
+        other = sources.setdefault(out_path, in_path)
+        if other != in_path:
+            raise ValueError(f"{other} and {in_path} would both be written to {out_path}")
+    return list(pairs.items())
+
+
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(path: Path) -> dict:
+    try:
+        manifest = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return manifest.get("files", {})
+
+
+def write_manifest(path: Path, files: dict) -> None:
+    """Write the manifest atomically, so an interrupted run never leaves half of one."""
+    tmp = path.with_name(path.name + ".tmp")
+    text = json.dumps({"version": MANIFEST_VERSION, "files": files}, indent=1) + "\n"
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def input_record(in_path: Path, previous: dict | None) -> dict:
+    """Size, mtime and hash of an input (the hash reused while size and mtime match)."""
+    st = in_path.stat()
+    previous = previous or {}
+    if (previous.get("size"), previous.get("mtime_ns")) == (st.st_size, st.st_mtime_ns):
+        digest = previous["hash"]
+    else:
+        digest = file_digest(in_path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": digest}
+
+
+def is_up_to_date(record: dict, previous: dict | None, out_path: Path, params: dict) -> bool:
+    """Whether the previous run cleaned this same input with the same parameters into out_path."""
+    if not previous or previous.get("hash") != record["hash"] or previous.get("params") != params:
+        return False
+    if previous.get("output") != str(out_path):
+        return False
+    # The output must still be the file this run wrote
+    try:
+        st = out_path.stat()
+    except OSError:
+        return False
+    written = (previous.get("output_size"), previous.get("output_mtime_ns"))
+    return written == (st.st_size, st.st_mtime_ns)
+
+
+def run_batch(
+    pairs: list[tuple[Path, Path]],
+    params: CleanParams,
+    jobs: int,
+    manifest_path: Path,
+    force: bool,
+    band_rows: int | None = None,
+) -> int:
+    """Clean every pair not up to date in the manifest, in a process pool; prints the timings."""
+    started = time.perf_counter()
+    previous = {} if force else load_manifest(manifest_path)
+    param_record = dict(params._asdict(), version=PARAMS_VERSION)
+    files: dict[str, dict] = {}
+    todo: list[tuple[Path, Path, str]] = []
+    skipped = failed = 0
+    for in_path, out_path in pairs:
+        key = str(in_path.resolve())
+        try:
+            record = input_record(in_path, previous.get(key))
+        except OSError as e:
+            print(f"  failed   {in_path}: {e}")
+            failed += 1
+            continue
+        if is_up_to_date(record, previous.get(key), out_path, param_record):
+            files[key] = previous[key]
+            skipped += 1
+            print(f"  skipped  {in_path} (unchanged)")
+        else:
+            files[key] = dict(record, params=param_record, output=str(out_path))
+            todo.append((in_path, out_path, key))
+
+    cpu = 0.0
+    cleaned = removed_total = pixels_total = 0
+
+    def finish(in_path: Path, out_path: Path, key: str, result: tuple[int, int, float]) -> None:
+        nonlocal cpu, cleaned, removed_total, pixels_total
+        removed, total, seconds = result
+        cleaned += 1
+        cpu += seconds
+        removed_total += removed
+        pixels_total += total
+        st = out_path.stat()
+        files[key].update(output_size=st.st_size, output_mtime_ns=st.st_mtime_ns)
+        print(
+            f"  cleaned  {in_path} -> {out_path}  {seconds * 1000:.0f} ms"
+            f"  (removed {removed / total:.2%})"
+        )
+
+    def fail(in_path: Path, key: str, error: Exception) -> None:
+        nonlocal failed
+        failed += 1
+        del files[key]
+        print(f"  failed   {in_path}: {error}")
+
+    workers = max(1, min(jobs, len(todo)))
+    # Any failure is that image's alone (a corrupt or oversized file, a worker that died and broke
+    # the pool); the manifest keeps what was cleaned, even when the run is interrupted
+    try:
+        if workers == 1:
+            for in_path, out_path, key in todo:
+                try:
+                    finish(in_path, out_path, key, clean_job(in_path, out_path, params, band_rows))
+                except Exception as e:
+                    fail(in_path, key, e)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(clean_job, in_path, out_path, params, band_rows): (
+                        in_path, out_path, key
+                    )
+                    for in_path, out_path, key in todo
+                }
+                for future in as_completed(futures):
+                    in_path, out_path, key = futures[future]
+                    try:
+                        finish(in_path, out_path, key, future.result())
+                    except Exception as e:
+                        fail(in_path, key, e)
+    finally:
+        try:
+            write_manifest(manifest_path, files)
+        except OSError as e:
+            print(f"Could not write the manifest {manifest_path}: {e}")
+
+    wall = time.perf_counter() - started
+    processes = f"{workers} process" + ("es" if workers > 1 else "")
+    print(
+        f"Cleaned {cleaned}, skipped {skipped}, failed {failed} of {len(pairs)} images "
+        f"in {wall:.2f}s wall ({cpu:.2f}s in workers, {processes})"
+    )
+    if pixels_total:
+        share = removed_total / pixels_total
+        print(f"Removed background pixels: {removed_total} / {pixels_total} ({share:.2%})")
+    return 1 if failed else 0
 
 
 def main() -> int:
-    parser = argparse.ArgumentParser(description="Remove green background from a sprite sheet.")
+    parser = argparse.ArgumentParser(description="Remove green background from sprite sheets.")
     parser.add_argument(
         "input",
-        nargs="?",
-        default="public/assets/sprites/feka.png",
-        help="Path to the input PNG.",
+        nargs="*",
+        default=[DEFAULT_INPUT],
+        help="Input PNG; several, directories or globs clean them all in batch mode.",
     )
     parser.add_argument(
         "-o",
         "--output",
-        default="public/assets/sprites/feka_clean.png",
-        help="Path to write the cleaned PNG.",
+        default=None,
+        help=f"Path to write the cleaned PNG (single input; default: {DEFAULT_OUTPUT}).",
     )
     parser.add_argument("--g-min", type=int, default=None, help="Minimum green channel to key out.")
     parser.add_argument("--delta", type=int, default=None, help="Minimum (G - max(R,B)) to key out.")
@@ -92,46 +964,132 @@ def main() -> int:
         default=None,
         help="Minimum G / max(R,B) ratio to key out.",
     )
+    parser.add_argument(
+        "--key-space",
+        choices=KEY_SPACES,
+        default="rgb",
+        help="Key on the RGB thresholds above, or on the distance from --key-color"
+        " in HSV hue or YCbCr chroma.",
+    )
+    parser.add_argument(
+        "--key-color",
+        default=DEFAULT_KEY_COLOR,
+        metavar="RRGGBB",
+        help=f"Key colour of --key-space hsv/ycbcr (default: {DEFAULT_KEY_COLOR}).",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=None,
+        help="Largest distance from --key-color to key out: hue degrees for hsv"
+        f" (default: {KEY_TOLERANCE_DEFAULTS['hsv']:g}), CbCr distance for ycbcr"
+        f" (default: {KEY_TOLERANCE_DEFAULTS['ycbcr']:g}).",
+    )
     parser.add_argument(
         "--mode",
         choices=("all-green", "background"),
         default="all-green",
         help="Remove all green pixels or only background connected to edges.",
     )
+    parser.add_argument(
+        "--connectivity",
+        type=int,
+        choices=(4, 8),
+        default=4,
+        help="Pixel connectivity of the background in --mode background (8 adds diagonals).",
+    )
     parser.add_argument(
         "--no-despill",
         action="store_true",
         help="Disable green spill suppression on edge pixels.",
     )
+    parser.add_argument(
+        "--despill-radius",
+        type=int,
+        default=1,
+        help="Despill foreground pixels up to this many pixels from the background (default: 1).",
+    )
+    parser.add_argument(
+        "--despill-strength",
+        type=float,
+        default=1.0,
+        help="Share of the green excess over max(R,B) that despill removes, 0-1 (default: 1).",
+    )
+    parser.add_argument(
+        "--band-rows",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Stream each image through in strips of N rows to bound memory on huge sheets"
+        " (same output; .npy inputs and outputs are streamed as raw rows).",
+    )
+    parser.add_argument(
+        "--out-dir",
+        type=Path,
+        default=None,
+        help="Batch mode: write the cleaned images here instead of next to their inputs.",
+    )
+    parser.add_argument(
+        "--suffix",
+        default=DEFAULT_SUFFIX,
+        help=f"Batch mode: added to the name of each output (default: {DEFAULT_SUFFIX}).",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Batch mode: worker processes (default: one per CPU).",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=Path,
+        default=None,
+        help=f"Batch mode: manifest of the last run (default: {MANIFEST_NAME} in --out-dir or .).",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Batch mode: clean every image, even those unchanged since the last run.",
+    )
     args = parser.parse_args()
+    try:
+        if len(bytes.fromhex(args.key_color.lstrip("#"))) != 3:
+            raise ValueError
+    except ValueError:
+        parser.error(f"--key-color must be a RRGGBB hex colour: {args.key_color}")
+    params = resolve_params(args)
+    if args.band_rows is not None and args.band_rows < 1:
+        parser.error("--band-rows must be at least 1")
+    if args.despill_radius < 1:
+        parser.error("--despill-radius must be at least 1")
+    if not 0 <= args.despill_strength <= 1:
+        parser.error("--despill-strength must be between 0 and 1")
 
-    in_path = Path(args.input)
-    out_path = Path(args.output)
-
-    img = Image.open(in_path).convert("RGBA")
-    rgba = np.array(img)
-    rgb = rgba[..., :3]
-
-    if args.mode == "all-green":
-        g_min = 1 if args.g_min is None else args.g_min
-        delta = 0 if args.delta is None else args.delta
-        ratio = 1.0 if args.ratio is None else args.ratio
-        background = build_green_mask(rgb, g_min, delta, ratio)
-    else:
-        g_min = 120 if args.g_min is None else args.g_min
-        delta = 40 if args.delta is None else args.delta
-        ratio = 1.25 if args.ratio is None else args.ratio
-        key_mask = build_green_mask(rgb, g_min, delta, ratio)
-        background = flood_fill_from_edges(key_mask)
-
-    rgba[..., 3][background] = 0
-    if not args.no_despill:
-        despill_edges(rgba, background)
+    batch = (
+        len(args.input) > 1
+        or args.out_dir is not None
+        or any(Path(p).is_dir() or glob.has_magic(p) for p in args.input)
+    )
+    if batch:
+        if args.output is not None:
+            parser.error("-o/--output names a single output; use --out-dir in batch mode")
+        if not args.suffix and args.out_dir is None:
+            parser.error("an empty --suffix needs --out-dir (the outputs would replace the inputs)")
+        try:
+            pairs = collect_inputs(args.input, args.out_dir, args.suffix)
+        except ValueError as e:
+            parser.error(str(e))
+        if not pairs:
+            print("No input images found.")
+            return 1
+        manifest_path = args.manifest or (args.out_dir or Path.cwd()) / MANIFEST_NAME
+        return run_batch(pairs, params, args.jobs, manifest_path, args.force, args.band_rows)
 
-    Image.fromarray(rgba, mode="RGBA").save(out_path)
+    in_path = Path(args.input[0])
+    out_path = Path(args.output or DEFAULT_OUTPUT)
+    removed, total = clean_image(in_path, out_path, params, args.band_rows)
 
-    total = rgba.shape[0] * rgba.shape[1]
-    removed = int(background.sum())
     print(f"Input:  {in_path}")
     print(f"Output: {out_path}")
     print(f"Removed background pixels: {removed} / {total} ({removed / total:.2%})")